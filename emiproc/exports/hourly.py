@@ -11,6 +11,7 @@ import xarray as xr
 
 from emiproc import PROCESS
 from emiproc.exports.netcdf import NetcdfAttributes
+from emiproc.exports.utils import write_netcdf
 from emiproc.grids import RegularGrid
 from emiproc.inventories import Inventory
 from emiproc.profiles.temporal_profiles import create_scaling_factors_time_serie
@@ -157,6 +158,7 @@ def export_hourly_emissions(
     path = Path(path)
     logger.log(PROCESS, f"Exporting hourly emissions to {path}")
 
+    inv_emissions = inv.emissions
     # Iterrate over time
     for dt, row in df_scaling_factors.iterrows():
         ds = base_ds.copy()
@@ -180,11 +182,11 @@ def export_hourly_emissions(
                     scaling_factor = 1.0
                 else:
                     scaling_factor = row[index]
-                if (cat, sub) not in inv.gdf.columns:
+                if (cat, sub) not in inv_emissions:
                     # Ignore non present cat-sub
                     continue
                 # Get the emissions
-                emissions = inv.gdf[(cat, sub)].to_numpy().astype(float)
+                emissions = inv_emissions[(cat, sub)].astype(float)
                 # Multiply by the scaling factor
                 emissions *= scaling_factor * conversion_factor
                 name = var_name_format.format(substance=sub, category=cat)
@@ -207,4 +209,4 @@ def export_hourly_emissions(
         ds.update(vars)
         dt: pd.Timestamp
 
-        ds.to_netcdf(path / f"{dt.strftime(filename_format)}")
+        write_netcdf(ds, path / f"{dt.strftime(filename_format)}")
@@ -9,6 +9,7 @@ import pandas as pd
 import xarray as xr
 import numpy as np
 from emiproc.exports.netcdf import DEFAULT_NC_ATTRIBUTES
+from emiproc.exports.utils import write_netcdf
 from emiproc.grids import ICONGrid
 from emiproc.inventories import Inventory
 from emiproc.profiles.temporal_profiles import (
@@ -116,6 +117,9 @@ def export_icon_oem(
     set as the `country_id` attribute of the output NetCDF file.
 
     :arg inv: The inventory to export.
+        It can be on a subset of the icon grid
+        (see :py:meth:`emiproc.grids.ICONGrid.subset`), the cells outside
+        of the subset get no emissions.
     :arg icon_grid_file: The icon grid file.
     :arg output_dir: The output directory.
     :arg group_dict: If you groupped some categories, you can optionally
@@ -143,23 +147,35 @@ def export_icon_oem(
     time_profiles: dict[str, list[TemporalProfile]] = {}
     vertical_profiles: dict[str, VerticalProfile] = {}
 
+    # The inventory can be on a subset of the icon grid (see ICONGrid.subset)
+    global_cells = getattr(getattr(inv, "grid", None), "global_cells", None)
+    if global_cells is not None and len(global_cells) != len(inv.geometry):
+        global_cells = None
+    if global_cells is not None:
+        # Position of each cell of the icon grid in the subset, -1 outside
+        subset_positions = np.full(ds_out["cell"].size, -1)
+        subset_positions[global_cells] = np.arange(len(global_cells))
+
     # Check that the inventory has the same amount of cells
     # as the icon grid
-    if len(inv.gdf) != ds_out["cell"].size:
+    if global_cells is None and len(inv.geometry) != ds_out["cell"].size:
         raise ValueError(
-            f"The inventory has {len(inv.gdf)} cells, but the icon grid has"
+            f"The inventory has {len(inv.geometry)} cells, but the icon grid has"
             f" {ds_out['cell'].size} cells."
         )
 
-    for categorie, sub in inv._gdf_columns:
+    inv_emissions = inv.emissions
+    for categorie, sub in inv_emissions.columns:
         if substances is not None and sub not in substances:
             continue
         name = f"{categorie}-{sub}"
 
+        values = inv_emissions[(categorie, sub)]
+        if global_cells is not None:
+            # No emissions outside of the subset, chunked values stay lazy
+            values = np.where(subset_positions >= 0, values[subset_positions], 0.0)
         # Convert from kg/year to kg/m2/s
-        emissions = (
-            inv.gdf[(categorie, sub)].to_numpy() / ds_out["cell_area"] / SEC_PER_YR
-        )
+        emissions = values / ds_out["cell_area"] / SEC_PER_YR
 
         attributes = {
             "units": "kg/m2/s",
@@ -243,7 +259,7 @@ def export_icon_oem(
         }
     )
     # Save the emissions
-    ds_out.to_netcdf(output_dir / "oem_gridded_emissions.nc")
+    write_netcdf(ds_out, output_dir / "oem_gridded_emissions.nc")
 
     logger.info(f"Exported inventory to {output_dir}.")
 
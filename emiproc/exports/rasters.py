@@ -7,6 +7,7 @@ from emiproc.inventories import Inventory
 from emiproc.grids import RegularGrid
 from emiproc.regrid import remap_inventory
 from emiproc.exports.netcdf import NetcdfAttributes, nc_cf_attributes
+from emiproc.exports.utils import write_netcdf
 from emiproc.utilities import Units, SEC_PER_YR, PER_CELL_UNITS, PER_M2_UNITS
 
 
@@ -71,17 +72,15 @@ def export_raster_netcdf(
     netcdf_attributes["emiproc_history"] = str(inv.history)
 
     crs = grid.crs
+    # Areas of the cells as (lat, lon)
+    cell_areas = np.array(grid.cell_areas).reshape(grid.shape).T
 
     if unit == Units.KG_PER_YEAR:
         conversion_factor = 1.0
     elif unit == Units.KG_PER_M2_PER_S:
-        conversion_factor = (
-            1 / SEC_PER_YR / np.array(grid.cell_areas).reshape(grid.shape).T
-        )
+        conversion_factor = 1 / SEC_PER_YR / cell_areas
     elif unit == Units.MUG_PER_M2_PER_S:
-        conversion_factor = (
-            1 / SEC_PER_YR / np.array(grid.cell_areas).reshape(grid.shape).T
-        ) * 1e9
+        conversion_factor = (1 / SEC_PER_YR / cell_areas) * 1e9
     else:
         raise NotImplementedError(f"Unknown {unit=}")
 
@@ -89,13 +88,13 @@ def export_raster_netcdf(
     if unit in PER_CELL_UNITS:
         unit_str += " cell-1"
 
+    inv_emissions = inv.emissions
     ds = xr.Dataset(
         data_vars=(
             {
                 var_name_format.format(substance=sub, category=cat): (
                     [lat_name, lon_name],
-                    inv.gdf[(cat, sub)].to_numpy().reshape(grid.shape).T
-                    * conversion_factor,
+                    inv_emissions[(cat, sub)].reshape(grid.shape).T * conversion_factor,
                     {
                         "standard_name": f"{sub}_{cat}",
                         "long_name": f"{sub}_{cat}",
@@ -106,17 +105,17 @@ def export_raster_netcdf(
                 )
                 for sub in inv.substances
                 for cat in inv.categories
-                if (cat, sub) in inv.gdf
+                if (cat, sub) in inv_emissions
             }
             if not group_categories
             else {
                 var_name_format.format(substance=sub): (
                     ["category", lat_name, lon_name],
-                    np.array(
+                    np.stack(
                         [
                             (
-                                inv.gdf[(cat, sub)].to_numpy().reshape(grid.shape).T
-                                if (cat, sub) in inv.gdf
+                                inv_emissions[(cat, sub)].reshape(grid.shape).T
+                                if (cat, sub) in inv_emissions
                                 else np.zeros(grid.shape).T
                             )
                             for cat in inv.categories
@@ -227,20 +226,11 @@ def export_raster_netcdf(
             # Total emission is not weighted by the cell area
             # So we always give kg/year
             if unit == Units.KG_PER_M2_PER_S:
-                total_emission = (
-                    total_emission
-                    * np.array(grid.cell_areas).reshape(grid.shape).T
-                    * SEC_PER_YR
-                )
+                total_emission = total_emission * cell_areas * SEC_PER_YR
             elif unit == Units.KG_PER_YEAR:
                 pass
             elif unit == Units.MUG_PER_M2_PER_S:
-                total_emission = (
-                    total_emission
-                    * np.array(grid.cell_areas).reshape(grid.shape).T
-                    * SEC_PER_YR
-                    * 1e-9
-                )
+                total_emission = total_emission * cell_areas * SEC_PER_YR * 1e-9
             else:
                 raise NotImplementedError(f"Unknown {unit=}")
             ds[f"emi_{sub}_total"] = total_emission.sum([lon_name, lat_name])
@@ -253,7 +243,7 @@ def export_raster_netcdf(
     # add the cell area
     ds["cell_area"] = (
         [lat_name, lon_name],
-        np.array(grid.cell_areas).reshape(grid.shape).T,
+        cell_areas,
         {
             "standard_name": "cell_area",
             "long_name": "cell_area",
@@ -264,6 +254,6 @@ def export_raster_netcdf(
     )
     path = Path(path)
     out_filepath = path.with_suffix(".nc")
-    ds.to_netcdf(out_filepath)
+    write_netcdf(ds, out_filepath)
 
     return out_filepath
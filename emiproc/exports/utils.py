@@ -1,4 +1,15 @@
 from __future__ import annotations
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from functools import partial
+from os import PathLike
+
+import dask
+import dask.array as dask_array
+import dask.multiprocessing
+import netCDF4
 import numpy as np
 import pandas as pd
 import xarray as xr
@@ -8,6 +19,68 @@ from emiproc.profiles.temporal_profiles import get_index_in_profile
 from emiproc.utils.translators import inv_to_xarray
 
 
+def _process_pool() -> ProcessPoolExecutor:
+    """Return a pool of processes like the one of the dask process scheduler."""
+    if os.environ.get("PYTHONHASHSEED") in (None, "0"):
+        # Same hashing in the workers, as set by dask
+        os.environ["PYTHONHASHSEED"] = "6640"
+    return ProcessPoolExecutor(
+        dask.config.get("num_workers", None) or os.cpu_count(),
+        mp_context=dask.multiprocessing.get_context(),
+        initializer=partial(
+            dask.multiprocessing.initialize_worker_process,
+            user_initializer=dask.config.get("multiprocessing.initializer", None),
+        ),
+    )
+
+
+def write_netcdf(ds: xr.Dataset, path: PathLike) -> None:
+    """Write a dataset to a netcdf file.
+
+    The dask variables (ex. of chunked emissions) are written chunk by chunk,
+    such that only a few chunks are in memory at once.
+
+    With a process scheduler, the file cannot be written from the workers.
+    The chunks are computed by the workers, a batch of one chunk per worker
+    at a time, and written to their region of the file by this process.
+
+    :arg ds: The dataset to write.
+    :arg path: The netcdf file.
+    """
+    if dask.base.get_scheduler() is not dask.multiprocessing.get:
+        ds.to_netcdf(path)
+        return
+    chunked = [name for name, var in ds.variables.items() if var.chunks is not None]
+    # Write the metadata and the variables not chunked, the chunked variables
+    # are created in the file but not written
+    ds.to_netcdf(path, compute=False)
+
+    with ExitStack() as stack:
+        if dask.config.get("pool", None) is None:
+            # Use the same workers for all the batches
+            pool = stack.enter_context(_process_pool())
+            stack.enter_context(dask.config.set(pool=pool))
+        n_workers = dask.config.get("pool")._max_workers
+        nc = stack.enter_context(netCDF4.Dataset(path, "a"))
+        for name in chunked:
+            data = ds.variables[name].data
+            starts = [np.cumsum((0,) + chunks) for chunks in data.chunks]
+            blocks = np.ndindex(*data.numblocks)
+            while batch := list(itertools.islice(blocks, n_workers)):
+                values = dask.compute(*[data.blocks[block] for block in batch])
+                for block, block_values in zip(batch, values):
+                    region = tuple(
+                        slice(bounds[i], bounds[i + 1])
+                        for bounds, i in zip(starts, block)
+                    )
+                    nc.variables[name][region] = block_values
+
+
+def _factors_of_indexes(indexes: np.ndarray, factors: np.ndarray) -> np.ndarray:
+    """Return the factors at the times of each profile index."""
+    return factors[indexes]
+
+
 def get_temporally_scaled_array(
     inv: Inventory,
     time_range: pd.DatetimeIndex | int,
@@ -30,6 +103,9 @@ def get_temporally_scaled_array(
         This can be useful to improve the performance of the plotting.
 
     :return: the temporally resolved emissions array.
+        If the emissions are chunked over the cells, the array is lazy:
+        the scaling factors of each cell are computed only for the
+        chunks accessed, ex. by an exporter writing each time step.
         The units are the same as in the inventory. (kg/y/cell)
         But now even scaled on the time axis given units are still kg/y/cell.
         If you want to get the emissions at your time resolution you need divide
@@ -56,9 +132,6 @@ def get_temporally_scaled_array(
     if sum_over_cells:
         da_totals = da_totals.sum("cell")
 
-    # Acess the scaling factors
-    scaling_factors_array = profiles.scaling_factors[profiles_indexes]
-
     if "cell" in profiles_indexes.dims:
         if sum_over_cells:
             raise ValueError(
@@ -72,14 +145,6 @@ def get_temporally_scaled_array(
             da_totals.sel(cell=missing_cells).sum().values == 0
         ), "Some cell or emissions with none zero values have missing profiles"
 
-    da_scaling_factors = xr.DataArray(
-        scaling_factors_array,
-        coords=dict(
-            **profiles_indexes.coords,
-            profile_index=np.arange(profiles.size),
-        ),
-    )
-
     # Get teh index of of the scaling factor for each type of temporal profile
     size_offset = 0
     indices = []
@@ -90,21 +155,35 @@ def get_temporally_scaled_array(
 
         size_offset += profile_type.size
 
-    indices_to_use = xr.DataArray(
-        np.array(indices).T,
-        coords=dict(
-            time=time_range,
-            profile=np.arange(len(profiles.types)),
-        ),
-        dims=["time", "profile"],
-    )
+    # Merge all the time factors of each profile together, shape (profile, time)
+    factors_at_times = profiles.scaling_factors[:, np.array(indices).T].prod(axis=-1)
 
     # Get the proper scaling factors for each index
-    scaling_factors_at_times = da_scaling_factors.loc[
-        dict(profile_index=indices_to_use)
-    ]
-    # Merge all the time factors together
-    scaling_factor_at_times = scaling_factors_at_times.prod("profile")
+    if "cell" in profiles_indexes.dims and isinstance(da_totals.data, dask_array.Array):
+        # Same chunks over the cells as the emissions
+        cell_axis = profiles_indexes.dims.index("cell")
+        indexes = dask_array.from_array(
+            profiles_indexes.values,
+            chunks={
+                axis: da_totals.data.chunksize[-1] if axis == cell_axis else -1
+                for axis in range(profiles_indexes.ndim)
+            },
+        )
+        data = indexes.map_blocks(
+            _factors_of_indexes,
+            factors_at_times,
+            new_axis=indexes.ndim,
+            chunks=indexes.chunks + ((len(time_range),),),
+            dtype=float,
+            meta=np.empty((0,) * (indexes.ndim + 1), dtype=float),
+        )
+    else:
+        data = factors_at_times[profiles_indexes.values]
+    scaling_factor_at_times = xr.DataArray(
+        data,
+        coords=dict(**profiles_indexes.coords, time=time_range),
+        dims=[*profiles_indexes.dims, "time"],
+    )
     # Set the scaling factors on the missing cells
     scaling_factor_at_times_all_cells = scaling_factor_at_times.reindex(
         da_totals.coords
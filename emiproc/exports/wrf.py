@@ -13,7 +13,7 @@ import pandas as pd
 import xarray as xr
 from shapely.creation import polygons
 
-from emiproc.exports.utils import get_temporally_scaled_array
+from emiproc.exports.utils import get_temporally_scaled_array, write_netcdf
 from emiproc.grids import WGS84, Grid, RegularGrid
 from emiproc.inventories import Inventory
 from emiproc.utilities import HOUR_PER_DAY, get_day_per_year
@@ -113,6 +113,7 @@ class WRF_Grid(RegularGrid):
         )
 
         coords = np.rollaxis(coords, -1, 0)
+        self.corners = coords
 
         # Create the polygons
         polys = polygons(coords)
@@ -229,6 +230,6 @@ def export_wrf_hourly_emissions(
         if os.name == "nt":
             str_format = "%Y-%m-%d_%H-%M-%S"
         file_name = output_dir / f"wrfchemi_d01_{dt.strftime(str_format)}"
-        ds_at_hour.to_netcdf(file_name)
+        write_netcdf(ds_at_hour, file_name)
 
     return output_dir
@@ -6,8 +6,10 @@ grids used in different emissions inventories.
 
 from __future__ import annotations
 
+import hashlib
 import logging
 import math
+from os import PathLike
 from pathlib import Path
 import warnings
 from functools import cache, cached_property
@@ -18,10 +20,14 @@ import numpy as np
 import pyproj
 import xarray as xr
 from netCDF4 import Dataset
-from shapely.geometry import LineString, MultiPolygon, Point, Polygon, box
-from shapely.ops import split
+from scipy.spatial import cKDTree
+import shapely
+from shapely.geometry import MultiPolygon, Point, Polygon, box
+from shapely.geometry.base import BaseGeometry
 from shapely.creation import polygons
 
+from emiproc.weights_cache import fingerprint_geometries, get_weights_cache
+
 WGS84 = 4326
 WGS84_PROJECTED = 3857
 LV95 = 2056  # EPSG:2056, swiss CRS, unit: meters
@@ -38,6 +44,36 @@ logger = logging.getLogger(__name__)
 BoundingBox = tuple[float, float, float, float]
 
 
+def _latitude_band_areas(
+    lat_a: np.ndarray, lat_b: np.ndarray, crs: int | str
+) -> np.ndarray:
+    """Return the area in m2 of the bands between two latitudes.
+
+    The area is given per radian of longitude.
+    It is computed on the authalic sphere of the ellipsoid of the crs,
+    which gives the exact area on the ellipsoid.
+
+    :arg lat_a: The first latitudes of the bands in degrees.
+    :arg lat_b: The second latitudes of the bands in degrees.
+    :arg crs: The geographic crs of the latitudes.
+    """
+    ellipsoid = pyproj.CRS(crs).ellipsoid
+    a = ellipsoid.semi_major_metre
+    e2 = 1.0 - (ellipsoid.semi_minor_metre / a) ** 2
+    e = np.sqrt(e2)
+
+    def q(lat: np.ndarray) -> np.ndarray:
+        # Twice the area between the equator and lat on the unit sphere
+        s = np.sin(np.deg2rad(np.clip(lat, -90.0, 90.0)))
+        if e == 0:
+            return 2.0 * s
+        return (1.0 - e2) * (
+            s / (1.0 - e2 * s**2) - np.log((1.0 - e * s) / (1.0 + e * s)) / (2.0 * e)
+        )
+
+    return a**2 * np.abs(q(lat_b) - q(lat_a)) / 2.0
+
+
 class Grid:
     """Abstract base class for a grid.
     Derive your own grid implementation from this and make sure to provide
@@ -68,6 +104,43 @@ class Grid:
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}({self.name})"
 
+    def __eq__(self, other: object) -> bool:
+        """Two grids are equal if they have the same :py:attr:`fingerprint`."""
+        if not isinstance(other, Grid):
+            return NotImplemented
+        return self is other or self.fingerprint == other.fingerprint
+
+    def __hash__(self) -> int:
+        return hash(self.fingerprint)
+
+    @cached_property
+    def fingerprint(self) -> str:
+        """A hash identifying the cells of the grid.
+
+        Grids with the same fingerprint have the same cells, in the same
+        order and in the same crs. The name of the grid is not part of it.
+        It is computed from the parameters of the grid when possible,
+        otherwise from the coordinates of the cells.
+        """
+        h = hashlib.sha256()
+        h.update(
+            ("None" if self.crs is None else pyproj.CRS(self.crs).to_wkt()).encode()
+        )
+        for value in self._fingerprint_values():
+            if isinstance(value, np.ndarray):
+                value = np.ascontiguousarray(value)
+                h.update(f"{value.dtype}{value.shape}".encode())
+                h.update(value.tobytes())
+            else:
+                h.update(repr(value).encode())
+        return h.hexdigest()
+
+    def _fingerprint_values(self) -> list:
+        """Values defining the cells of the grid, see :py:attr:`fingerprint`."""
+        if self.corners is not None:
+            return ["corners", self.nx, self.ny, np.asarray(self.corners, dtype=float)]
+        return ["geometry", self.nx, self.ny, fingerprint_geometries(self.gdf.geometry)]
+
     @property
     def gdf(self) -> gpd.GeoDataFrame:
         """Return a geopandas dataframe containing the grid."""
@@ -84,10 +157,14 @@ class Grid:
             "deprectated to set the gdf of a grid. It is now automatically generated."
         )
         self._gdf = value
+        # The cells might have changed
+        self.__dict__.pop("fingerprint", None)
 
     def cell_corners(self, i, j):
         """Return the corners of the cell with indices (i,j).
 
+        This is a wrapper around :py:meth:`cell_corners_array` for a single cell.
+
         The points are ordered clockwise, starting in the top
         left:
 
@@ -124,16 +201,99 @@ class Grid:
             Arrays containing the x and y coordinates of the corners
 
         """
-        raise NotImplementedError("Method not implemented")
+        corners = self.cell_corners_array(np.array([i * self.ny + j]))[0]
+        return corners[:, 0], corners[:, 1]
+
+    def _cells_ij(
+        self, cells: np.ndarray | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Return the column and row indexes of the cells.
+
+        :arg cells: The indexes of the cells. None for all the cells of the grid.
+        """
+        if cells is None:
+            return (
+                np.repeat(np.arange(self.nx), self.ny),
+                np.tile(np.arange(self.ny), self.nx),
+            )
+        cells = np.asarray(cells, dtype=int)
+        return cells // self.ny, cells % self.ny
+
+    def cell_corners_array(self, cells: np.ndarray | None = None) -> np.ndarray:
+        """Return the corners of the cells.
+
+        Grids should implement this with vectorized operations.
+        The default implementation calls the :py:meth:`cell_corners` of
+        the grid on each cell, for grids that only implement this one.
+
+        :arg cells: The indexes of the cells. None for all the cells of the grid.
+
+        :return: An array of shape (n_cells, n_vertices, 2) with the (x, y)
+            of the corners of each cell.
+        """
+        if type(self).cell_corners is Grid.cell_corners:
+            raise NotImplementedError(
+                f"{type(self).__name__} must implement `cell_corners_array`."
+            )
+        ix, iy = self._cells_ij(cells)
+        return np.array(
+            [np.stack(self.cell_corners(i, j), axis=-1) for i, j in zip(ix, iy)]
+        ).reshape(len(ix), -1, 2)
 
     @cached_property
     def cells_as_polylist(self) -> list[Polygon]:
         """Return all the cells as a list of polygons."""
-        return [
-            Polygon(zip(*self.cell_corners(i, j)))
-            for i in range(self.nx)
-            for j in range(self.ny)
-        ]
+        return polygons(self.cell_corners_array())
+
+    def cells_to_crs(self, crs: int | str, densify: int = 0) -> gpd.GeoSeries:
+        """Return the cells of the grid reprojected to another crs.
+
+        The corners of the cells are transformed with pyproj and the
+        polygons are built from the transformed corners.
+
+        :arg crs: The crs in which to reproject the cells.
+        :arg densify: The number of points to add on each edge of the cells
+            before the transformation. Use this for projections in which the
+            edges of the cells become curved.
+
+        :return: The reprojected cells, in the order of the grid.
+        """
+        if pyproj.CRS(crs) == pyproj.CRS(self.crs):
+            return gpd.GeoSeries(self.cells_as_polylist, crs=self.crs)
+        if type(self).cell_corners_array is Grid.cell_corners_array:
+            # Only the polygons are known
+            return self._polygons_to_crs(crs, densify=densify)
+
+        corners = self.cell_corners_array()
+        if densify > 0:
+            # Add the points between each corner and the next one
+            steps = np.arange(densify + 1) / (densify + 1)
+            next_corners = np.roll(corners, -1, axis=1)
+            corners = (
+                corners[:, :, None, :]
+                + (next_corners - corners)[:, :, None, :] * steps[None, None, :, None]
+            )
+            corners = corners.reshape(len(corners), -1, 2)
+        transformer = pyproj.Transformer.from_crs(self.crs, crs, always_xy=True)
+        x, y = transformer.transform(corners[..., 0], corners[..., 1])
+        return gpd.GeoSeries(polygons(np.stack([x, y], axis=-1)), crs=crs)
+
+    def _polygons_to_crs(self, crs: int | str, densify: int = 0) -> gpd.GeoSeries:
+        """Reproject the polygons of the cells with geopandas.
+
+        The edges are densified with the same number of points on average.
+        """
+        cells = gpd.GeoSeries(self.cells_as_polylist, crs=self.crs)
+        if densify > 0:
+            geoms = cells.to_numpy()
+            exteriors = shapely.get_exterior_ring(geoms)
+            edges_length = shapely.length(exteriors) / (
+                shapely.get_num_coordinates(exteriors) - 1
+            )
+            cells = gpd.GeoSeries(
+                shapely.segmentize(geoms, edges_length / (densify + 1)), crs=self.crs
+            )
+        return cells.to_crs(crs)
 
     @cached_property
     def shape(self) -> tuple[int, int]:
@@ -142,16 +302,73 @@ class Grid:
     @cached_property
     def cell_areas(self) -> Iterable[float]:
         """Return an array containing the area of each cell in m2."""
-        return (
-            gpd.GeoSeries(self.cells_as_polylist, crs=self.crs)
-            # Convert to WGS84 to get the area in m^2
-            .to_crs(epsg=WGS84_NSIDC).area
-        )
+        # Convert to WGS84 to get the area in m^2
+        return self.cells_to_crs(WGS84_NSIDC).area
 
     def __len__(self):
         """Return the number of cells in the grid."""
         return self.nx * self.ny
 
+    @cached_property
+    def _centers_tree(self) -> cKDTree:
+        """KD-tree of the centers of the cells, used by :py:meth:`locate`."""
+        centers = shapely.centroid(self.gdf.geometry.to_numpy())
+        return cKDTree(shapely.get_coordinates(centers))
+
+    @cached_property
+    def _cells_tree(self) -> shapely.STRtree:
+        """Tree of the cells, for the points not found from the centers."""
+        return shapely.STRtree(self.gdf.geometry.to_numpy())
+
+    def locate(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """Return the index of the cell containing each point.
+
+        The cells with the nearest centers are checked first.
+        The index is built at the first call and kept on the grid.
+
+        :arg x: The x coordinates of the points, in the crs of the grid.
+        :arg y: The y coordinates of the points, in the crs of the grid.
+
+        :return: The index of the cell of each point, with the shape of `x`.
+            -1 for the points outside of the grid.
+            A point on the boundary of many cells is in one of them.
+        """
+        x, y = np.broadcast_arrays(
+            np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        )
+        shape = x.shape
+        x, y = x.reshape(-1), y.reshape(-1)
+        cells = self.gdf.geometry.to_numpy()
+        located = np.full(len(x), -1, dtype=int)
+        if len(x) == 0 or len(cells) == 0:
+            return located.reshape(shape)
+
+        n_candidates = min(8, len(cells))
+        finite = np.isfinite(x) & np.isfinite(y)
+        _, candidates = self._centers_tree.query(
+            np.stack([x[finite], y[finite]], axis=-1), k=n_candidates
+        )
+        candidates = candidates.reshape(-1, n_candidates)
+        positions = np.flatnonzero(finite)
+        for k in range(n_candidates):
+            cell = candidates[:, k]
+            inside = shapely.intersects_xy(cells[cell], x[positions], y[positions])
+            located[positions[inside]] = cell[inside]
+            positions, candidates = positions[~inside], candidates[~inside]
+            if len(positions) == 0:
+                break
+
+        if len(positions) > 0:
+            # Irregular cells or points outside of the grid
+            point_pos, cell = self._cells_tree.query(
+                shapely.points(x[positions], y[positions]), predicate="intersects"
+            )
+            order = np.lexsort((cell, point_pos))
+            point_pos, first = np.unique(point_pos[order], return_index=True)
+            located[positions[point_pos]] = cell[order][first]
+
+        return located.reshape(shape)
+
 
 class RegularGrid(Grid):
     """Regular grid a grids with squared cells.
@@ -260,43 +477,302 @@ class RegularGrid(Grid):
 
         super().__init__(name, crs)
 
-    @cached_property
-    def cells_as_polylist(self) -> list[Polygon]:
+    @property
+    def is_regular(self) -> bool:
+        """Whether the cells are defined by `lon_range` and `lat_range`.
+
+        Some grids inherit from RegularGrid but are not regular (ex. WRF),
+        their cells are then only known from their polygons.
+        """
+        return hasattr(self, "lon_range") and hasattr(self, "lat_range")
+
+    def _cells_edges(
+        self, cells: np.ndarray | None = None
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Return the x and y edges of the cells, as the polygons are built.
 
-        x_coords, y_coords = np.meshgrid(
-            self.lon_range - self.dx / 2.0, self.lat_range - self.dy / 2.0
+        The edges are not sorted, as dx or dy can be negative.
+        """
+        ix, iy = self._cells_ij(cells)
+        x0 = np.asarray(self.lon_range, dtype=float)[ix] - self.dx / 2.0
+        y0 = np.asarray(self.lat_range, dtype=float)[iy] - self.dy / 2.0
+        return x0, y0, x0 + self.dx, y0 + self.dy
+
+    def cell_bounds(self, cells: np.ndarray | None = None) -> np.ndarray:
+        """Return the bounds of the cells, computed from the grid parameters.
+
+        No geometry is created.
+
+        :arg cells: The indexes of the cells. None for all the cells of the grid.
+
+        :return: An array of shape (n_cells, 4) with
+            (xmin, ymin, xmax, ymax) for each cell.
+        """
+        x0, y0, x1, y1 = self._cells_edges(cells)
+        return np.stack(
+            [
+                np.minimum(x0, x1),
+                np.minimum(y0, y1),
+                np.maximum(x0, x1),
+                np.maximum(y0, y1),
+            ],
+            axis=-1,
         )
-        # Reshape to 1D (order set for backward compatibility)
-        x_coords = x_coords.flatten(order="F")
-        y_coords = y_coords.flatten(order="F")
-        dx = float(self.dx)
-        dy = float(self.dy)
-        coords = np.array(
+
+    def cell_centers(self, cells: np.ndarray | None = None) -> np.ndarray:
+        """Return the centers of the cells.
+
+        :arg cells: The indexes of the cells. None for all the cells of the grid.
+
+        :return: An array of shape (n_cells, 2) with the (x, y) of each center.
+        """
+        ix, iy = self._cells_ij(cells)
+        return np.stack(
             [
-                [x, y]
-                for x, y in zip(
-                    [x_coords, x_coords, x_coords + dx, x_coords + dx],
-                    [y_coords, y_coords + dy, y_coords + dy, y_coords],
-                )
-            ]
+                np.asarray(self.lon_range, dtype=float)[ix],
+                np.asarray(self.lat_range, dtype=float)[iy],
+            ],
+            axis=-1,
         )
-        coords = np.rollaxis(coords, -1, 0)
-        return polygons(coords)
 
-    def cell_corners(self, i, j):
-        """Return the corners of the cell with indices (i,j).
+    def cell_corners_array(self, cells: np.ndarray | None = None) -> np.ndarray:
+        """Return the corners of the cells.
 
-        The points are ordered clockwise, starting in the top
-        right:
+        The corners are in the same order as the ones of the polygons
+        of :py:attr:`cells_as_polylist`.
+
+        :arg cells: The indexes of the cells. None for all the cells of the grid.
 
+        :return: An array of shape (n_cells, 4, 2) with the (x, y) of the corners.
         """
-        x = self.xmin + i * self.dx
-        y = self.ymin + j * self.dy
+        x0, y0, x1, y1 = self._cells_edges(cells)
+        return np.stack(
+            [
+                np.stack([x0, x0, x1, x1], axis=-1),
+                np.stack([y0, y1, y1, y0], axis=-1),
+            ],
+            axis=-1,
+        )
 
-        return (
-            np.array([x, x + self.dx, x + self.dx, x]),
-            np.array([y, y, y + self.dy, y + self.dy]),
+    def _vertices_lattice(self, densify: int = 0) -> tuple[np.ndarray, np.ndarray]:
+        """Return the x and y of the vertices shared by the cells.
+
+        :arg densify: The number of points to add on each edge of the cells.
+
+        :return: Two arrays of shape (nx * (densify + 1) + 1, ny * (densify + 1) + 1).
+        """
+        steps = np.arange(densify + 1) / (densify + 1)
+        lattice = []
+        for centers, d in [(self.lon_range, self.dx), (self.lat_range, self.dy)]:
+            lower = np.asarray(centers, dtype=float) - d / 2.0
+            points = (lower[:, None] + d * steps[None, :]).reshape(-1)
+            lattice.append(np.append(points, lower[-1] + d))
+        return np.meshgrid(*lattice, indexing="ij")
+
+    def cells_to_crs(self, crs: int | str, densify: int = 0) -> gpd.GeoSeries:
+        """Return the cells of the grid reprojected to another crs.
+
+        The vertices of the grid are shared by the neighbouring cells.
+        The lattice of the vertices is transformed once with pyproj and the
+        polygons are built from it, such that neighbouring cells have
+        exactly the same edges.
+
+        See :py:meth:`Grid.cells_to_crs` .
+        """
+        if pyproj.CRS(crs) == pyproj.CRS(self.crs):
+            return gpd.GeoSeries(self.cells_as_polylist, crs=self.crs)
+        if not self.is_regular:
+            return self._polygons_to_crs(crs, densify=densify)
+
+        x, y = self._vertices_lattice(densify)
+        transformer = pyproj.Transformer.from_crs(self.crs, crs, always_xy=True)
+        x, y = transformer.transform(x, y)
+
+        # Walk along the edges of each cell, in the order of the corners
+        n = densify + 1
+        up, down = np.arange(n), np.arange(n, 0, -1)
+        ring_i = np.concatenate([np.zeros(n, dtype=int), up, np.full(n, n), down])
+        ring_j = np.concatenate([up, np.full(n, n), down, np.zeros(n, dtype=int)])
+        ix, iy = self._cells_ij()
+        i = ix[:, None] * n + ring_i[None, :]
+        j = iy[:, None] * n + ring_j[None, :]
+        coords = np.stack([x[i, j], y[i, j]], axis=-1)
+        return gpd.GeoSeries(polygons(coords), crs=crs)
+
+    def cell_polygons(self, cells: np.ndarray | None = None) -> np.ndarray:
+        """Create the polygons of some cells of the grid.
+
+        Use this with :py:meth:`cells_in_bounds` to create the polygons
+        of only a window of the grid, instead of the whole
+        :py:attr:`cells_as_polylist` .
+
+        :arg cells: The indexes of the cells. None for all the cells of the grid.
+
+        :return: An array of polygons.
+        """
+        return polygons(self.cell_corners_array(cells))
+
+    def cells_in_bounds(self, bounds: BoundingBox) -> np.ndarray:
+        """Return the indexes of the cells intersecting a bounding box.
+
+        Only the grid parameters are used, no geometry is created.
+
+        :arg bounds: The (xmin, ymin, xmax, ymax) of the box, in the crs
+            of the grid.
+
+        :return: The indexes of the cells, in the order of the grid.
+        """
+        xmin, ymin, xmax, ymax = bounds
+        ranges = []
+        for centers, d, low, high in [
+            (self.lon_range, self.dx, xmin, xmax),
+            (self.lat_range, self.dy, ymin, ymax),
+        ]:
+            centers = np.asarray(centers, dtype=float)
+            half = abs(d) / 2.0
+            ranges.append(
+                np.flatnonzero((centers + half >= low) & (centers - half <= high))
+            )
+        ix, iy = ranges
+        return (ix[:, None] * self.ny + iy[None, :]).reshape(-1)
+
+    def window(
+        self, bbox: BoundingBox, name: str | None = None
+    ) -> tuple[RegularGrid, np.ndarray]:
+        """Return the part of the grid covering a bounding box.
+
+        The window contains the cells whose interior intersects the box.
+        Its cells are exactly the same as the ones of this grid.
+        Only the grid parameters are used, no geometry is created.
+
+        :arg bbox: The (xmin, ymin, xmax, ymax) of the box, in the crs
+            of the grid.
+        :arg name: The name of the new grid.
+
+        :return: The grid of the window and the indexes of its cells
+            in this grid, in the order of the new grid.
+        """
+        if not self.is_regular:
+            raise TypeError(f"{self} has no regular coordinates to window.")
+        xmin, ymin, xmax, ymax = bbox
+        ranges = []
+        for centers, d, low, high in [
+            (self.lon_range, self.dx, xmin, xmax),
+            (self.lat_range, self.dy, ymin, ymax),
+        ]:
+            centers = np.asarray(centers, dtype=float)
+            half = abs(d) / 2.0
+            indexes = np.flatnonzero((centers + half > low) & (centers - half < high))
+            if len(indexes) == 0:
+                raise ValueError(f"{bbox=} does not intersect the grid {self}.")
+            ranges.append(slice(indexes[0], indexes[-1] + 1))
+        slice_x, slice_y = ranges
+
+        # The centers are taken from this grid to keep exactly the same cells
+        grid = RegularGrid.__new__(RegularGrid)
+        grid.lon_range = np.asarray(self.lon_range, dtype=float)[slice_x]
+        grid.lat_range = np.asarray(self.lat_range, dtype=float)[slice_y]
+        grid.nx, grid.ny = len(grid.lon_range), len(grid.lat_range)
+        grid.dx, grid.dy = self.dx, self.dy
+        grid.lon_bounds = np.concatenate(
+            [grid.lon_range - grid.dx / 2, [grid.lon_range[-1] + grid.dx / 2]]
         )
+        grid.lat_bounds = np.concatenate(
+            [grid.lat_range - grid.dy / 2, [grid.lat_range[-1] + grid.dy / 2]]
+        )
+        grid.xmin, grid.xmax = grid.lon_bounds[0], grid.lon_bounds[-1]
+        grid.ymin, grid.ymax = grid.lat_bounds[0], grid.lat_bounds[-1]
+        if name is None:
+            name = f"{self.name}_window"
+        Grid.__init__(grid, name=name, crs=self.crs)
+
+        ix = np.arange(self.nx)[slice_x]
+        iy = np.arange(self.ny)[slice_y]
+        cells = (ix[:, None] * self.ny + iy[None, :]).reshape(-1)
+        return grid, cells
+
+    def _fingerprint_values(self) -> list:
+        if not self.is_regular:
+            return super()._fingerprint_values()
+        return [
+            "regular",
+            float(self.dx),
+            float(self.dy),
+            np.asarray(self.lon_range, dtype=float),
+            np.asarray(self.lat_range, dtype=float),
+        ]
+
+    def locate(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """Return the index of the cell containing each point.
+
+        The cells are found with the coordinates of the grid only.
+        A point on the boundary between two cells is in the one with
+        the larger index, except on the outer boundary of the grid.
+
+        See :py:meth:`Grid.locate` .
+        """
+        if not self.is_regular:
+            return super().locate(x, y)
+        x, y = np.broadcast_arrays(
+            np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        )
+        valid = np.ones(x.shape, dtype=bool)
+        indexes = []
+        for coords, centers, d in [
+            (x, self.lon_range, self.dx),
+            (y, self.lat_range, self.dy),
+        ]:
+            centers = np.asarray(centers, dtype=float)
+            # Cells can be ordered decreasingly
+            step = centers[1] - centers[0] if len(centers) > 1 else d
+            if len(centers) > 1 and not np.allclose(np.diff(centers), step):
+                return super().locate(x, y)
+            with np.errstate(invalid="ignore"):
+                f = (coords - (centers[0] - step / 2.0)) / step
+                # The outer edge belongs to the last cell
+                f = np.where(f == len(centers), len(centers) - 1, f)
+                valid &= (f >= 0) & (f < len(centers))
+            indexes.append(np.floor(np.where(valid, f, 0)).astype(int))
+        ix, iy = indexes
+        return np.where(valid, ix * self.ny + iy, -1)
+
+    @cached_property
+    def total_bounds(self) -> BoundingBox:
+        """The bounds of the whole grid, as `GeoDataFrame.total_bounds`."""
+        if not self.is_regular:
+            return tuple(float(v) for v in self.gdf.total_bounds)
+        bounds = []
+        for centers, d in [(self.lon_range, self.dx), (self.lat_range, self.dy)]:
+            centers = np.asarray(centers, dtype=float)
+            half = abs(d) / 2.0
+            bounds.append((float(centers.min() - half), float(centers.max() + half)))
+        (xmin, xmax), (ymin, ymax) = bounds
+        return xmin, ymin, xmax, ymax
+
+    @cached_property
+    def cell_areas(self) -> np.ndarray:
+        """Return an array containing the area of each cell in m2.
+
+        The areas are computed from the grid parameters, without geometries.
+        On a geographic crs, a cell is the band between its two latitudes
+        on the authalic sphere of the ellipsoid, times the fraction of
+        longitude it covers.
+        On a projected crs, the area is `dx * dy` in the plane of the projection.
+        """
+        if not self.is_regular:
+            return super().cell_areas
+        crs = pyproj.CRS(self.crs)
+        if crs.is_geographic:
+            y0 = np.asarray(self.lat_range, dtype=float) - self.dy / 2.0
+            areas_y = _latitude_band_areas(y0, y0 + self.dy, crs) * np.deg2rad(
+                abs(self.dx)
+            )
+        else:
+            to_metre = [axis.unit_conversion_factor for axis in crs.axis_info[:2]]
+            areas_y = np.full(
+                self.ny, abs(self.dx * to_metre[0] * self.dy * to_metre[1])
+            )
+        return np.tile(areas_y, self.nx)
 
     @cached_property
     def bounds(self) -> tuple[int, int, int, int]:
@@ -462,46 +938,98 @@ class HexGrid(Grid):
 
         super().__init__(name, crs)
 
-    @cached_property
-    def cells_as_polylist(self) -> list[Polygon]:
-        """Return all the cells as a list of polygons."""
+    def cell_corners_array(self, cells: np.ndarray | None = None) -> np.ndarray:
+        """Return the corners of the hexagons.
 
-        x_centers, y_centers = np.meshgrid(self.lon_range, self.lat_range)
+        See also the docstring of Grid.cell_corners_array.
+        """
+        ix, iy = self._cells_ij(cells)
+        x_centers = np.asarray(self.lon_range, dtype=float)[ix]
+        y_centers = np.asarray(self.lat_range, dtype=float)[iy]
         # Shift the odd rows
         if self.oriented_north:
-            x_centers[1::2] += self.dx / 2
+            x_centers = x_centers + np.where(iy % 2 == 1, self.dx / 2, 0.0)
         else:
-            y_centers[:, 1::2] += self.dy / 2
-
-        # Calculat the corners of the hexagons
-        corners = []
-        flatten = lambda x: x.flatten(order="F")
-        x_centers = flatten(x_centers)
-        y_centers = flatten(y_centers)
+            y_centers = y_centers + np.where(ix % 2 == 1, self.dy / 2, 0.0)
 
         # half_offset = np.sqrt(3) / 2
         # half_offset = np.sqrt(3) / 8
         half_offset = 1 / (np.sqrt(3))
-        offsets_x = [0, 1, 1, 0, -1, -1]
-        offsets_y = [
-            2 - half_offset,
-            half_offset,
-            -half_offset,
-            -2 + half_offset,
-            -half_offset,
-            half_offset,
-        ]
+        offsets_x = np.array([0, 1, 1, 0, -1, -1])
+        offsets_y = np.array(
+            [
+                2 - half_offset,
+                half_offset,
+                -half_offset,
+                -2 + half_offset,
+                -half_offset,
+                half_offset,
+            ]
+        )
         if not self.oriented_north:
             offsets_x, offsets_y = offsets_y, offsets_x
 
-        for off_x, off_y in zip(offsets_x, offsets_y):
-            x = x_centers + self.dx / 2 * off_x
-            y = y_centers + self.dy / 2 * off_y
-            corners.append(np.stack([x, y], axis=-1))
-        # Reshape to 1D (order set for backward compatibility)
+        x = x_centers[:, None] + self.dx / 2 * offsets_x[None, :]
+        y = y_centers[:, None] + self.dy / 2 * offsets_y[None, :]
+        return np.stack([x, y], axis=-1)
+
+    def _fingerprint_values(self) -> list:
+        return [
+            "hex",
+            self.nx,
+            self.ny,
+            float(self.xmin),
+            float(self.ymin),
+            float(self.dx),
+            float(self.dy),
+            self.oriented_north,
+        ]
 
-        coords = np.stack(corners, axis=1)
-        return polygons(coords)
+    def locate(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """Return the index of the cell containing each point.
+
+        The row and column are estimated from the coordinates and the
+        hexagons around are checked with their corners.
+
+        See :py:meth:`Grid.locate` .
+        """
+        x, y = np.broadcast_arrays(
+            np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        )
+        lon_range = np.asarray(self.lon_range, dtype=float)
+        lat_range = np.asarray(self.lat_range, dtype=float)
+        with np.errstate(invalid="ignore"):
+            if self.oriented_north:
+                iy = np.rint((y - lat_range[0]) / self.dy)
+                shift = np.where(iy % 2 == 1, self.dx / 2, 0.0)
+                ix = np.rint((x - shift - lon_range[0]) / self.dx)
+            else:
+                ix = np.rint((x - lon_range[0]) / self.dx)
+                shift = np.where(ix % 2 == 1, self.dy / 2, 0.0)
+                iy = np.rint((y - shift - lat_range[0]) / self.dy)
+        finite = np.isfinite(ix) & np.isfinite(iy)
+        ix = np.where(finite, ix, -2).astype(int)
+        iy = np.where(finite, iy, -2).astype(int)
+
+        located = np.full(x.shape, -1, dtype=int)
+        for off_x, off_y in [(0, 0)] + [
+            (i, j) for i in [-1, 0, 1] for j in [-1, 0, 1] if (i, j) != (0, 0)
+        ]:
+            cx, cy = ix + off_x, iy + off_y
+            todo = (located < 0) & (cx >= 0) & (cx < self.nx) & (cy >= 0)
+            todo &= cy < self.ny
+            if not np.any(todo):
+                continue
+            cells = cx[todo] * self.ny + cy[todo]
+            corners = self.cell_corners_array(cells)
+            # Convex polygons: the point is on the same side of all the edges
+            edges = np.roll(corners, -1, axis=1) - corners
+            to_point = np.stack([x[todo], y[todo]], axis=-1)[:, None, :] - corners
+            cross = edges[..., 0] * to_point[..., 1] - edges[..., 1] * to_point[..., 0]
+            inside = np.all(cross <= 0, axis=1) | np.all(cross >= 0, axis=1)
+            positions = np.flatnonzero(todo)[inside]
+            located.flat[positions] = cells[inside]
+        return located
 
 
 class TNOGrid(RegularGrid):
@@ -544,24 +1072,6 @@ class TNOGrid(RegularGrid):
         # initialized here
         Grid.__init__(self, name=name, crs=WGS84)
 
-    def cell_corners(self, i, j):
-        """Return the corners of the cell with indices (i,j).
-
-        See also the docstring of Grid.cell_corners.
-
-        Parameters
-        ----------
-        i : int
-        j : int
-
-        Returns
-        -------
-        tuple(np.array(shape=(4,), dtype=float),
-              np.array(shape=(4,), dtype=float))
-            Arrays containing the x and y coordinates of the corners
-        """
-        return self.cell_x[:, i], self.cell_y[:, j]
-
     @property
     def lon_range(self):
         """Return an array containing all the longitudinal points on the grid.
@@ -621,23 +1131,13 @@ class EDGARGrid(Grid):
 
         super().__init__(name, crs=WGS84)
 
-    def cell_corners(self, i, j):
-        """Return the corners of the cell with indices (i,j).
+    def cell_corners_array(self, cells: np.ndarray | None = None) -> np.ndarray:
+        """Return the corners of the cells.
 
-        See also the docstring of Grid.cell_corners.
-
-        Parameters
-        ----------
-        i : int
-        j : int
-
-        Returns
-        -------
-        tuple(np.array(shape=(4,), dtype=float),
-              np.array(shape=(4,), dtype=float))
-            Arrays containing the x and y coordinates of the corners
+        See also the docstring of Grid.cell_corners_array.
         """
-        return self.cell_x[:, i], self.cell_y[:, j]
+        ix, iy = self._cells_ij(cells)
+        return np.stack([self.cell_x[:, ix].T, self.cell_y[:, iy].T], axis=-1)
 
     @cached_property
     def lon_range(self):
@@ -762,25 +1262,62 @@ class SwissGrid(RegularGrid):
             name=name, nx=nx, ny=ny, dx=dx, dy=dy, xmin=xmin, ymin=ymin, crs=crs
         )
 
-    @cached_property
-    def lon_range(self):
-        """Return an array containing all the longitudinal points on the grid.
 
-        Returns
-        -------
-        np.array(shape=(nx,), dtype=float)
-        """
-        return np.array([self.xmin + i * self.dx for i in range(self.nx + 1)])
+# Increase this if the processing of the icon cells changes
+ICON_CELLS_CACHE_VERSION = 1
 
-    @cached_property
-    def lat_range(self):
-        """Return an array containing all the latitudinal points on the grid.
 
-        Returns
-        -------
-        np.array(shape=(ny,), dtype=float)
-        """
-        return np.array([self.ymin + j * self.dy for j in range(self.ny + 1)])
+def _antimeridian_triangles(corners: np.ndarray) -> np.ndarray:
+    """Return the polygons of triangular cells, split at the antimeridian.
+
+    The corners of the triangles crossing the antimeridian are first moved
+    on the same side of it. These triangles are then split in a
+    MultiPolygon with parts on both sides of the antimeridian.
+
+    :arg corners: The (lon, lat) of the corners of the triangles,
+        with shape (n, 3, 2). Longitudes are in [-180, 180].
+    """
+    lon = np.array(corners[..., 0], dtype=float)
+    lat = np.array(corners[..., 1], dtype=float)
+
+    # Two corners on the antimeridian: move them to the side of the third one
+    negative = lon < 0
+    on_meridian = np.count_nonzero(lon > 180.0 - 1e-5, axis=1) == 2
+    on_meridian &= negative.any(axis=1)
+    lon = np.where(on_meridian[:, None] & ~negative, lon - 360, lon)
+
+    # Corners far from each other: move the one alone on its side
+    vmin, vmax = -140, 140
+    far = ((lon > vmax) | (lon < vmin)).any(axis=1)
+    alone = (lon * np.roll(lon, 1, axis=1) < 0) & (lon * np.roll(lon, 2, axis=1) < 0)
+    far &= alone.any(axis=1)
+    cells, corner = np.flatnonzero(far), np.argmax(alone[far], axis=1)
+    lon[cells, corner] -= np.copysign(360, lon[cells, corner])
+
+    cells = polygons(np.stack([lon, lat], axis=-1))
+
+    # Split the cells which cross the bounds of the crs
+    crs = pyproj.CRS.from_epsg(WGS84)
+    xmin, ymin, xmax, ymax = crs.area_of_use.bounds
+    bounds_line = box(xmin, ymin, xmax, ymax).exterior
+    to_split = np.flatnonzero(shapely.intersects(cells, bounds_line))
+    parts, owners = [], []
+    for part_box, offset in [
+        (box(xmin, ymin, xmax, ymax), 0.0),
+        (box(xmax, ymin, xmax + 360, ymax), -360.0),
+        (box(xmin - 360, ymin, xmin, ymax), 360.0),
+    ]:
+        part = shapely.intersection(cells[to_split], part_box)
+        keep = (shapely.get_type_id(part) == 3) & (shapely.area(part) > 0)
+        parts.append(shapely.transform(part[keep], lambda c: c + [offset, 0.0]))
+        owners.append(to_split[keep])
+    owners = np.concatenate(owners)
+    if len(owners) == 0:
+        return cells
+    order = np.argsort(owners, kind="stable")
+    return shapely.multipolygons(
+        np.concatenate(parts)[order], indices=owners[order], out=cells.copy()
+    )
 
 
 class ICONGrid(Grid):
@@ -789,15 +1326,41 @@ class ICONGrid(Grid):
     This grid is defined as an unstuctured triangular grid (1D).
     The cells are ordered in a deliberate way and indexed with ascending integer numbers.
     The grid file contains variables like midpoint coordinates etc as a fct of the index.
+
+    The polygons of the cells are created only when they are needed
+    (ex. :py:attr:`gdf`). They are saved as a GeoParquet file in `cache_dir`,
+    with the :py:attr:`~Grid.fingerprint` of the grid in the file name,
+    and read from there by the next instances of the same grid.
+    By default, `cache_dir` is the directory of the weights cache
+    (see :py:func:`~emiproc.weights_cache.get_weights_cache`), such that
+    nothing is written next to the grid file.
+    Saving the cells requires the optional dependency pyarrow.
+
+    A grid limited to a region can be created with :py:meth:`subset`.
     """
 
-    def __init__(self, dataset_path, name: str = None):
+    # Indexes of the cells in the grid file, if the grid is a subset of it
+    global_cells: np.ndarray | None = None
+
+    def __init__(
+        self,
+        dataset_path,
+        name: str = None,
+        cache_dir: PathLike | None = None,
+        cache: bool = True,
+    ):
         """Open the netcdf-dataset and read the relevant grid information.
 
         Parameters
         ----------
         dataset_path : str
         name : str, optional
+        cache_dir : PathLike, optional
+            Where the cells of the grid are cached.
+            Defaults to the directory of the weights cache. If no weights
+            cache is set, the cells are not cached in a file.
+        cache : bool, optional
+            Whether the cells are read from and saved to the cache.
         """
 
         self.dataset_path = Path(dataset_path)
@@ -805,6 +1368,13 @@ class ICONGrid(Grid):
         if name is None:
             name = self.dataset_path.stem
 
+        if cache_dir is None and cache:
+            weights_cache = get_weights_cache()
+            if weights_cache is not None:
+                cache_dir = weights_cache.cache_dir
+        self.cache_dir = None if cache_dir is None else Path(cache_dir)
+        self.cache = cache and self.cache_dir is not None
+
         with Dataset(dataset_path) as dataset:
             self.clon_var = np.rad2deg(dataset["clon"][:])
             self.clat_var = np.rad2deg(dataset["clat"][:])
@@ -821,24 +1391,135 @@ class ICONGrid(Grid):
             corners[:, :, 1] = self.vlat[self.vertex_of_cell - 1].T
             self.corners = corners
 
-        # Initiate a list of polygons, which is updated whenever the polygon of a cell
-        # is called for the first time
-        self.polygons = polygons(self.corners)
-
-        # Create a geopandas df
         # ICON_FILE_CRS = 6422
         # Apparently the crs of icon is not what is written in the nc file.
         ICON_FILE_CRS = WGS84
 
-        self._gdf = gpd.GeoDataFrame(geometry=self.polygons, crs=ICON_FILE_CRS)
-        self.process_overlap_antimeridian()
-
         # Consider the ICON-grid as a 1-dimensional grid where ny=1
         self.nx = self.ncell
         self.ny = 1
 
         super().__init__(name, crs=ICON_FILE_CRS)
 
+    @cached_property
+    def polygons(self) -> np.ndarray:
+        """The triangles of the cells, as given in the grid file."""
+        return polygons(self.corners)
+
+    @Grid.gdf.getter
+    def gdf(self) -> gpd.GeoDataFrame:
+        """Return a geopandas dataframe containing the cells of the grid.
+
+        The cells crossing the antimeridian are split in MultiPolygons.
+        """
+        if not hasattr(self, "_gdf"):
+            self._gdf = self._load_cells()
+        return self._gdf
+
+    @property
+    def cells_as_polylist(self) -> list[Polygon | MultiPolygon]:
+        """Return all the cells as a list of polygons."""
+        return self.gdf.geometry.tolist()
+
+    @property
+    def cells_cache_file(self) -> Path | None:
+        """The GeoParquet file in which the cells are cached.
+
+        None if the cells are not cached in a file.
+        """
+        if self.cache_dir is None:
+            return None
+        return self.cache_dir / (
+            f".emiproc_{self.dataset_path.stem}_cells"
+            f"_v{ICON_CELLS_CACHE_VERSION}_{self.fingerprint[:16]}.parquet"
+        )
+
+    def _load_cells(self) -> gpd.GeoDataFrame:
+        """Read the cells from the cache or create them."""
+        cache_file = self.cells_cache_file
+        if self.cache and cache_file.is_file():
+            try:
+                gdf = gpd.read_parquet(cache_file)
+            except ImportError as e:
+                logger.warning(f"Cannot read the cached cells of {self}: {e}")
+            else:
+                if len(gdf) == self.ncell:
+                    return gdf.set_crs(self.crs, allow_override=True)
+                logger.warning(f"{cache_file} does not match {self}, ignoring it.")
+
+        self.process_overlap_antimeridian()
+        if self.cache:
+            try:
+                cache_file.parent.mkdir(parents=True, exist_ok=True)
+                self._gdf.to_parquet(cache_file)
+            except (ImportError, OSError) as e:
+                logger.warning(f"Cannot cache the cells of {self}: {e}")
+        return self._gdf
+
+    def subset(
+        self,
+        region: BoundingBox | Polygon | MultiPolygon,
+        name: str | None = None,
+    ) -> ICONGrid:
+        """Return the grid of the cells intersecting a region.
+
+        The candidate cells are found from the bounds of their corners, and
+        only the polygons of these cells are created to check the intersection.
+        The arrays of the grid file are indexed to keep the selected cells and
+        their vertices.
+
+        :arg region: A bounding box (xmin, ymin, xmax, ymax) or a polygon,
+            in the crs of the grid.
+        :arg name: The name of the new grid.
+
+        :return: A grid with the cells in the region, in the order of this grid.
+            Its :py:attr:`global_cells` are the indexes of its cells
+            in the grid file.
+        """
+        shape = region if isinstance(region, BaseGeometry) else box(*region)
+        xmin, ymin, xmax, ymax = shape.bounds
+        lon, lat = self.corners[..., 0], self.corners[..., 1]
+        candidates = (lat.max(axis=1) >= ymin) & (lat.min(axis=1) <= ymax)
+        # Cells on the antimeridian have corners on both sides of the globe
+        crossing = lon.max(axis=1) - lon.min(axis=1) > 180
+        candidates &= crossing | ((lon.max(axis=1) >= xmin) & (lon.min(axis=1) <= xmax))
+        candidates = np.flatnonzero(candidates)
+        cells = candidates[
+            shapely.intersects(_antimeridian_triangles(self.corners[candidates]), shape)
+        ]
+        if len(cells) == 0:
+            raise ValueError(f"No cell of {self} is in {region=}.")
+
+        grid = ICONGrid.__new__(ICONGrid)
+        grid.dataset_path = self.dataset_path
+        grid.cache_dir, grid.cache = self.cache_dir, self.cache
+        grid.clon_var = self.clon_var[cells]
+        grid.clat_var = self.clat_var[cells]
+        grid.cell_areas = np.asarray(self.cell_areas)[cells]
+
+        vertex_of_cell = self.vertex_of_cell[:, cells]
+        vertices, inverse = np.unique(vertex_of_cell, return_inverse=True)
+        grid.vlon = self.vlon[vertices - 1]
+        grid.vlat = self.vlat[vertices - 1]
+        grid.vertex_of_cell = inverse.reshape(vertex_of_cell.shape) + 1
+        # The cells outside of the subset are marked with -1
+        cell_of_vertex = self.cell_of_vertex[:, vertices - 1] - 1
+        position = np.minimum(np.searchsorted(cells, cell_of_vertex), len(cells) - 1)
+        grid.cell_of_vertex = np.where(
+            cells[position] == cell_of_vertex, position + 1, -1
+        )
+
+        grid.ncell = len(cells)
+        grid.corners = self.corners[cells]
+        grid.nx, grid.ny = grid.ncell, 1
+        grid.global_cells = (
+            cells if self.global_cells is None else self.global_cells[cells]
+        )
+        if name is None:
+            name = f"{self.name}_subset"
+        Grid.__init__(grid, name, crs=self.crs)
+        return grid
+
     def _cell_corners(self, n):
         """Internal cell corners"""
 
@@ -881,82 +1562,9 @@ class ICONGrid(Grid):
         """Find polygons intersecting the antimeridian line
         and split them into two polygons represented by a
         MultiPolygon.
-        """
 
-        def shift_lon_poly(poly):
-            coords = poly.exterior.coords
-            lons = np.array([coord[0] for coord in coords])
-            lats = [coord[1] for coord in coords]
-            if np.any(lons > 180):
-                lons -= 360
-            elif np.any(lons < -180):
-                lons += 360
-            return Polygon([*zip(lons, lats)])
-
-        def detect_antimeridian_poly(poly):
-            coords = poly.exterior.coords
-            lon1, lon2, lon3 = coords[0][0], coords[1][0], coords[2][0]
-            coords_cond1 = [list(c) for c in coords[:-1]]
-
-            cond1 = np.count_nonzero(np.array([lon1, lon2, lon3]) > 180.0 - 1e-5) == 2
-            if cond1:
-                if lon1 < 0:
-                    coords_cond1[1][0] = lon2 - 360
-                    coords_cond1[2][0] = lon3 - 360
-                elif lon2 < 0:
-                    coords_cond1[0][0] = lon1 - 360
-                    coords_cond1[2][0] = lon3 - 360
-                elif lon3 < 0:
-                    coords_cond1[0][0] = lon1 - 360
-                    coords_cond1[1][0] = lon2 - 360
-
-            vmin = -140
-            vmax = 140
-            lon1, lon2, lon3 = (
-                coords_cond1[0][0],
-                coords_cond1[1][0],
-                coords_cond1[2][0],
-            )
-            cond2 = (
-                (lon1 > vmax or lon1 < vmin)
-                or (lon2 > vmax or lon2 < vmin)
-                or (lon3 > vmax or lon3 < vmin)
-            )
-            coords_cond2 = [list(c) for c in coords_cond1]
-
-            if cond2:
-                if lon1 * lon2 < 0 and lon1 * lon3 < 0:
-                    coords_cond2[0][0] = lon1 - math.copysign(1, lon1) * 360
-
-                elif lon2 * lon1 < 0 and lon2 * lon3 < 0:
-                    coords_cond2[1][0] = lon2 - math.copysign(1, lon2) * 360
-
-                elif lon3 * lon1 < 0 and lon3 * lon2 < 0:
-                    coords_cond2[2][0] = lon3 - math.copysign(1, lon3) * 360
-
-            return Polygon(coords_cond2)
-
-        crs = pyproj.CRS.from_epsg(WGS84)
-        bounds = crs.area_of_use.bounds
-
-        xx_bounds, yy_bounds = box(*bounds).exterior.coords.xy
-        coords_bounds = [(x, y) for x, y in zip(xx_bounds, yy_bounds)]
-        bounds_line = LineString(coords_bounds)
-
-        self._gdf = self.gdf.set_geometry(
-            self.gdf.geometry.apply(lambda poly: detect_antimeridian_poly(poly))
-        )
-        gdf_inter = self._gdf.loc[self.gdf.intersects(bounds_line)]
-        gdf_inter = gdf_inter.set_geometry(
-            gdf_inter.geometry.apply(
-                lambda poly: MultiPolygon(split(poly, bounds_line))
-            )
-        )
-        gdf_inter = gdf_inter.set_geometry(
-            gdf_inter.geometry.apply(
-                lambda mpoly: MultiPolygon(
-                    [shift_lon_poly(poly) for poly in mpoly.geoms]
-                )
-            )
+        The cells are created from :py:attr:`corners`.
+        """
+        self._gdf = gpd.GeoDataFrame(
+            geometry=_antimeridian_triangles(self.corners), crs=self.crs
         )
-        self._gdf.loc[gdf_inter.index, "geometry"] = gdf_inter.geometry
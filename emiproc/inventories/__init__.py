@@ -11,12 +11,15 @@ from dataclasses import dataclass
 from os import PathLike
 from typing import NewType, Union
 
+import dask.array as dask_array
 import geopandas as gpd
 import numpy as np
 import pandas as pd
+import shapely
 import xarray as xr
+from scipy.sparse import csr_array, issparse, vstack
 
-from emiproc.grids import GeoPandasGrid, Grid
+from emiproc.grids import BoundingBox, GeoPandasGrid, Grid, RegularGrid
 from emiproc.profiles import naming
 from emiproc.profiles.temporal_profiles import (
     AnyTimeProfile,
@@ -29,6 +32,7 @@ from emiproc.profiles.vertical_profiles import (
     VerticalProfiles,
     resample_vertical_profiles,
 )
+from emiproc.utils.chunks import chunk_cells, combine_chunks
 
 # Represent a substance that is emitted and can be present in a dataset.
 Substance = NewType("Substance", str)
@@ -40,6 +44,99 @@ CatSub = tuple[Category, Substance]
 TemporalProfiles = Union[list[list[TemporalProfile]], CompositeTemporalProfiles]
 
 
+def _pandas_copy_on_write() -> bool:
+    """Whether pandas copies the data shared by shallow copies when it is modified."""
+    if int(pd.__version__.split(".")[0]) >= 3:
+        return True
+    return pd.options.mode.copy_on_write is True
+
+
+def _copy_frame(df: pd.DataFrame, deep: bool = False) -> pd.DataFrame:
+    """Copy a (Geo)DataFrame, sharing its data if pandas uses copy-on-write."""
+    return df.copy(deep=deep or not _pandas_copy_on_write())
+
+
+class _Sharing:
+    """Count of the objects sharing some data.
+
+    An object sharing the data with others copies it before modifying it
+    (copy-on-write), such that the others are not changed.
+    """
+
+    def __init__(self) -> None:
+        self.count = 1
+
+    @property
+    def is_shared(self) -> bool:
+        return self.count > 1
+
+    def join(self) -> _Sharing:
+        """Share the data with one more object."""
+        self.count += 1
+        return self
+
+    def leave(self) -> _Sharing:
+        """Stop sharing the data, after copying it. Return the new sharing."""
+        self.count -= 1
+        return _Sharing()
+
+
+class _SharedAttribute:
+    """Attribute of an inventory which can be shared with its copies.
+
+    Reading the value does not copy it. As the profiles indexes can be
+    modified in place, they are read as a read-only view while they are
+    shared. The code modifying the value in place gets it with :py:meth:`own`,
+    which copies it if it is shared (copy-on-write).
+    """
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self.name = name
+
+    def __get__(self, inv: Inventory | None, owner: type | None = None):
+        if inv is None:
+            return self
+        value = inv.__dict__.get(self.name)
+        if (
+            self._is_shared(inv)
+            and isinstance(value, xr.DataArray)
+            and isinstance(value.data, np.ndarray)
+        ):
+            data = value.data.view()
+            data.flags.writeable = False
+            value = value.copy(deep=False, data=data)
+        return value
+
+    def __set__(self, inv: Inventory, value) -> None:
+        inv.__dict__[self.name] = value
+        sharing = inv.__dict__.setdefault("_sharing", {}).pop(self.name, None)
+        if sharing is not None:
+            sharing.leave()
+
+    def _is_shared(self, inv: Inventory) -> bool:
+        sharing = inv.__dict__.get("_sharing", {}).get(self.name)
+        return sharing is not None and sharing.is_shared
+
+    def own(self, inv: Inventory):
+        """Return the value of `inv`, which can be modified in place.
+
+        The value is copied if it is shared with other inventories.
+        """
+        value = inv.__dict__.get(self.name)
+        if value is not None and self._is_shared(inv):
+            value = value.copy()
+            self.__set__(inv, value)
+        return value
+
+    def share(self, inv: Inventory, other: Inventory) -> None:
+        """Share the value of `inv` with `other`, without copying it."""
+        other.__dict__[self.name] = inv.__dict__.get(self.name)
+        sharing = inv.__dict__.setdefault("_sharing", {}).setdefault(
+            self.name, _Sharing()
+        )
+        other.__dict__.setdefault("_sharing", {})[self.name] = sharing.join()
+
+
 @dataclass
 class EmissionInfo:
     """Information about an emission category.
@@ -72,6 +169,322 @@ class EmissionInfo:
     comment: str = ""
 
 
+class EmissionsArray:
+    """Emissions of the cells of an inventory, stored in a single array.
+
+    This is an alternative storage of :py:attr:`Inventory.gdf` .
+    Each row of the array contains the emissions of a (category, substance)
+    in all the cells, such that the operators work on one contiguous array
+    instead of the columns of a GeoDataFrame.
+
+    Copies share the dense values. Writing a column with
+    :py:meth:`__setitem__` or scaling in place copies the values first
+    if they are shared (copy-on-write).
+
+    The values can also be a sparse array, in which each row stores
+    only the cells with emissions. This saves memory for inventories with
+    many columns emitting in only a few cells (ex. point sources, or
+    categories limited to a region). Use :py:meth:`to_sparse` to convert
+    the values. The operators keep the values sparse and the columns are
+    made dense only when they are read, ex. at the export.
+
+    For inventories not fitting in memory, the values can be a dask array
+    chunked over the cells, ex. read from a file opened with chunks or
+    created with :py:meth:`chunk` . The operators and the remapping are then
+    applied chunk by chunk when the values are computed, and the exporters
+    write the columns chunk by chunk. This runs on any dask scheduler,
+    ex. ``dask.config.set(scheduler="processes")`` .
+    Steps checking the values (ex. dropping the columns without emissions
+    when grouping) compute a reduction over the chunks.
+
+    :param values: The emissions, with shape (n_columns, n_cells).
+    :param columns: The (category, substance) of each row of `values`.
+    :param geometry: The geometry of each cell.
+    """
+
+    values: np.ndarray | csr_array | dask_array.Array
+    columns: list[CatSub]
+    geometry: gpd.GeoSeries
+
+    def __init__(
+        self,
+        values: np.ndarray | csr_array | dask_array.Array,
+        columns: list[CatSub],
+        geometry: gpd.GeoSeries,
+    ) -> None:
+        columns = [tuple(col) for col in columns]
+        if issparse(values):
+            values = csr_array(values, dtype=float)
+        elif isinstance(values, dask_array.Array):
+            # All the columns of a cell are in the same chunk
+            values = values.astype(float).rechunk({0: -1})
+        else:
+            values = np.asarray(values, dtype=float)
+            if values.size == 0:
+                values = values.reshape(len(columns), len(geometry))
+        if values.shape != (len(columns), len(geometry)):
+            raise ValueError(
+                f"The shape of the values {values.shape} does not match"
+                f" {len(columns)=} and {len(geometry)=}"
+            )
+        self._positions = {col: i for i, col in enumerate(columns)}
+        if len(self._positions) != len(columns):
+            raise ValueError(f"Duplicated columns in {columns}")
+
+        self.values = values
+        self.columns = columns
+        self.geometry = geometry
+        self._sharing = _Sharing()
+
+    def __repr__(self) -> str:
+        storage = ", sparse" if self.is_sparse else ""
+        if self.is_chunked:
+            storage = f", chunks of {self.values.chunksize[1]} cells"
+        return (
+            f"EmissionsArray({len(self.columns)} columns,"
+            f" {len(self.geometry)} cells{storage})"
+        )
+
+    def __contains__(self, column: CatSub) -> bool:
+        return column in self._positions
+
+    def __getitem__(self, column: CatSub) -> np.ndarray | dask_array.Array:
+        """Return the emissions of a (category, substance) in all the cells.
+
+        The column of chunked values is a lazy dask array.
+        """
+        position = self._positions[column]
+        if self.is_sparse:
+            return self.values[[position]].toarray()[0]
+        return self.values[position]
+
+    def __setitem__(self, column: CatSub, values: np.ndarray | float):
+        """Set the emissions of a (category, substance) in all the cells.
+
+        The column is added if it is not in the array.
+        """
+        column = tuple(column)
+        position = self._positions.get(column)
+        if self.is_chunked:
+            row = dask_array.broadcast_to(
+                dask_array.asarray(values, dtype=float), (1, len(self.geometry))
+            ).rechunk(((1,), self.values.chunks[1]))
+            if position is None:
+                blocks = [self.values, row]
+            else:
+                blocks = [self.values[:position], row, self.values[position + 1 :]]
+            self.values = dask_array.concatenate(blocks).rechunk({0: -1})
+        elif self.is_sparse:
+            row = csr_array(self._dense_row(values))
+            row.eliminate_zeros()
+            if position is None:
+                blocks = [self.values, row]
+            else:
+                blocks = [
+                    self.values[:position],
+                    row,
+                    self.values[position + 1 :],
+                ]
+            self.values = vstack(blocks, format="csr")
+        elif position is None:
+            self.values = np.concatenate([self.values, self._dense_row(values)])
+        else:
+            self._own_values()
+            self.values[position] = self._dense_row(values)[0]
+        if position is None:
+            self._positions[column] = len(self.columns)
+            self.columns = self.columns + [column]
+
+    def _dense_row(self, values: np.ndarray | float) -> np.ndarray:
+        """Broadcast the values of a column to a row of shape (1, n_cells)."""
+        return np.broadcast_to(np.asarray(values, dtype=float), (1, len(self.geometry)))
+
+    @property
+    def is_sparse(self) -> bool:
+        return issparse(self.values)
+
+    @property
+    def is_chunked(self) -> bool:
+        """Whether the values are a dask array chunked over the cells."""
+        return isinstance(self.values, dask_array.Array)
+
+    def _own_values(self):
+        """Copy the values if they are shared with other arrays."""
+        if isinstance(self.values, np.ndarray) and (
+            self._sharing.is_shared or not self.values.flags.writeable
+        ):
+            self.values = self.values.copy()
+            self._sharing = self._sharing.leave()
+
+    @property
+    def categories(self) -> list[Category]:
+        return list(dict.fromkeys(cat for cat, _ in self.columns))
+
+    @property
+    def substances(self) -> list[Substance]:
+        return list(dict.fromkeys(sub for _, sub in self.columns))
+
+    def select(self, columns: list[CatSub]) -> EmissionsArray:
+        """Return a new array with only the given columns, in that order."""
+        positions = [self._positions[tuple(col)] for col in columns]
+        return EmissionsArray(self.values[positions], columns, self.geometry)
+
+    def select_cells(self, cells: slice | np.ndarray) -> EmissionsArray:
+        """Return a new array with only the given cells.
+
+        :arg cells: The positions of the cells, or a slice of them.
+            With a slice, dense values are a view of the values of this array
+            and are copied only when written (copy-on-write).
+        """
+        emissions = EmissionsArray(
+            self.values[:, cells],
+            self.columns,
+            self.geometry.iloc[cells].reset_index(drop=True),
+        )
+        if isinstance(self.values, np.ndarray) and np.may_share_memory(
+            emissions.values, self.values
+        ):
+            emissions._sharing = self._sharing.join()
+        return emissions
+
+    def copy(self, deep: bool = True) -> EmissionsArray:
+        """Copy the emissions.
+
+        :arg deep: Whether to copy the values. Otherwise the values are shared
+            and are copied only when written (copy-on-write).
+            The geometry is always shared, as it is not modified.
+        """
+        if deep:
+            return EmissionsArray(self.values.copy(), self.columns, self.geometry)
+        emissions = EmissionsArray(self.values, self.columns, self.geometry)
+        # Sparse and chunked values are never written, as any change creates
+        # new arrays, but the count is kept for all of them
+        emissions._sharing = self._sharing.join()
+        return emissions
+
+    def to_sparse(self) -> EmissionsArray:
+        """Return the same emissions with sparse values."""
+        values = csr_array(self.to_dense().values, dtype=float)
+        values.eliminate_zeros()
+        return EmissionsArray(values, self.columns, self.geometry)
+
+    def to_dense(self) -> EmissionsArray:
+        """Return the same emissions with dense values in memory.
+
+        Chunked values are computed.
+        """
+        if self.is_sparse:
+            values = self.values.toarray()
+        elif self.is_chunked:
+            values = self.values.compute()
+        else:
+            return self.copy(deep=False)
+        return EmissionsArray(values, self.columns, self.geometry)
+
+    def chunk(self, cells: int) -> EmissionsArray:
+        """Return the same emissions as a dask array chunked over the cells.
+
+        :arg cells: The number of cells in each chunk.
+        """
+        values = (
+            self.values.rechunk({1: cells})
+            if self.is_chunked
+            else chunk_cells(self.values, cells)
+        )
+        return EmissionsArray(values, self.columns, self.geometry)
+
+    def totals(self) -> np.ndarray:
+        """Return the total emissions of each column, skipping missing values."""
+        if self.is_sparse:
+            values = self.values.copy()
+            values.data = np.nan_to_num(values.data, nan=0.0)
+            return np.asarray(values.sum(axis=1)).reshape(-1)
+        return np.asarray(np.nansum(self.values, axis=1))
+
+    def nonzero_columns(self) -> np.ndarray:
+        """Return a mask of the columns with emissions in any cell."""
+        return np.asarray((self.values != 0).sum(axis=1)).reshape(-1) > 0
+
+    def nonzero_cells(self) -> np.ndarray:
+        """Return a mask of the cells with emissions in any column."""
+        return np.asarray((self.values != 0).sum(axis=0)).reshape(-1) > 0
+
+    def scale(self, factors: np.ndarray, inplace: bool = False) -> EmissionsArray:
+        """Return the emissions multiplied by some factors.
+
+        :arg factors: The factors, broadcastable to (n_columns, n_cells).
+            Ex. an array of shape (n_columns, 1) scales each column.
+        :arg inplace: Whether to multiply the values of this array in place.
+            Sparse and chunked values are always replaced by new ones.
+        """
+        if inplace:
+            if self.is_sparse:
+                self.values = csr_array(self.values.multiply(factors))
+            elif self.is_chunked:
+                self.values = self.values * factors
+            else:
+                self._own_values()
+                self.values *= factors
+            return self
+        if self.is_sparse:
+            values = self.values.multiply(factors)
+        else:
+            values = self.values * factors
+        return EmissionsArray(values, self.columns, self.geometry)
+
+    def combine(
+        self, matrix: csr_array | np.ndarray, columns: list[CatSub]
+    ) -> EmissionsArray:
+        """Return linear combinations of the columns.
+
+        :arg matrix: The coefficients, of shape (len(columns), n_columns).
+            Row i gives the coefficients of the columns summed in column i.
+        :arg columns: The (category, substance) of the new columns.
+        """
+        if self.is_chunked:
+            values = combine_chunks(matrix, self.values)
+        else:
+            values = csr_array(matrix) @ self.values
+        return EmissionsArray(values, columns, self.geometry)
+
+    @classmethod
+    def from_gdf(cls, gdf: gpd.GeoDataFrame) -> EmissionsArray:
+        """Read the emissions of a gdf following the inventory definition."""
+        columns = [
+            col
+            for col, dtype in gdf.dtypes.items()
+            if not isinstance(dtype, gpd.array.GeometryDtype)
+        ]
+        values = np.array(gdf[columns].to_numpy(dtype=float).T, order="C")
+        return cls(values, columns, gdf.geometry)
+
+    def to_frame(self) -> pd.DataFrame:
+        """Return the emissions as a DataFrame, without the geometry.
+
+        The DataFrame shares the memory of the values, unless they are sparse
+        or chunked.
+        """
+        return pd.DataFrame(
+            self.to_dense().values.T,
+            index=self.geometry.index,
+            columns=pd.MultiIndex.from_tuples(self.columns) if self.columns else None,
+            copy=False,
+        )
+
+    def to_gdf(self) -> gpd.GeoDataFrame:
+        """Return the emissions as a gdf following the inventory definition.
+
+        The gdf shares the memory of the values, unless they are sparse
+        or shared with other arrays.
+        """
+        frame = self.to_frame()
+        if isinstance(self.values, np.ndarray) and (
+            self._sharing.is_shared or not self.values.flags.writeable
+        ):
+            frame = frame.copy()
+        return gpd.GeoDataFrame(frame, geometry=self.geometry, crs=self.geometry.crs)
+
+
 class Inventory:
     """Parent class for inventories.
 
@@ -92,6 +505,10 @@ class Inventory:
         The geometry column contains geometric objects for all the grid cells.
         The other columns should contain the emission value for the substances
         and the categories.
+    :param emissions: The same emissions as :py:attr:`gdf`, stored in an
+        :py:class:`EmissionsArray` . Inventories can store their emissions
+        in either of the two, the other one being created from it when
+        accessed.
 
     :param gdfs: Some inventories are given on more than one grid.
         For example, :py:class:`MapLuftZurich` is given on a grid
@@ -128,15 +545,16 @@ class Inventory:
     categories: list[Category]
     emission_infos: dict[Category, EmissionInfo]
 
-    gdf: gpd.GeoDataFrame | None
+    _gdf: gpd.GeoDataFrame | None = None
+    _emissions: EmissionsArray | None = None
     gdfs: dict[str, gpd.GeoDataFrame]
     geometry: gpd.GeoSeries
 
-    v_profiles: VerticalProfiles | None = None
-    v_profiles_indexes: xr.DataArray | None = None
+    v_profiles: VerticalProfiles | None = _SharedAttribute()
+    v_profiles_indexes: xr.DataArray | None = _SharedAttribute()
 
-    t_profiles_groups: TemporalProfiles | None = None
-    t_profiles_indexes: xr.DataArray | None = None
+    t_profiles_groups: TemporalProfiles | None = _SharedAttribute()
+    t_profiles_indexes: xr.DataArray | None = _SharedAttribute()
 
     logger: logging.Logger
     history: list[str]
@@ -151,6 +569,50 @@ class Inventory:
     def __repr__(self) -> str:
         return f"Inventory({self.name})"
 
+    @property
+    def gdf(self) -> gpd.GeoDataFrame | None:
+        """The emissions of the cells, as a gdf.
+
+        If the inventory stores an :py:attr:`emissions` array, the gdf is
+        built from it at each access and the array stays the storage.
+        The gdf shares the memory of dense values, but adding or replacing
+        columns of the gdf does not change the inventory:
+        set the :py:attr:`emissions` or assign the modified gdf instead.
+        """
+        if self._emissions is not None:
+            if self._emissions.is_chunked:
+                self.logger.warning(
+                    f"Computing the gdf of the chunked emissions of {self}."
+                )
+            return self._emissions.to_gdf()
+        return self._gdf
+
+    @gdf.setter
+    def gdf(self, gdf: gpd.GeoDataFrame | None):
+        self._gdf = gdf
+        self._emissions = None
+
+    @property
+    def emissions(self) -> EmissionsArray | None:
+        """The emissions of the cells, as an :py:class:`EmissionsArray` .
+
+        If the inventory stores a gdf, the array is read from it at
+        each access. Its values are read-only, such that writing them fails
+        instead of not changing the inventory.
+        """
+        if self._emissions is not None:
+            return self._emissions
+        if self._gdf is None:
+            return None
+        emissions = EmissionsArray.from_gdf(self._gdf)
+        emissions.values.flags.writeable = False
+        return emissions
+
+    @emissions.setter
+    def emissions(self, emissions: EmissionsArray | None):
+        self._emissions = emissions
+        self._gdf = None
+
     @property
     def emission_infos(self) -> dict[Category, EmissionInfo]:
         if hasattr(self, "_emission_infos"):
@@ -170,8 +632,13 @@ class Inventory:
         self._emission_infos = emission_infos
 
     @property
-    def geometry(self) -> gpd.GeoSeries:
-        return self.gdf.geometry
+    def geometry(self) -> gpd.GeoSeries | None:
+        """The geometry of the cells, None if the inventory has only gdfs."""
+        if self._emissions is not None:
+            return self._emissions.geometry
+        if self._gdf is None:
+            return None
+        return self._gdf.geometry
 
     @property
     def cell_areas(self) -> np.ndarray:
@@ -192,44 +659,32 @@ class Inventory:
 
     @cell_areas.setter
     def cell_areas(self, cell_areas):
-        if len(cell_areas) != len(self.gdf):
+        if len(cell_areas) != len(self.geometry):
             raise ValueError(
-                f"size does not match, got {len(cell_areas) }, expected {len(self.gdf)}"
+                f"size does not match, got {len(cell_areas) }, expected"
+                f" {len(self.geometry)}"
             )
 
         self._cell_area = cell_areas
 
     @property
     def crs(self) -> int | None:
-        if self.gdf is not None:
-            return self.gdf.crs
+        if self._emissions is not None:
+            return self._emissions.geometry.crs
+        elif self._gdf is not None:
+            return self._gdf.crs
         else:
             return self.gdfs[list(self.gdfs.keys())[0]].crs
 
     @property
     def categories(self) -> list[str]:
-        return list(
-            set(
-                [
-                    cat
-                    for cat, _ in (self.gdf.columns if self.gdf is not None else [])
-                    if not isinstance(self.gdf[(cat, _)].dtype, gpd.array.GeometryDtype)
-                ]
-            )
-            | set(self.gdfs.keys())
-        )
+        return list(set([cat for cat, _ in self._gdf_columns]) | set(self.gdfs.keys()))
 
     @property
     def substances(self) -> list[Substance]:
         # Unique substances in the inventories
         subs = list(
-            set(
-                [
-                    sub
-                    for _, sub in (self.gdf.columns if self.gdf is not None else [])
-                    if not isinstance(self.gdf[(_, sub)].dtype, gpd.array.GeometryDtype)
-                ]
-            )
+            set([sub for _, sub in self._gdf_columns])
             | set(sum([gdf.keys().to_list() for gdf in self.gdfs.values()], []))
         )
         if "geometry" in subs:
@@ -247,11 +702,24 @@ class Inventory:
 
         return pd.DataFrame(get_total_emissions(self)).T
 
-    def copy(self, no_gdfs: bool = False, profiles: bool = True) -> Inventory:
+    def copy(
+        self, no_gdfs: bool = False, profiles: bool = True, deep: bool = False
+    ) -> Inventory:
         """Copy the inventory.
 
+        By default, the copy shares the data of the inventory (copy-on-write):
+
+        * The gdfs share their columns, which pandas copies when modified
+          (always with pandas >= 3, else only if its copy-on-write mode is
+          enabled, otherwise the gdfs are deep copied).
+        * The values of the :py:attr:`emissions` are shared and copied
+          when a column is set.
+        * The profiles and their indexes are shared. While shared, the
+          indexes are read-only and :py:meth:`set_profile` copies them.
+
         :arg no_gdfs: Whether the gdfs should not be copied (main gdf and the gdfs).
         :arg profiles: Whether the profiles should be copied.
+        :arg deep: Whether to copy all the data instead of sharing it.
         """
         inv = Inventory()
         inv.__class__ = self.__class__
@@ -260,20 +728,28 @@ class Inventory:
         if hasattr(self, "grid"):
             inv.grid = self.grid
 
-        if profiles and self.v_profiles is not None:
-            inv.v_profiles = self.v_profiles.copy()
-            inv.v_profiles_indexes = self.v_profiles_indexes.copy()
-        if profiles and self.t_profiles_groups is not None:
-            inv.t_profiles_groups = self.t_profiles_groups.copy()
-            inv.t_profiles_indexes = self.t_profiles_indexes.copy()
-
-        if no_gdfs or self.gdf is None:
+        for profiles_name, indexes_name in [
+            ("v_profiles", "v_profiles_indexes"),
+            ("t_profiles_groups", "t_profiles_indexes"),
+        ]:
+            if not profiles or self.__dict__.get(profiles_name) is None:
+                continue
+            for name in [profiles_name, indexes_name]:
+                if deep:
+                    value = self.__dict__.get(name)
+                    setattr(inv, name, None if value is None else value.copy())
+                else:
+                    getattr(Inventory, name).share(self, inv)
+
+        if no_gdfs or (self._gdf is None and self._emissions is None):
             inv.gdf = None
+        elif self._emissions is not None:
+            inv.emissions = self._emissions.copy(deep=deep)
         else:
-            inv.gdf = self.gdf.copy(deep=True)
+            inv.gdf = _copy_frame(self._gdf, deep)
 
         if self.gdfs and not no_gdfs:
-            inv.gdfs = {key: gdf.copy(deep=True) for key, gdf in self.gdfs.items()}
+            inv.gdfs = {key: _copy_frame(gdf, deep) for key, gdf in self.gdfs.items()}
         else:
             inv.gdfs = {}
 
@@ -303,12 +779,14 @@ class Inventory:
     @property
     def _gdf_columns(self) -> list[tuple[str, Substance]]:
         """All the columsn but not the geometric columns."""
-        if self.gdf is None:
+        if self._emissions is not None:
+            return list(self._emissions.columns)
+        if self._gdf is None:
             return []
         return [
             col
-            for col in self.gdf.columns
-            if not isinstance(self.gdf[col].dtype, gpd.array.GeometryDtype)
+            for col, dtype in self._gdf.dtypes.items()
+            if not isinstance(dtype, gpd.array.GeometryDtype)
         ]
 
     def to_crs(self, *args, **kwargs):
@@ -316,8 +794,10 @@ class Inventory:
 
         Perform the conversion in place.
         """
-        if self.gdf is not None:
-            self.gdf.to_crs(*args, **kwargs, inplace=True)
+        if self._emissions is not None:
+            self._emissions.geometry = self._emissions.geometry.to_crs(*args, **kwargs)
+        elif self._gdf is not None:
+            self._gdf.to_crs(*args, **kwargs, inplace=True)
         for gdf in self.gdfs.values():
             gdf.to_crs(*args, **kwargs, inplace=True)
 
@@ -326,8 +806,10 @@ class Inventory:
 
         Perform the conversion in place.
         """
-        if self.gdf is not None:
-            self.gdf.set_crs(*args, **kwargs, inplace=True)
+        if self._emissions is not None:
+            self._emissions.geometry = self._emissions.geometry.set_crs(*args, **kwargs)
+        elif self._gdf is not None:
+            self._gdf.set_crs(*args, **kwargs, inplace=True)
         for gdf in self.gdfs.values():
             gdf.set_crs(*args, **kwargs, inplace=True)
 
@@ -361,6 +843,76 @@ class Inventory:
         # Now we can append
         self.gdfs[category] = pd.concat((self.gdfs[category], gdf), ignore_index=True)
 
+    def window(self, bbox: BoundingBox) -> Inventory:
+        """Return the part of the inventory inside a bounding box.
+
+        The inventory must be on a :py:class:`~emiproc.grids.RegularGrid`.
+        The cells of the window are found from the parameters of the grid
+        (see :py:meth:`~emiproc.grids.RegularGrid.window`), and the emissions
+        and the profiles indexes of these cells are sliced, without any
+        geometric operation.
+        Contrary to :py:func:`~emiproc.inventories.utils.crop_with_shape`,
+        the cells at the boundary of the box are kept entirely.
+
+        The shapes of the gdfs are kept if their centroid is in a cell of the
+        window.
+
+        :arg bbox: The (xmin, ymin, xmax, ymax) of the window, in the crs
+            of the inventory.
+        """
+        grid = getattr(self, "grid", None)
+        if not isinstance(grid, RegularGrid):
+            raise TypeError(f"{self} must be on a RegularGrid, not {grid}.")
+        if self.geometry is not None and len(self.geometry) != len(grid):
+            raise ValueError(
+                f"The emissions of {self} have {len(self.geometry)} cells, "
+                f"but its grid has {len(grid)}."
+            )
+
+        window_grid, cells = grid.window(bbox)
+        rows = cells
+        if cells[-1] - cells[0] + 1 == len(cells):
+            # The window is made of full columns of the grid
+            rows = slice(cells[0], cells[-1] + 1)
+
+        inv = self.copy(no_gdfs=True, profiles=False)
+        inv.grid = window_grid
+        if self._emissions is not None:
+            inv.emissions = self._emissions.select_cells(rows)
+        elif self._gdf is not None:
+            inv.gdf = self._gdf.iloc[rows].reset_index(drop=True)
+        if hasattr(self, "_cell_area"):
+            inv._cell_area = np.asarray(self._cell_area)[rows]
+
+        for cat, gdf in self.gdfs.items():
+            centroids = shapely.centroid(gdf.geometry.to_numpy())
+            located = grid.locate(shapely.get_x(centroids), shapely.get_y(centroids))
+            mask = np.isin(located, cells)
+            if np.any(mask):
+                inv.gdfs[cat] = gdf.loc[mask].reset_index(drop=True)
+
+        for index_name, profiles_name in [
+            ("t_profiles_indexes", "t_profiles_groups"),
+            ("v_profiles_indexes", "v_profiles"),
+        ]:
+            profiles = getattr(self, profiles_name)
+            if profiles is None:
+                continue
+            indexes = getattr(self, index_name)
+            if "cell" in indexes.dims:
+                indexes = indexes.sel(cell=np.isin(indexes["cell"], cells))
+                # Cells are numbered as in the window grid
+                indexes = indexes.assign_coords(
+                    cell=np.searchsorted(cells, indexes["cell"].to_numpy())
+                )
+            else:
+                indexes = indexes.copy()
+            setattr(inv, profiles_name, profiles.copy())
+            setattr(inv, index_name, indexes)
+
+        inv.history.append(f"Windowed with {bbox=}")
+        return inv
+
     def set_profile(
         self,
         profile: VerticalProfile | list[TemporalProfile],
@@ -384,7 +936,7 @@ class Inventory:
         """
 
         if isinstance(profile, VerticalProfile):
-            indexes_array = self.v_profiles_indexes
+            indexes_array = Inventory.v_profiles_indexes.own(self)
             if self.v_profiles is None:
                 # Set the profile for the first time
                 self.v_profiles = VerticalProfiles(
@@ -398,10 +950,10 @@ class Inventory:
             profiles = self.v_profiles
         elif isinstance(profile, list):
             # Temporal profiles
-            indexes_array = self.t_profiles_indexes
+            indexes_array = Inventory.t_profiles_indexes.own(self)
             if self.t_profiles_groups is None:
                 self.t_profiles_groups = []
-            self.t_profiles_groups.append(profile)
+            Inventory.t_profiles_groups.own(self).append(profile)
 
             profiles = self.t_profiles_groups
         else:
@@ -0,0 +1,353 @@
+"""Lazy processing of inventories.
+
+The operators applied on a :py:class:`LazyInventory` only record what they
+do to the emissions, and :py:meth:`LazyInventory.execute` computes all the
+recorded steps in a single pass.
+"""
+
+from __future__ import annotations
+
+import copy
+import logging
+from typing import TYPE_CHECKING, Callable
+
+import dask.array as dask_array
+import geopandas as gpd
+import numpy as np
+from scipy.sparse import csr_array, eye_array, hstack, issparse, vstack
+
+from emiproc.inventories import CatSub, EmissionsArray, Inventory
+from emiproc.utils.chunks import combine_chunks, remap_chunks
+
+if TYPE_CHECKING:
+    from emiproc.grids import Grid
+
+logger = logging.getLogger("emiproc.inventories.lazy")
+
+
+def _dummy_cells(n_cells: int, crs) -> gpd.GeoSeries:
+    """Points used as the cells of the inventories used for planning."""
+    return gpd.GeoSeries(
+        gpd.points_from_xy(np.arange(n_cells, dtype=float), np.zeros(n_cells)),
+        crs=crs,
+    )
+
+
+class LazyInventory:
+    """An inventory whose processing is recorded instead of computed.
+
+    Calling :py:func:`~emiproc.inventories.utils.drop`,
+    :py:func:`~emiproc.inventories.utils.group_categories`,
+    :py:func:`~emiproc.inventories.utils.scale_inventory`,
+    :py:func:`~emiproc.speciation.speciate`,
+    :py:func:`~emiproc.speciation.speciate_inventory` or
+    :py:func:`~emiproc.regrid.remap_inventory` on a lazy inventory returns
+    a new lazy inventory with the step added to the plan.
+
+    .. code-block:: python
+
+        lazy_inv = LazyInventory(inv)
+        lazy_inv = drop(lazy_inv, categories=["na"])
+        lazy_inv = group_categories(lazy_inv, CH_2_GNFR)
+        lazy_inv = remap_inventory(lazy_inv, grid)
+        inv_on_grid = lazy_inv.execute()
+
+    All these steps are linear. The emissions of the output are the sum
+    over the sources (the emissions of the inventory and the additional
+    gdfs remapped on the grids) of ``coefficients @ values @ weights.T``.
+    The coefficients combine the columns of the sources
+    and the weights remap their cells on the grid.
+    :py:meth:`execute` computes this product once, only for the
+    requested columns.
+
+    The steps are also applied to a small inventory storing the total
+    emissions of each column in a single cell. It keeps the columns,
+    the profiles, the additional gdfs and the history of the output, such that
+    the profiles are updated without processing the emissions.
+
+    Emissions chunked over the cells stay chunked: the coefficients and the
+    weights are applied chunk by chunk. Steps reading the gdf of the
+    inventory, like the speciation, only see the small inventory of the
+    totals, such that they can be used on chunked emissions.
+
+    The steps depending on each cell cannot be recorded: scaling factors
+    given per cell, speciation ratios depending on the country, remapping
+    with an emissions mask, or any step if the profiles depend on the cell.
+    The plan is then executed and the step is applied directly.
+
+    :arg inv: The inventory to process.
+    """
+
+    # Inventory with the totals of the columns in a single cell
+    _meta: Inventory
+    # The emissions values of each source and their weights on the grid
+    _sources: list[tuple[np.ndarray | csr_array | dask_array.Array, csr_array | None]]
+    # Shape (n_columns, total number of rows of the sources)
+    _coefficients: csr_array
+    _geometry: gpd.GeoSeries | None
+
+    # Names of the recorded operators
+    steps: list[str]
+
+    def __init__(self, inv: Inventory):
+        # Shares the values of the inventory, which are not modified
+        self._meta = inv.copy()
+        # Internal copies are not part of the history
+        self._meta.history = list(inv.history)
+        emissions = self._meta.emissions
+        self._geometry = self._meta.geometry
+        self.steps = []
+        if emissions is None:
+            self._sources = []
+            self._coefficients = csr_array((0, 0))
+        else:
+            self._sources = [(emissions.values, None)]
+            self._coefficients = eye_array(len(emissions.columns), format="csr")
+            self._meta.emissions = EmissionsArray(
+                emissions.totals().reshape(-1, 1),
+                emissions.columns,
+                _dummy_cells(1, self._meta.crs),
+            )
+
+    def __repr__(self) -> str:
+        return f"LazyInventory({self._meta.name}, steps={self.steps})"
+
+    @property
+    def columns(self) -> list[CatSub]:
+        """The (category, substance) of the main emissions of the output."""
+        return self._meta._gdf_columns
+
+    @property
+    def categories(self) -> list[str]:
+        return self._meta.categories
+
+    @property
+    def substances(self) -> list[str]:
+        return self._meta.substances
+
+    @property
+    def gdfs(self) -> dict[str, gpd.GeoDataFrame]:
+        return self._meta.gdfs
+
+    @property
+    def grid(self) -> Grid | None:
+        return self._meta.grid
+
+    @property
+    def geometry(self) -> gpd.GeoSeries | None:
+        """The cells of the main emissions."""
+        return self._geometry
+
+    @property
+    def crs(self) -> int | None:
+        return self._meta.crs
+
+    @property
+    def depends_on_cells(self) -> bool:
+        """Whether some profiles depend on the cells.
+
+        The steps cannot be recorded then, as the profiles are updated
+        with the emissions of each cell.
+        """
+        return any(
+            indexes is not None and "cell" in indexes.dims
+            for indexes in [
+                self._meta.v_profiles_indexes,
+                self._meta.t_profiles_indexes,
+            ]
+        )
+
+    def _evolve(self, step: str, **attributes) -> LazyInventory:
+        """Return a new lazy inventory with some attributes replaced."""
+        lazy = copy.copy(self)
+        lazy.__dict__.update(attributes)
+        lazy.steps = self.steps + [step]
+        return lazy
+
+    def record(
+        self,
+        operator: Callable[..., Inventory],
+        cell_dependent: bool = False,
+        **kwargs,
+    ) -> LazyInventory:
+        """Add an operator which combines the columns to the plan.
+
+        This is called by the operators when they receive a lazy inventory.
+
+        :arg operator: The operator function.
+        :arg cell_dependent: Whether the operator depends on the cells with
+            the given arguments. It is then applied directly to the
+            executed plan.
+        :arg kwargs: The arguments of the operator.
+        """
+        if cell_dependent or self.depends_on_cells:
+            logger.info(
+                f"Cannot record {operator.__name__} with cell dependent values,"
+                " executing the plan."
+            )
+            lazy = LazyInventory(operator(self.execute(), **kwargs))
+            lazy.steps = self.steps + [operator.__name__]
+            return lazy
+
+        meta = operator(self._meta, **kwargs)
+
+        # Apply the operator to the identity to get how the columns are combined
+        n_columns = self._coefficients.shape[0]
+        identity = self._meta.copy(profiles=False)
+        if self._meta.emissions is not None:
+            identity.emissions = EmissionsArray(
+                eye_array(n_columns, format="csr"),
+                self.columns,
+                _dummy_cells(n_columns, self.crs),
+            )
+        combined = operator(identity, **kwargs).emissions
+        # The operator can remove columns without emissions, which are
+        # then not in the meta inventory
+        if combined is None or not meta._gdf_columns:
+            matrix = csr_array((len(meta._gdf_columns), n_columns))
+        else:
+            matrix = csr_array(combined.select(meta._gdf_columns).values)
+
+        return self._evolve(
+            operator.__name__,
+            _meta=meta,
+            _coefficients=(matrix @ self._coefficients).tocsr(),
+        )
+
+    def record_remap(
+        self,
+        grid: Grid | gpd.GeoSeries,
+        grid_cells: gpd.GeoSeries,
+        weights: csr_array | None,
+        gdfs_emissions: EmissionsArray | None,
+        keep_gdfs: bool,
+    ) -> LazyInventory:
+        """Add a remapping to the plan.
+
+        This is called by :py:func:`~emiproc.regrid.remap_inventory`.
+
+        :arg grid: The grid remapped to.
+        :arg grid_cells: The cells of the grid.
+        :arg weights: The weights from the cells of the inventory to the
+            cells of the grid, shape (n_grid_cells, n_cells).
+        :arg gdfs_emissions: The emissions of the additional gdfs
+            remapped on the grid, which are added to the main emissions.
+        :arg keep_gdfs: Whether the additional gdfs are kept.
+        """
+        sources = [
+            (values, weights if source_weights is None else weights @ source_weights)
+            for values, source_weights in self._sources
+        ]
+        columns = list(self.columns)
+        coefficients = self._coefficients
+        if gdfs_emissions is not None:
+            new_columns = [col for col in gdfs_emissions.columns if col not in columns]
+            columns += new_columns
+            positions = {col: i for i, col in enumerate(columns)}
+            n_gdfs_columns = len(gdfs_emissions.columns)
+            placement = csr_array(
+                (
+                    np.ones(n_gdfs_columns),
+                    (
+                        [positions[col] for col in gdfs_emissions.columns],
+                        np.arange(n_gdfs_columns),
+                    ),
+                ),
+                shape=(len(columns), n_gdfs_columns),
+            )
+            coefficients = hstack(
+                [
+                    vstack(
+                        [
+                            coefficients,
+                            csr_array((len(new_columns), coefficients.shape[1])),
+                        ]
+                    ),
+                    placement,
+                ],
+                format="csr",
+            )
+            sources.append((gdfs_emissions.values, None))
+
+        # Totals of the columns on the grid
+        totals = np.zeros(len(columns))
+        start = 0
+        for values, source_weights in sources:
+            stop = start + values.shape[0]
+            cells_weights = (
+                np.ones(values.shape[1])
+                if source_weights is None
+                else np.asarray(source_weights.sum(axis=0)).reshape(-1)
+            )
+            # Chunked values are reduced here, as the profiles need the totals
+            totals += coefficients[:, start:stop] @ np.asarray(values @ cells_weights)
+            start = stop
+
+        meta = self._meta.copy(no_gdfs=not keep_gdfs)
+        meta.grid = grid
+        meta.emissions = EmissionsArray(
+            totals.reshape(-1, 1), columns, _dummy_cells(1, grid_cells.crs)
+        )
+        meta.history.append(f"Remapped to grid {grid}, {keep_gdfs=}")
+
+        return self._evolve(
+            "remap_inventory",
+            _meta=meta,
+            _sources=sources,
+            _coefficients=coefficients,
+            _geometry=grid_cells,
+        )
+
+    def execute(self, columns: list[CatSub] | None = None) -> Inventory:
+        """Compute the emissions of the plan.
+
+        :arg columns: The (category, substance) of the main emissions to
+            compute, for example only the ones written by an exporter.
+            By default all the columns are computed.
+
+        :return: The processed inventory.
+        """
+        inv = self._meta.copy()
+        inv.history = list(self._meta.history)
+        if self._meta.emissions is None:
+            return inv
+
+        positions = {col: i for i, col in enumerate(self.columns)}
+        columns = self.columns if columns is None else [tuple(c) for c in columns]
+        coefficients = self._coefficients[[positions[col] for col in columns]]
+
+        # Same storage as the emissions of the inventory
+        main_values = self._sources[0][0] if self._sources else None
+        sparse = issparse(main_values)
+        chunked = isinstance(main_values, dask_array.Array)
+        shape = (len(columns), len(self.geometry))
+        if sparse:
+            emissions = csr_array(shape)
+        elif chunked:
+            emissions = dask_array.zeros(shape, chunks=(-1, main_values.chunksize[1]))
+        else:
+            emissions = np.zeros(shape)
+        start = 0
+        for values, weights in self._sources:
+            stop = start + values.shape[0]
+            # Combine the columns first, only the used rows are read
+            if isinstance(values, dask_array.Array):
+                part = combine_chunks(coefficients[:, start:stop], values)
+                if weights is not None:
+                    part = remap_chunks(part, weights)
+            else:
+                part = coefficients[:, start:stop] @ values
+                if weights is not None:
+                    part = (weights @ part.T).T
+            start = stop
+            if sparse:
+                emissions = emissions + csr_array(part)
+            else:
+                emissions += part.toarray() if issparse(part) else part
+
+        if sparse:
+            emissions = csr_array(emissions)
+        elif not chunked:
+            emissions = np.ascontiguousarray(emissions)
+        inv.emissions = EmissionsArray(emissions, columns, self.geometry)
+        return inv
@@ -3,13 +3,14 @@ from enum import Enum, auto
 from os import PathLike
 from pathlib import Path
 from emiproc.grids import LV95, SwissGrid
-from emiproc.inventories import Category, Inventory, Substance
+from emiproc.inventories import Category, EmissionsArray, Inventory, Substance
 import pandas as pd
 import geopandas as gpd
 from shapely.geometry import Polygon, Point
 from shapely.creation import polygons
 import numpy as np
 import rasterio
+from scipy.sparse import csr_array, vstack
 
 
 class PointSourceCorrection(Enum):
@@ -51,6 +52,7 @@ class SwissRasters(Inventory):
         point_source_correction: dict[
             Category, PointSourceCorrection
         ] = default_point_source_correction,
+        sparse: bool = False,
     ) -> None:
         """Create a swiss raster inventory.
 
@@ -68,6 +70,10 @@ class SwissRasters(Inventory):
             This should be present in the `Emissions_CH.xlsx` file.
             The raster files are the same for all years. Only the scaling
             of the full raster pro substance changes.
+        :arg sparse: Whether to store the emissions of the rasters in a sparse
+            :py:class:`~emiproc.inventories.EmissionsArray` .
+            Most categories have emissions only in a few cells of the rasters,
+            so this saves most of the memory of the inventory.
         """
         super().__init__()
 
@@ -327,8 +333,8 @@ class SwissRasters(Inventory):
                 ]
             )
             coords = np.rollaxis(coords, -1, 0)
-        self.gdf = gpd.GeoDataFrame(
-            mapping,
+        gdf = gpd.GeoDataFrame(
+            {} if sparse else mapping,
             crs=LV95,
             # This vector is same as raster data reshaped using reshape(-1)
             geometry=(
@@ -337,6 +343,18 @@ class SwissRasters(Inventory):
                 else np.full(self.grid.nx * self.grid.ny, np.nan)
             ),
         )
+        if sparse:
+            self.emissions = EmissionsArray(
+                vstack(
+                    [csr_array(values.reshape(1, -1)) for values in mapping.values()]
+                    or [csr_array((0, len(gdf)))],
+                    format="csr",
+                ),
+                list(mapping),
+                gdf.geometry,
+            )
+        else:
+            self.gdf = gdf
 
         # Add point sources
         self.gdfs = gdfs
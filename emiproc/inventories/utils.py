@@ -14,11 +14,22 @@ import geopandas as gpd
 import pandas as pd
 import numpy as np
 import xarray as xr
+from scipy.sparse import coo_array
 
 from shapely.geometry import Point, MultiPolygon, Polygon
 from emiproc.grids import Grid
+from emiproc.inventories import _copy_frame
+from emiproc.inventories.lazy import LazyInventory
 
 from emiproc.regrid import geoserie_intersection
+from emiproc.weights_cache import (
+    WeightsCache,
+    arrays_to_geometries,
+    fingerprint_geometries,
+    geometries_to_arrays,
+    make_cache_key,
+    resolve_cache,
+)
 from emiproc.profiles.operators import (
     add_profiles,
     get_weights_of_gdf_profiles,
@@ -110,6 +121,8 @@ def crop_with_shape(
     keep_outside: bool = False,
     weight_file: PathLike | None = None,
     modify_grid: bool = False,
+    cache: WeightsCache | bool = True,
+    inplace: bool = False,
 ) -> Inventory:
     """Crop the inventory with the provided shape.
 
@@ -134,11 +147,18 @@ def crop_with_shape(
         Grid cells cropped will disappear.
         Grid cells intersected will be replaced by the intersection with
         the shape.
+    :arg cache: The cache in which the weights of the main grid are looked for
+        and stored. The key depends on the geometry of the inventory, the shape
+        and the other arguments.
+        See :py:func:`emiproc.regrid.get_weights_mapping`.
+    :arg inplace: Whether to modify the inventory in place.
 
     .. warning::
         Make sure your shape is in the same crs as the inventory.
     """
-    inv_out = inv.copy(no_gdfs=True)
+    inv_out = inv if inplace else inv.copy(no_gdfs=True)
+    gdfs = inv.gdfs
+    substances = inv.substances
 
     if weight_file is not None:
         weight_file = Path(weight_file).with_suffix(".npy")
@@ -146,7 +166,7 @@ def crop_with_shape(
         if modify_grid:
             shapes_file = Path(weight_file).with_suffix(".gdb")
 
-    if inv.gdf is not None:
+    if inv.geometry is not None:
         # Check if the weights are already computed
         if weight_file is not None and weight_file.is_file():
             weights = np.load(weight_file)
@@ -165,10 +185,49 @@ def crop_with_shape(
                     "index", drop=True
                 ).geometry
         else:
-            # Find the weight of the intersection, keep the same geometry
-            intersection_shapes, weights = geoserie_intersection(
-                inv.geometry, shape, keep_outside=keep_outside, drop_unused=modify_grid
-            )
+            cache = resolve_cache(cache)
+            cached = None
+            if cache is not None:
+                key = make_cache_key(
+                    kind="crop_with_shape",
+                    geometry=fingerprint_geometries(inv.geometry),
+                    shape=fingerprint_geometries([shape]),
+                    keep_outside=keep_outside,
+                    modify_grid=modify_grid,
+                )
+                cached = cache.load(key)
+            if cached is not None:
+                weights = cached["weights"]
+                intersection_shapes = (
+                    arrays_to_geometries(cached, crs=inv.geometry.crs)
+                    if modify_grid
+                    else inv.geometry
+                )
+            else:
+                # Find the weight of the intersection, keep the same geometry
+                intersection_shapes, weights = geoserie_intersection(
+                    inv.geometry,
+                    shape,
+                    keep_outside=keep_outside,
+                    drop_unused=modify_grid,
+                )
+                if cache is not None:
+                    cache.save(
+                        key,
+                        {
+                            "weights": weights,
+                            **(
+                                geometries_to_arrays(intersection_shapes)
+                                if modify_grid
+                                else {}
+                            ),
+                        },
+                        metadata={
+                            "kind": "crop_with_shape",
+                            "keep_outside": keep_outside,
+                            "modify_grid": modify_grid,
+                        },
+                    )
             if weight_file is not None:
                 # Save the weight file
                 np.save(weight_file, weights)
@@ -179,30 +238,28 @@ def crop_with_shape(
                         index=intersection_shapes.index,
                     ).to_file(shapes_file, engine="pyogrio")
 
+        emissions = inv.emissions.to_dense()
+        # Select the correct values from the shapes
+        cells = (
+            inv.geometry.index.get_indexer(intersection_shapes.index)
+            if modify_grid
+            else slice(None)
+        )
         inv_out.gdf = gpd.GeoDataFrame(
-            {
-                col: (
-                    # Select the correct values from the shapes
-                    inv.gdf.loc[intersection_shapes.index, col].to_numpy()
-                    if modify_grid
-                    else inv.gdf[col]
-                )
-                * weights
-                for col in inv._gdf_columns
-            },
+            {col: emissions[col][cells] * weights for col in emissions.columns},
             geometry=(
                 intersection_shapes.reset_index(drop=True)
                 if modify_grid
                 else inv.geometry
             ),
-            crs=inv.gdf.crs,
+            crs=inv.crs,
         )
     else:
         inv_out.gdf = None
 
     inv_out.gdfs = {}
-    for cat, gdf in inv.gdfs.items():
-        cols = [col for col in inv.substances if col in gdf]
+    for cat, gdf in gdfs.items():
+        cols = [col for col in substances if col in gdf]
         if not cols:
             # No substance of the inventory is in this category
             # No need to crop anything (cropping this will create accessing error bug later in the loop)
@@ -251,6 +308,7 @@ def group_categories(
     inv: Inventory,
     categories_group: dict[str, list[str]],
     ignore_missing: bool = False,
+    inplace: bool = False,
 ) -> Inventory:
     """Group the categories of an inventory in new categories.
 
@@ -268,7 +326,15 @@ def group_categories(
         Ex. ``{"group1": ["cat1", "cat2"], "group2": ["cat3", "cat4"]}``
         If ``cat3`` is not in the inventory, the function will work as if
         ``{"group1": ["cat1", "cat2"], "group2": ["cat4"]}`` was passed.
+    :arg inplace: Whether to modify the inventory in place.
     """
+    if isinstance(inv, LazyInventory):
+        return inv.record(
+            group_categories,
+            categories_group=categories_group,
+            ignore_missing=ignore_missing,
+        )
+
     if ignore_missing:
         # Remove the missing categories
         categories_group = {
@@ -276,30 +342,38 @@ def group_categories(
             for group, categories in categories_group.items()
         }
 
-    validate_group(categories_group, inv.categories)
-
-    out_inv = inv.copy(no_gdfs=True)
-
-    if inv.gdf is not None:
-        out_inv.gdf = gpd.GeoDataFrame(
-            {
-                # Sum all the categories containing that substance
-                (group, substance): group_sum
-                for substance in inv.substances
-                for group, categories in categories_group.items()
-                # Only add the group if there are some non zero value
-                if np.any(
-                    group_sum := sum(
-                        (
-                            inv.gdf[(cat, substance)]
-                            for cat in categories
-                            if (cat, substance) in inv.gdf
-                        )
-                    )
-                )
-            },
-            geometry=inv.gdf.geometry,
-            crs=inv.crs,
+    inv_categories = inv.categories
+    validate_group(categories_group, inv_categories)
+
+    out_inv = inv if inplace else inv.copy(no_gdfs=True)
+    gdfs = inv.gdfs
+
+    emissions = inv.emissions
+    if emissions is not None:
+        # Sum all the categories containing that substance
+        positions = {col: i for i, col in enumerate(emissions.columns)}
+        columns, rows, cols = [], [], []
+        for substance in emissions.substances:
+            for group, categories in categories_group.items():
+                group_positions = [
+                    positions[(cat, substance)]
+                    for cat in categories
+                    if (cat, substance) in positions
+                ]
+                if group_positions:
+                    rows.extend([len(columns)] * len(group_positions))
+                    cols.extend(group_positions)
+                    columns.append((group, substance))
+        grouped = emissions.combine(
+            coo_array(
+                (np.ones(len(rows)), (rows, cols)),
+                shape=(len(columns), len(emissions.columns)),
+            ),
+            columns,
+        )
+        # Only add the group if there are some non zero value
+        out_inv.emissions = grouped.select(
+            [col for col, keep in zip(columns, grouped.nonzero_columns()) if keep]
         )
     else:
         out_inv.gdf = None
@@ -307,7 +381,7 @@ def group_categories(
     # Merging the categories directly
     out_inv.gdfs = {}
     for group, categories in categories_group.items():
-        group_gdfs = [inv.gdfs[cat] for cat in categories if cat in inv.gdfs]
+        group_gdfs = [gdfs[cat] for cat in categories if cat in gdfs]
 
         # Add missing profile -1 to the gdfs having no profiles column
         for profile_col in ["__v_profile__", "__t_profile__"]:
@@ -343,7 +417,9 @@ def group_categories(
             new_profiles, new_indices = group_profiles_indexes(
                 profiles,
                 profiles_indexes,
-                indexes_weights=get_weights_of_gdf_profiles(inv.gdf, profiles_indexes),
+                indexes_weights=get_weights_of_gdf_profiles(
+                    emissions.to_frame(), profiles_indexes
+                ),
                 categories_group=categories_group,
                 groupping_dimension="category",
             )
@@ -353,7 +429,7 @@ def group_categories(
                 f"Generated new {profiles_indexes_name} from groupping."
             )
 
-    out_inv.history.append(f"groupped from {inv.categories} to {out_inv.categories}")
+    out_inv.history.append(f"groupped from {inv_categories} to {out_inv.categories}")
 
     return out_inv
 
@@ -379,7 +455,9 @@ def group_substances(
 
     out_inv = inv.copy(no_gdfs=True)
 
-    if inv.gdf is not None:
+    emissions = inv.emissions
+    if emissions is not None:
+        emissions = emissions.to_dense()
         out_inv.gdf = gpd.GeoDataFrame(
             {
                 # Sum all the substances containing that category
@@ -390,14 +468,14 @@ def group_substances(
                 if np.any(
                     group_sum := sum(
                         (
-                            inv.gdf[(cat, sub)]
+                            emissions[(cat, sub)]
                             for sub in substances
-                            if (cat, sub) in inv.gdf
+                            if (cat, sub) in emissions
                         )
                     )
                 )
             },
-            geometry=inv.gdf.geometry,
+            geometry=inv.geometry,
             crs=inv.crs,
         )
     else:
@@ -433,7 +511,9 @@ def group_substances(
             new_profiles, new_indices = group_profiles_indexes(
                 profiles,
                 profiles_indexes,
-                indexes_weights=get_weights_of_gdf_profiles(inv.gdf, profiles_indexes),
+                indexes_weights=get_weights_of_gdf_profiles(
+                    emissions.to_frame(), profiles_indexes
+                ),
                 categories_group=substances_group,
                 groupping_dimension="substance",
             )
@@ -457,6 +537,21 @@ def group_substances(
     return out_inv
 
 
+def _same_geometries(inv: Inventory, other_inv: Inventory) -> bool:
+    """Check that the main gdfs of two inventories have the same geometries.
+
+    The hashes of the geometries are compared first, the geometries
+    themselves only if these differ.
+    The grids are not compared, as they can differ from the geometries
+    (ex. after a crop).
+    """
+    if fingerprint_geometries(inv.geometry) == fingerprint_geometries(
+        other_inv.geometry
+    ):
+        return True
+    return bool(np.all(gpd.GeoSeries.geom_equals(inv.geometry, other_inv.geometry)))
+
+
 def add_inventories(inv: Inventory, other_inv: Inventory) -> Inventory:
     """Add inventories together.
 
@@ -469,17 +564,15 @@ def add_inventories(inv: Inventory, other_inv: Inventory) -> Inventory:
     """
     logger = logging.getLogger("emiproc.add_inventories")
 
-    if inv.gdf is None and other_inv.gdf is not None:
+    if inv.geometry is None and other_inv.geometry is not None:
         # as we want to put everything on inv.gdf later for simplicity
         return add_inventories(other_inv, inv)
 
     # Check that the two inventories are on the same grid
     if (
-        inv.gdf is not None
-        and other_inv.gdf is not None
-        and not np.all(
-            gpd.GeoSeries.geom_equals(inv.gdf.geometry, other_inv.gdf.geometry)
-        )
+        inv.geometry is not None
+        and other_inv.geometry is not None
+        and not _same_geometries(inv, other_inv)
     ):
         raise ValueError("Grids of the two inventories are not the same.")
 
@@ -488,36 +581,18 @@ def add_inventories(inv: Inventory, other_inv: Inventory) -> Inventory:
 
     out_inv = inv.copy(no_gdfs=True)
 
-    if inv.gdf is not None and other_inv.gdf is not None:
-        # Check that they somehow have the same grid
-        if not np.all(
-            gpd.GeoSeries.geom_equals(inv.gdf.geometry, other_inv.gdf.geometry)
-        ):
-            raise ValueError(
-                "Grids of the gdf of the two inventories are not the same."
-            )
-        # Get the columns for the new gdf
-        cols_a = inv._gdf_columns
-        cols_b = other_inv._gdf_columns
-        all_cols = set(cols_a) | set(cols_b)
-
-        # Sum the two gdfs
-        gdf = gpd.GeoDataFrame(
-            {
-                col: (inv.gdf[col] if col in inv.gdf else 0)
-                + (other_inv.gdf[col] if col in other_inv.gdf else 0)
-                for col in all_cols
-            },
-            geometry=inv.gdf.geometry,
-            crs=inv.crs,
-        )
-    elif inv.gdf is not None:
-        # Just copy the gdf
-        gdf = inv.gdf.copy()
+    emissions, other_emissions = inv.emissions, other_inv.emissions
+    if emissions is not None:
+        # Sum the two emissions, the other columns are added
+        out_emissions = emissions.copy(deep=False)
+        if other_emissions is not None:
+            for col in other_emissions.columns:
+                out_emissions[col] = (
+                    out_emissions[col] if col in out_emissions else 0
+                ) + other_emissions[col]
+        out_inv.emissions = out_emissions
     else:
-        gdf = None
-
-    out_inv.gdf = gdf
+        out_inv.gdf = None
 
     # Process the gdfs
     gdfs = {}
@@ -590,9 +665,10 @@ def get_total_emissions(inv: Inventory) -> dict[str, dict[str, float]]:
     out_dic = {sub: {} for sub in inv.substances}
 
     # First look for the emissions in the gdf
-    for cat, sub in inv._gdf_columns:
-        # Calculate the total sum
-        out_dic[sub][cat] = inv.gdf[(cat, sub)].sum()
+    emissions = inv.emissions
+    if emissions is not None:
+        for (cat, sub), total in zip(emissions.columns, emissions.totals()):
+            out_dic[sub][cat] = total
 
     # Second look for the emissions in the gdfs
     for cat, gdf in inv.gdfs.items():
@@ -612,7 +688,9 @@ def get_total_emissions(inv: Inventory) -> dict[str, dict[str, float]]:
 
 
 def scale_inventory(
-    inv: Inventory, scaling_dict: dict[str, dict[str, float]] | float
+    inv: Inventory,
+    scaling_dict: dict[str, dict[str, float]] | float,
+    inplace: bool = False,
 ) -> Inventory:
     """Get the total emissions from the inventory.
 
@@ -641,11 +719,24 @@ def scale_inventory(
         If you have a gridded inventory (no gdfs emissions), you can also scale
         each grid cell individually by giving arrays of the same length as the
         number of grid cells.
+    :arg inplace: Whether to modify the inventory in place.
 
     :return: A new inventory with its emission values rescaled.
     """
-    # Deep copy of the inventory
-    inv = inv.copy()
+    if isinstance(inv, LazyInventory):
+        return inv.record(
+            scale_inventory,
+            # Factors given for each cell
+            cell_dependent=isinstance(scaling_dict, dict)
+            and any(
+                np.ndim(factor) > 0
+                for sub_dict in scaling_dict.values()
+                for factor in sub_dict.values()
+            ),
+            scaling_dict=scaling_dict,
+        )
+
+    out_inv = inv if inplace else inv.copy(no_gdfs=True)
 
     # Create the scaling dict if a float was given
     if isinstance(scaling_dict, int):
@@ -655,16 +746,28 @@ def scale_inventory(
             sub: {cat: scaling_dict for cat in inv.categories} for sub in inv.substances
         }
 
+    emissions = inv.emissions
+    if emissions is not None:
+        positions = {col: i for i, col in enumerate(emissions.columns)}
+        factors = np.ones((len(emissions.columns), 1))
+    if not inplace:
+        out_inv.gdfs = {cat: _copy_frame(gdf) for cat, gdf in (inv.gdfs or {}).items()}
+
     # Iterate over the scaling dict to multiply the values
     for sub, sub_dict in scaling_dict.items():
         for cat, scaling_factor in sub_dict.items():
-            if inv.gdf is not None and (cat, sub) in inv.gdf.columns:
-                inv.gdf[(cat, sub)] *= scaling_factor
-            if inv.gdfs is not None and cat in inv.gdfs.keys() and sub in inv.gdfs[cat]:
-                inv.gdfs[cat][sub] *= scaling_factor
-
-    inv.history.append(f"Rescaled using {scaling_dict=}")
-    return inv
+            if emissions is not None and (cat, sub) in positions:
+                if np.ndim(scaling_factor) > 0 and factors.shape[1] == 1:
+                    # Factors given for each cell
+                    factors = np.repeat(factors, len(emissions.geometry), axis=1)
+                factors[positions[(cat, sub)]] *= scaling_factor
+            if cat in out_inv.gdfs.keys() and sub in out_inv.gdfs[cat]:
+                out_inv.gdfs[cat][sub] *= scaling_factor
+
+    if emissions is not None:
+        out_inv.emissions = emissions.scale(factors, inplace=inplace)
+    out_inv.history.append(f"Rescaled using {scaling_dict=}")
+    return out_inv
 
 
 def combine_inventories(
@@ -699,6 +802,7 @@ def drop(
     substances: list[Substance] = [],
     categories: list[Category] = [],
     keep_instead_of_drop: bool = False,
+    inplace: bool = False,
 ) -> Inventory:
     """Drop substances and categories from an inventory.
 
@@ -713,7 +817,15 @@ def drop(
     :arg categories: The categories to drop.
     :arg keep_instead_of_drop: If True, the substances and categories will be kept
         instead of being dropped.
+    :arg inplace: Whether to modify the inventory in place.
     """
+    if isinstance(inv, LazyInventory):
+        return inv.record(
+            drop,
+            substances=substances,
+            categories=categories,
+            keep_instead_of_drop=keep_instead_of_drop,
+        )
 
     # Check the types
     for var_name, var in [("substances", substances), ("categories", categories)]:
@@ -729,22 +841,24 @@ def drop(
         if categories:
             categories = [cat for cat in inv.categories if cat not in categories]
 
-    # Deep copy of the inventory
-    out_inv = inv.copy(no_gdfs=True)
-
-    gdf_cols_to_drop = [
-        (cat, sub)
-        for cat, sub in inv._gdf_columns
-        if cat in categories or sub in substances
-    ]
-
-    out_inv.gdf = (
-        inv.gdf.drop(columns=gdf_cols_to_drop) if inv.gdf is not None else None
-    )
+    out_inv = inv if inplace else inv.copy(no_gdfs=True)
+    gdfs = inv.gdfs
+
+    emissions = inv.emissions
+    if emissions is not None:
+        out_inv.emissions = emissions.select(
+            [
+                (cat, sub)
+                for cat, sub in emissions.columns
+                if cat not in categories and sub not in substances
+            ]
+        )
+    else:
+        out_inv.gdf = None
 
     # Process the gdfs
     out_inv.gdfs = {}
-    for cat, gdf in inv.gdfs.items():
+    for cat, gdf in gdfs.items():
         if cat in categories:
             continue
         out_inv.gdfs[cat] = gdf.drop(
@@ -178,7 +178,11 @@ def plot_inventory(
         logger.info("Only one category, will plot only the total emissions")
         total_only = True
 
-    x_min, y_min, x_max, y_max = grid.gdf.total_bounds
+    if is_regular and grid.is_regular:
+        # No need to create the polygons of the grid
+        x_min, y_min, x_max, y_max = grid.total_bounds
+    else:
+        x_min, y_min, x_max, y_max = grid.gdf.total_bounds
 
     if not spec_lims:
         spec_lims = (x_min, x_max, y_min, y_max)
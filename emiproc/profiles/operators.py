@@ -5,7 +5,9 @@ from typing import TYPE_CHECKING
 
 import geopandas as gpd
 import numpy as np
+import pandas as pd
 import xarray as xr
+from scipy.sparse import coo_array
 
 from emiproc.profiles.temporal_profiles import (
     CompositeTemporalProfiles,
@@ -465,6 +467,40 @@ def country_to_cells(
     return new_profiles, new_indexes
 
 
+class _UniqueProfiles:
+    """Collect unique profiles, using a hash of their ratios."""
+
+    def __init__(self):
+        self._index_of_hash: dict[int, int] = {}
+        self.ratios: list[np.ndarray] = []
+
+    def add(self, ratios: np.ndarray) -> np.ndarray:
+        """Add profiles (one per row) and return their indexes."""
+        # Make -0. and 0. the same
+        ratios = ratios + 0.0
+        hashes = pd.util.hash_pandas_object(pd.DataFrame(ratios), index=False)
+        codes, unique_hashes = pd.factorize(hashes.to_numpy())
+        first_rows = np.full(len(unique_hashes), len(ratios))
+        np.minimum.at(first_rows, codes, np.arange(len(ratios)))
+        if not np.array_equal(ratios, ratios[first_rows[codes]]):
+            # Collision of the hashes, use the slower sorting
+            unique_ratios, codes = np.unique(ratios, axis=0, return_inverse=True)
+            unique_hashes = [hash(r.tobytes()) for r in unique_ratios]
+            first_rows = np.arange(len(unique_ratios))
+            ratios = unique_ratios
+
+        indexes = np.empty(len(unique_hashes), dtype=int)
+        for i, (h, row) in enumerate(zip(unique_hashes, first_rows)):
+            h = int(h)
+            index = self._index_of_hash.get(h)
+            if index is None or not np.array_equal(self.ratios[index], ratios[row]):
+                index = len(self.ratios)
+                self._index_of_hash.setdefault(h, index)
+                self.ratios.append(ratios[row])
+            indexes[i] = index
+        return indexes[np.asarray(codes).reshape(-1)]
+
+
 def remap_profiles(
     profiles: VerticalProfiles | CompositeTemporalProfiles,
     profiles_indexes: xr.DataArray,
@@ -473,6 +509,14 @@ def remap_profiles(
 ) -> tuple[VerticalProfiles | CompositeTemporalProfiles, xr.DataArray]:
     """Remap the profiles on a new grid.
 
+    The profile of an output cell is the mean of the profiles of the inventory
+    cells it covers, weighted by the emissions and the remapping weights.
+
+    The mean is computed for each type of profile with a sparse matrix
+    (output cells x unique profiles) multiplied with the ratios of
+    the profiles, one category/substance after the other.
+    Identical output profiles are then merged.
+
     :arg profiles: The profiles to remap.
     :arg profiles_indexes: The indexes of the profiles.
     :arg emissions_weights: The weights of the emissions.
@@ -504,47 +548,85 @@ def remap_profiles(
         )
         weights_mapping = {k: v[~mask_missing] for k, v in weights_mapping.items()}
 
-    # Get the emissions weights at the remapping index
-    da_weights_of_remapping = xr.DataArray(
-        weights_mapping["weights"],
-        dims=["cell"],
-        coords={"cell": weights_mapping["inv_indexes"]},
+    profiles_indexes, emissions_weights = xr.align(
+        profiles_indexes, emissions_weights, join="inner"
     )
-    da_weights = (
-        emissions_weights.sel(cell=weights_mapping["inv_indexes"])
-        * da_weights_of_remapping
+    # Cell first, and the other dimensions flattened
+    other_dims = [dim for dim in profiles_indexes.dims if dim != "cell"]
+    indexes_array = profiles_indexes.transpose("cell", *other_dims).values
+    n_cells_in = indexes_array.shape[0]
+    indexes_array = indexes_array.reshape(n_cells_in, -1)
+    emissions_array = (
+        emissions_weights.transpose("cell", *other_dims)
+        .values.astype(float)
+        .reshape(n_cells_in, -1)
     )
 
-    # Set the profiles needed on the remapping cells
-    profiles_to_get_remapped = profiles_indexes.sel(cell=weights_mapping["inv_indexes"])
-
-    # access the profiles to get the ratios at each inpout
-    da_ratios = (
-        xr.DataArray(
-            profiles.ratios[profiles_to_get_remapped],
-            dims=[*profiles_to_get_remapped.dims, "ratio"],
-            coords={
-                **profiles_to_get_remapped.coords,
-                "ratio": range(profiles.ratios.shape[1]),
-            },
-            # Remove the profiles with no ratios (will be set to nan)
-            # This assumes that no profile = no contribution, so only the other ratios in the cell will have an impact
-        )
-        .where(profiles_to_get_remapped != -1)
-        .assign_coords(output_cell=("cell", weights_mapping["output_indexes"]))
+    cell_positions = pd.Index(profiles_indexes["cell"].values).get_indexer(
+        weights_mapping["inv_indexes"]
     )
-
-    # Do the actual remapping calculations
-    da_remapped_ratios = (
-        (da_ratios * da_weights)
-        .groupby("output_cell")
-        .mean()
-        .rename({"output_cell": "cell"})
+    output_cells, output_positions = np.unique(
+        weights_mapping["output_indexes"], return_inverse=True
     )
+    output_positions = output_positions.reshape(-1)
+    n_out = len(output_cells)
+
+    types = profiles.types
+    type_ratios = [profiles._profiles[t].ratios for t in types]
+    type_indexes = [profiles._indexes[t] for t in types]
+
+    unique_profiles = _UniqueProfiles()
+    new_indexes = np.full((n_out, indexes_array.shape[1]), -1, dtype=int)
+    for k in range(indexes_array.shape[1]):
+        profile_of_entry = indexes_array[cell_positions, k]
+        weight_of_entry = (
+            weights_mapping["weights"] * emissions_array[cell_positions, k]
+        )
+        remapped_ratios = []
+        for ratios, indexes in zip(type_ratios, type_indexes):
+            index_in_type = np.where(
+                profile_of_entry != -1, indexes[profile_of_entry], -1
+            )
+            has_type = index_in_type != -1
+            weights_matrix = coo_array(
+                (
+                    weight_of_entry[has_type],
+                    (output_positions[has_type], index_in_type[has_type]),
+                ),
+                shape=(n_out, len(ratios)),
+            ).tocsr()
+            # Weighted sum of the profiles of the inventory cells with this type,
+            # rescaled here such that identical profiles can be merged
+            summed_ratios = weights_matrix @ ratios
+            with np.errstate(invalid="ignore", divide="ignore"):
+                remapped_ratios.append(
+                    summed_ratios / summed_ratios.sum(axis=1, keepdims=True)
+                )
+        remapped_ratios = np.concatenate(remapped_ratios, axis=1)
+
+        # Profiles with no contribution are invalid
+        valid = np.nansum(remapped_ratios, axis=1) != 0
+        new_indexes[valid, k] = unique_profiles.add(
+            np.nan_to_num(remapped_ratios[valid], nan=0.0)
+        )
 
-    new_ratios, new_indices = ratios_dataarray_to_profiles(da_remapped_ratios)
+    new_indices = xr.DataArray(
+        new_indexes.reshape(n_out, *(profiles_indexes.sizes[d] for d in other_dims)),
+        dims=["cell", *other_dims],
+        coords={
+            **{dim: profiles_indexes.coords[dim] for dim in other_dims},
+            "cell": output_cells,
+        },
+    ).transpose(*profiles_indexes.dims)
+
+    size = sum(ratios.shape[1] for ratios in type_ratios)
+    new_ratios = (
+        np.stack(unique_profiles.ratios)
+        if unique_profiles.ratios
+        else np.zeros((0, size))
+    )
     new_profiles = CompositeTemporalProfiles.from_ratios(
-        new_ratios, profiles.types, rescale=True
+        new_ratios, types, rescale=True
     )
 
     return new_profiles, new_indices
@@ -574,8 +656,12 @@ def add_profiles(
     indexes1 = indexes1.fillna(-1).astype(int)
     indexes2 = indexes2.fillna(-1).astype(int)
 
-    weights1 = get_weights_of_gdf_profiles(inv1.gdf, profiles_indexes=indexes1)
-    weights2 = get_weights_of_gdf_profiles(inv2.gdf, profiles_indexes=indexes2)
+    weights1 = get_weights_of_gdf_profiles(
+        inv1.emissions.to_frame(), profiles_indexes=indexes1
+    )
+    weights2 = get_weights_of_gdf_profiles(
+        inv2.emissions.to_frame(), profiles_indexes=indexes2
+    )
     weights1, weights2 = xr.broadcast(weights1, weights2)
     # Add the missing
     weights1 = weights1.fillna(0)
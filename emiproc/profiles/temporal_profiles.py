@@ -605,18 +605,27 @@ class CompositeTemporalProfiles:
                 raise TypeError(f"{t=} must be a {TemporalProfile}.")
         splitters = np.cumsum([0] + [t.size for t in types])
         logger.debug(f"{splitters=}")
-        # Create the empty profiles
-        profiles = [
-            [
-                t((r / r.sum(axis=0)) if rescale else r)
-                for i, t in enumerate(types)
-                if not np.any(
-                    np.isnan(r := profile_ratios[splitters[i] : splitters[i + 1]])
-                )
-            ]
-            for profile_ratios in ratios
-        ]
-        return cls(profiles)
+        ratios = np.asarray(ratios, dtype=float).reshape(-1, splitters[-1])
+        n = len(ratios)
+        obj = cls([])
+        obj._profiles = {}
+        obj._indexes = {}
+        # Each type is created at once from the rows which have this type
+        for i, t in enumerate(types):
+            r = ratios[:, splitters[i] : splitters[i + 1]]
+            has_type = ~np.any(np.isnan(r), axis=1)
+            if not np.any(has_type):
+                continue
+            r = r[has_type]
+            if rescale:
+                r = r / r.sum(axis=1, keepdims=True)
+            obj._profiles[t] = t(r)
+            obj._indexes[t] = np.full(n, fill_value=-1, dtype=int)
+            obj._indexes[t][has_type] = np.arange(len(r))
+        if not obj._profiles:
+            # Empty profiles
+            obj._indexes[None] = np.full(n, fill_value=-1, dtype=int)
+        return obj
 
     def __eq__(self, __value: object) -> bool:
         if not isinstance(__value, CompositeTemporalProfiles):
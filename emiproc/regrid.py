@@ -1,31 +1,55 @@
 """Different functions for doing the weights remapping."""
 
 from __future__ import annotations
+import json
 import logging
+import math
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import cached_property
 from pathlib import Path
 from warnings import warn
+import dask.array as dask_array
 import numpy as np
 import geopandas as gpd
-from typing import TYPE_CHECKING, Iterable
+import pandas as pd
+import shapely
+from typing import TYPE_CHECKING, Any, Iterable
 from shapely.geometry import Point, MultiPolygon, Polygon
 from emiproc.utilities import ProgressIndicator
-from scipy.sparse import coo_array, dok_matrix
-from emiproc.grids import Grid
+from scipy.sparse import coo_array, csr_array, diags_array, dok_matrix
+from emiproc.grids import Grid, HexGrid, RegularGrid
+from emiproc.inventories import EmissionsArray, Inventory, _copy_frame
+from emiproc.inventories.lazy import LazyInventory
 from emiproc.profiles.operators import get_weights_of_gdf_profiles, remap_profiles
+from emiproc.utils.chunks import add_chunks, remap_chunks
+from emiproc.weights_cache import (
+    WeightsCache,
+    fingerprint_geometries,
+    fingerprint_mask,
+    make_cache_key,
+    resolve_cache,
+)
 
 logger = logging.getLogger("emiproc.regrid")
 
 if TYPE_CHECKING:
     from os import PathLike
-    from emiproc.inventories import Inventory
 
 
 def get_weights_mapping(
     weights_filepath: Path | None,
     shapes_inv: Iterable[Polygon | Point],
-    shapes_out: Iterable[Polygon],
+    shapes_out: Iterable[Polygon] | Grid,
     loop_over_inv_objects: bool = False,
     method: str = "new",
+    cache: WeightsCache | bool = True,
+    n_workers: int = 1,
+    mask: np.ndarray | None = None,
+    inv_tree: shapely.STRtree | None = None,
+    key: str | None = None,
 ) -> dict[str, np.ndarray]:
     """Get the requested weights mapping.
 
@@ -33,13 +57,23 @@ def get_weights_mapping(
     See that function for the other arguments.
     and save the weights once computed.
 
+    The weights are identified by a key computed from the geometries,
+    their crs, the method and `loop_over_inv_objects`
+    (see :py:mod:`emiproc.weights_cache`).
+    Weights that were computed for other inputs are never reused.
+
     :arg weights_filepath: The name of the file in which to save the
         weights data. Emiproc will add some metadata to it.
         This file has to be a npz archive ending with suffix .npz .
         Emiproc will add the suffix if you don't.
+        If the file exists but was computed for other inputs, or has no key
+        (saved by an older version of emiproc), the weights are recomputed
+        and the file is overwritten.
     :arg shapes_inv: The shapes of the inventory.
         Shapes from which the remapping will be done.
     :arg shapes_out: The shapes to which the remapping will be done.
+        Can be a grid, which is then identified by its
+        :py:attr:`~emiproc.grids.Grid.fingerprint` instead of its geometries.
     :arg loop_over_inv_objects: Whether the loop should happend on the
         the inventory objects instead of the output shapes.
         This will be where the performance bottleneck resides.
@@ -47,6 +81,20 @@ def get_weights_mapping(
         can make big differences in some cases.
         If you have point sources in your shapes_inv, this MUST be set
         to True.
+    :arg cache: The cache in which the weights are looked for and stored.
+        True uses the default cache of emiproc (if one was set, see
+        :py:func:`emiproc.weights_cache.set_weights_cache`), False disables it.
+    :arg n_workers: The number of workers used for calculating the weights.
+        See :py:func:`calculate_weights_mapping`.
+    :arg mask: Boolean array selecting the inventory shapes for which the
+        weights are calculated. The other shapes get no weights.
+        Usually the shapes without emissions, see :py:func:`get_emissions_mask`.
+        The mask is part of the key of the weights, so the weights can be
+        reused for all the inventories with the same mask.
+    :arg inv_tree: A spatial index of the inventory shapes (after the mask),
+        see :py:func:`calculate_weights_mapping`.
+    :arg key: The key of the weights, if it was already computed from the
+        same arguments (ex. by :py:func:`get_weights_matrix`).
 
 
     """
@@ -57,8 +105,16 @@ def get_weights_mapping(
         f"{shapes_out=},"
         f"{loop_over_inv_objects=},"
         f"{method=},"
+        f"{cache=},"
         ")"
     )
+    cache = resolve_cache(cache)
+    if mask is not None:
+        mask = np.asarray(mask, dtype=bool)
+        if not isinstance(shapes_inv, (gpd.GeoSeries, gpd.GeoDataFrame)):
+            shapes_inv = gpd.GeoSeries(shapes_inv)
+        if len(mask) != len(shapes_inv):
+            raise ValueError(f"{len(mask)=} does not match {len(shapes_inv)=}")
     if weights_filepath is not None:
         weights_filepath = Path(weights_filepath).with_suffix(f".npz")
         if loop_over_inv_objects:
@@ -67,26 +123,469 @@ def get_weights_mapping(
                 weights_filepath.stem + "_loopinv"
             )
 
-    if (weights_filepath is None) or (not weights_filepath.exists()):
-        w_mapping = calculate_weights_mapping(
-            shapes_inv, shapes_out, loop_over_inv_objects, method
+    if key is None and (weights_filepath is not None or cache is not None):
+        key = _weights_mapping_key(
+            shapes_inv, shapes_out, loop_over_inv_objects, method, mask
         )
-        if weights_filepath is not None:
-            # Make sure dir is created
-            weights_filepath.parent.mkdir(exist_ok=True, parents=True)
-            np.savez(weights_filepath, **w_mapping)
+    if isinstance(shapes_out, Grid):
+        shapes_out = shapes_out.gdf.geometry
 
-    else:
+    w_mapping = None
+    if weights_filepath is not None and weights_filepath.exists():
         w_mapping = {**np.load(weights_filepath)}
+        file_key = w_mapping.pop("cache_key", None)
+        if file_key is None:
+            # Files saved by older versions cannot be checked
+            logger.warning(
+                f"{weights_filepath} has no cache key, it cannot be checked that it"
+                " matches the shapes. The weights will be recomputed."
+            )
+            w_mapping = None
+        elif str(file_key) != key:
+            logger.warning(
+                f"{weights_filepath} was computed for other shapes or parameters."
+                " The weights will be recomputed."
+            )
+            w_mapping = None
+
+    if w_mapping is None and cache is not None:
+        w_mapping = cache.load(key)
+        if w_mapping is not None and weights_filepath is not None:
+            _save_weights_file(weights_filepath, w_mapping, key)
+
+    if w_mapping is None:
+        w_mapping = calculate_weights_mapping(
+            shapes_inv if mask is None else shapes_inv[mask],
+            shapes_out,
+            loop_over_inv_objects,
+            method,
+            n_workers=n_workers,
+            inv_tree=inv_tree,
+        )
+        if cache is not None:
+            cache.save(
+                key,
+                w_mapping,
+                metadata={
+                    "kind": "weights_mapping",
+                    "n_shapes_inv": len(shapes_inv),
+                    "n_shapes_out": len(shapes_out),
+                    "crs_inv": str(getattr(shapes_inv, "crs", None)),
+                    "crs_out": str(getattr(shapes_out, "crs", None)),
+                    "loop_over_inv_objects": loop_over_inv_objects,
+                    "method": method,
+                    "n_masked": 0 if mask is None else int((~mask).sum()),
+                },
+            )
+        if weights_filepath is not None:
+            _save_weights_file(weights_filepath, w_mapping, key)
 
     return w_mapping
 
 
+def _weights_mapping_key(
+    shapes_inv: Iterable[Polygon | Point],
+    shapes_out: Iterable[Polygon] | Grid,
+    loop_over_inv_objects: bool,
+    method: str,
+    mask: np.ndarray | None,
+) -> str:
+    """Key identifying the weights of :py:func:`get_weights_mapping`."""
+    parameters = dict(
+        kind="weights_mapping",
+        shapes_inv=fingerprint_geometries(shapes_inv),
+        shapes_out=(
+            f"grid:{shapes_out.fingerprint}"
+            if isinstance(shapes_out, Grid)
+            else fingerprint_geometries(shapes_out)
+        ),
+        loop_over_inv_objects=loop_over_inv_objects,
+        method=method,
+    )
+    if mask is not None:
+        # Keep the same key as before when no mask is used
+        parameters["mask"] = fingerprint_mask(mask)
+    return make_cache_key(**parameters)
+
+
+def get_emissions_mask(inv: Inventory) -> np.ndarray:
+    """Return a mask of the shapes of the inventory which have emissions.
+
+    A shape has emissions if any of the columns of the main gdf is not zero.
+    This can be given as `mask` to :py:func:`get_weights_mapping`, to not
+    calculate the weights of the shapes without emissions (ex. over the ocean).
+    """
+    emissions = inv.emissions
+    if emissions is None:
+        return np.array([], dtype=bool)
+    return emissions.nonzero_cells()
+
+
+def _save_weights_file(
+    weights_filepath: Path, w_mapping: dict[str, np.ndarray], key: str
+):
+    """Save the weights with the key of the inputs used."""
+    # Make sure dir is created
+    weights_filepath.parent.mkdir(exist_ok=True, parents=True)
+    np.savez(weights_filepath, **w_mapping, cache_key=np.array(key))
+
+
+class WeightsMatrix:
+    """A weights mapping stored as a sparse matrix.
+
+    The matrix has one row per output shape and one column per inventory shape,
+    such that remapping values is a product of the matrix with the values.
+    It is stored in the CSR format, which is the fastest for this product.
+    The transposed matrix, used for the adjoint operation (from the output
+    shapes back to the inventory shapes), is built only when needed.
+
+    The matrix can be saved in a directory containing the uncompressed arrays
+    of the CSR format, which are memory mapped when loaded.
+    Loading is then almost instantaneous and the weights are read from the
+    disk only when they are used.
+
+    :arg matrix: The sparse matrix, of shape (n_output, n_inv).
+    :arg source_shape: The shape of the inventory values. Defaults to (n_inv,).
+    :arg target_shape: The shape of the remapped values. Defaults to (n_output,).
+    :arg metadata: Information about the weights. Must be json serializable.
+    """
+
+    matrix: csr_array
+    source_shape: tuple[int, ...]
+    target_shape: tuple[int, ...]
+    metadata: dict[str, Any]
+
+    def __init__(
+        self,
+        matrix: csr_array | coo_array,
+        source_shape: tuple[int, ...] | None = None,
+        target_shape: tuple[int, ...] | None = None,
+        metadata: dict[str, Any] | None = None,
+    ):
+        if not isinstance(matrix, csr_array):
+            matrix = csr_array(matrix)
+        self.matrix = matrix
+        n_out, n_inv = matrix.shape
+        self.source_shape = (n_inv,) if source_shape is None else tuple(source_shape)
+        self.target_shape = (n_out,) if target_shape is None else tuple(target_shape)
+        if math.prod(self.source_shape) != n_inv:
+            raise ValueError(
+                f"{self.source_shape=} does not match the {n_inv} columns of the"
+                " matrix."
+            )
+        if math.prod(self.target_shape) != n_out:
+            raise ValueError(
+                f"{self.target_shape=} does not match the {n_out} rows of the"
+                " matrix."
+            )
+        self.metadata = {} if metadata is None else dict(metadata)
+
+    def __repr__(self) -> str:
+        return (
+            f"WeightsMatrix({self.source_shape} -> {self.target_shape},"
+            f" nnz={self.nnz})"
+        )
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        """Shape of the matrix (n_output, n_inv)."""
+        return self.matrix.shape
+
+    @property
+    def nnz(self) -> int:
+        """Number of weights stored."""
+        return self.matrix.nnz
+
+    @classmethod
+    def from_mapping(
+        cls,
+        w_mapping: dict[str, np.ndarray],
+        source_shape: int | tuple[int, ...],
+        target_shape: int | tuple[int, ...],
+        metadata: dict[str, Any] | None = None,
+    ) -> WeightsMatrix:
+        """Create the matrix from a weights mapping.
+
+        See :py:func:`calculate_weights_mapping` for the format of the mapping.
+        Duplicated pairs of indexes are summed.
+        """
+        if isinstance(source_shape, int):
+            source_shape = (source_shape,)
+        if isinstance(target_shape, int):
+            target_shape = (target_shape,)
+        matrix = coo_array(
+            (
+                w_mapping["weights"],
+                (w_mapping["output_indexes"], w_mapping["inv_indexes"]),
+            ),
+            shape=(math.prod(target_shape), math.prod(source_shape)),
+            dtype=float,
+        ).tocsr()
+        return cls(matrix, source_shape, target_shape, metadata)
+
+    def to_mapping(self) -> dict[str, np.ndarray]:
+        """Convert the matrix to a weights mapping.
+
+        The weights are sorted by output index and then inventory index.
+        """
+        matrix = self.matrix.copy()
+        matrix.sort_indices()
+        coo = matrix.tocoo()
+        return {
+            "inv_indexes": coo.col.astype(int),
+            "output_indexes": coo.row.astype(int),
+            "weights": coo.data,
+        }
+
+    @cached_property
+    def transpose(self) -> csr_array:
+        """The transposed matrix in the CSR format, of shape (n_inv, n_output)."""
+        return self.matrix.T.tocsr()
+
+    def remap(self, values: np.ndarray) -> np.ndarray:
+        """Remap values from the inventory shapes to the output shapes.
+
+        :arg values: Array of shape `source_shape` (or flattened), with
+            optionally additional trailing dimensions
+            (e.g. one column per substance).
+        :return: Array of shape `target_shape` plus the additional dimensions.
+        """
+        return self._apply(self.matrix, values, self.source_shape, self.target_shape)
+
+    def adjoint(self, values: np.ndarray) -> np.ndarray:
+        """Apply the transposed weights, from the output shapes to the inventory shapes.
+
+        :arg values: Array of shape `target_shape` (or flattened), with
+            optionally additional trailing dimensions.
+        :return: Array of shape `source_shape` plus the additional dimensions.
+        """
+        return self._apply(self.transpose, values, self.target_shape, self.source_shape)
+
+    @staticmethod
+    def _apply(
+        matrix: csr_array,
+        values: np.ndarray,
+        in_shape: tuple[int, ...],
+        out_shape: tuple[int, ...],
+    ) -> np.ndarray:
+        values = np.asarray(values)
+        n_in = matrix.shape[1]
+        if values.shape[: len(in_shape)] == in_shape:
+            extra_dims = values.shape[len(in_shape) :]
+        elif values.shape[:1] == (n_in,):
+            extra_dims = values.shape[1:]
+        else:
+            raise ValueError(
+                f"Cannot apply weights of shape {in_shape} to values of shape"
+                f" {values.shape}."
+            )
+        flat = values.reshape((n_in, *extra_dims))
+        return (matrix @ flat).reshape((*out_shape, *extra_dims))
+
+    def save(self, path: PathLike):
+        """Save the matrix in a directory.
+
+        The arrays of the CSR format are saved as uncompressed ``.npy`` files
+        and the shapes and metadata in a ``metadata.json`` file.
+        The directory is first written under a temporary name, such that
+        other processes never read an incomplete matrix.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.matrix.sort_indices()
+        tmp_dir = Path(tempfile.mkdtemp(dir=path.parent, prefix=f".{path.name}"))
+        for name in ["data", "indices", "indptr"]:
+            np.save(tmp_dir / f"{name}.npy", getattr(self.matrix, name))
+        with open(tmp_dir / "metadata.json", "w") as f:
+            json.dump(
+                {
+                    "format": "csr",
+                    "shape": list(self.shape),
+                    "source_shape": list(self.source_shape),
+                    "target_shape": list(self.target_shape),
+                    "nnz": self.nnz,
+                    "metadata": self.metadata,
+                },
+                f,
+                indent=2,
+                default=str,
+            )
+        if path.exists():
+            shutil.rmtree(path)
+        os.replace(tmp_dir, path)
+
+    @classmethod
+    def load(cls, path: PathLike, mmap_mode: str | None = "r") -> WeightsMatrix:
+        """Load a matrix saved with :py:meth:`save`.
+
+        :arg path: The directory of the matrix.
+        :arg mmap_mode: The mode for memory mapping the arrays,
+            see :py:func:`numpy.load`. None loads the arrays in memory.
+        """
+        path = Path(path)
+        with open(path / "metadata.json") as f:
+            info = json.load(f)
+        arrays = [
+            np.load(path / f"{name}.npy", mmap_mode=mmap_mode)
+            for name in ["data", "indices", "indptr"]
+        ]
+        matrix = csr_array(tuple(arrays), shape=tuple(info["shape"]), copy=False)
+        return cls(matrix, info["source_shape"], info["target_shape"], info["metadata"])
+
+
+def compose_weights(
+    first: WeightsMatrix,
+    second: WeightsMatrix,
+    prune_threshold: float = 1e-12,
+) -> WeightsMatrix:
+    """Compose two weights matrices, A -> B and B -> C, into A -> C.
+
+    This allows to remap on a new grid from an intermediate grid, for which
+    the weights are already known, with a sparse product instead
+    of geometric intersections.
+
+    The composed weights are only approximations of the weights calculated
+    directly from A to C: the emissions of a shape of A are distributed
+    on B before being distributed on C.
+
+    :arg first: The weights from A to B.
+    :arg second: The weights from B to C.
+    :arg prune_threshold: Weights smaller than this value are removed.
+
+    :return: The weights from A to C.
+        The mass conservation error is logged and stored in the metadata
+        under 'mass_error': the maximum and the total absolute difference
+        between the sum of the weights of each shape of A in the composed and
+        in the first weights, and the total weight removed by the pruning.
+    """
+    if first.shape[0] != second.shape[1]:
+        raise ValueError(
+            f"Cannot compose weights to {first.target_shape} with weights from"
+            f" {second.source_shape}."
+        )
+    matrix = (second.matrix @ first.matrix).tocsr()
+    weights_before_pruning = matrix.sum(axis=0)
+
+    small = np.abs(matrix.data) < prune_threshold
+    pruned = float(np.abs(matrix.data[small]).sum())
+    if np.any(small):
+        matrix.data[small] = 0.0
+        matrix.eliminate_zeros()
+
+    # Sum of the weights of each inventory shape
+    error = np.abs(matrix.sum(axis=0) - first.matrix.sum(axis=0))
+    mass_error = {
+        "max": float(error.max()) if len(error) else 0.0,
+        "total": float(error.sum()),
+        "pruned": pruned,
+    }
+    logger.info(
+        f"Composed weights {first.source_shape} -> {second.target_shape},"
+        f" {matrix.nnz} weights ({int(small.sum())} pruned),"
+        f" mass conservation error: {mass_error}."
+    )
+    if not np.allclose(weights_before_pruning, matrix.sum(axis=0), atol=1e-6):
+        logger.warning(
+            f"Pruning the weights below {prune_threshold=} changed the mass"
+            " of some shapes by more than 1e-6."
+        )
+
+    return WeightsMatrix(
+        matrix,
+        first.source_shape,
+        second.target_shape,
+        metadata={
+            "composed_from": [first.metadata, second.metadata],
+            "prune_threshold": prune_threshold,
+            "mass_error": mass_error,
+        },
+    )
+
+
+def get_weights_matrix(
+    weights_path: PathLike | None,
+    shapes_inv: Iterable[Polygon | Point],
+    shapes_out: Iterable[Polygon] | Grid,
+    loop_over_inv_objects: bool = False,
+    method: str = "new",
+    cache: WeightsCache | bool = True,
+    n_workers: int = 1,
+    mask: np.ndarray | None = None,
+    inv_tree: shapely.STRtree | None = None,
+) -> WeightsMatrix:
+    """Get the weights as a :py:class:`WeightsMatrix`.
+
+    Same as :py:func:`get_weights_mapping` but the weights are stored
+    as a matrix in a directory, from which they are memory mapped.
+
+    :arg weights_path: The directory in which to save the weights.
+        Emiproc will add the suffix .weights if you don't.
+        If the directory exists but the weights were computed for other inputs,
+        the weights are recomputed and the directory is overwritten.
+        A .npz file with the same name, saved by :py:func:`get_weights_mapping`
+        (ex. by older versions of :py:func:`remap_inventory`), is read if the
+        directory does not exist yet.
+
+    See :py:func:`get_weights_mapping` for the other arguments.
+    """
+    key = None
+    weights_file = None
+    if weights_path is not None:
+        weights_path = Path(weights_path)
+        # Same name as the file of get_weights_mapping
+        weights_file = weights_path.with_suffix(".npz")
+        weights_path = weights_path.with_suffix(".weights")
+        if loop_over_inv_objects:
+            # Add a small marker
+            weights_path = weights_path.with_stem(weights_path.stem + "_loopinv")
+            weights_file = weights_file.with_stem(weights_file.stem + "_loopinv")
+
+        key = _weights_mapping_key(
+            shapes_inv, shapes_out, loop_over_inv_objects, method, mask
+        )
+        if (weights_path / "metadata.json").is_file():
+            w_matrix = WeightsMatrix.load(weights_path)
+            if w_matrix.metadata.get("cache_key") == key:
+                return w_matrix
+            logger.warning(
+                f"{weights_path} was computed for other shapes or parameters."
+                " The weights will be recomputed."
+            )
+        elif weights_file.is_file():
+            logger.info(
+                f"Reading the weights from {weights_file}, they will be saved as"
+                f" a matrix in {weights_path}."
+            )
+        else:
+            weights_file = None
+
+    w_mapping = get_weights_mapping(
+        weights_file,
+        shapes_inv,
+        shapes_out,
+        loop_over_inv_objects=loop_over_inv_objects,
+        method=method,
+        cache=cache,
+        n_workers=n_workers,
+        mask=mask,
+        inv_tree=inv_tree,
+        key=key,
+    )
+    w_matrix = WeightsMatrix.from_mapping(w_mapping, len(shapes_inv), len(shapes_out))
+    if weights_path is not None:
+        w_matrix.metadata["cache_key"] = key
+        w_matrix.save(weights_path)
+    return w_matrix
+
+
 def calculate_weights_mapping(
     shapes_inv: Iterable[Polygon | Point | MultiPolygon],
     shapes_out: Iterable[Polygon],
     loop_over_inv_objects: bool = False,
     method: str = "new",
+    n_workers: int = 1,
+    executor: str = "thread",
+    inv_tree: shapely.STRtree | None = None,
 ) -> dict[str, np.ndarray]:
     """Return a dictionary with the mapping.
 
@@ -103,6 +602,18 @@ def calculate_weights_mapping(
     :arg weights: The weight of this connexion (between 0 and 1).
         It means the percentage of the inv shape that should go in
         the output.
+
+    :arg n_workers: The number of workers to use with the 'new' method.
+        If more than 1, the looped shapes (the output shapes, or the inventory
+        shapes if `loop_over_inv_objects`) are partitioned in spatial blocks,
+        which are processed in parallel. The result does not depend on the
+        number of workers.
+    :arg executor: The pool used for the workers, 'thread' or 'process'.
+    :arg inv_tree: A spatial index (:py:class:`shapely.STRtree`) built on
+        `shapes_inv`, used with the 'new' method when not
+        `loop_over_inv_objects`, instead of building a spatial index of the
+        output shapes. This allows to reuse the same index for
+        many output grids.
     """
 
     # shapes_inv = inv.gdf.geometry
@@ -156,6 +667,8 @@ def calculate_weights_mapping(
     else:
         raise TypeError(f"'shapes_looped' cannot be {type(shapes_looped)}")
     shapes_looped: gpd.GeoSeries
+    # The spatial index of the inventory is built on all the shapes
+    shapes_vect_all = shapes_vect
     minx, miny, maxx, maxy = shapes_looped.total_bounds
     if minx != maxx and miny != maxy:
         # Seems to remove all the data if boundaries are equal
@@ -164,9 +677,22 @@ def calculate_weights_mapping(
 
     progress = ProgressIndicator(len(shapes_looped))
 
-    if method == "old":
+    if method == "new" and inv_tree is not None and not loop_over_inv_objects:
+        w_mapping = _tree_intersection_weights(inv_tree, shapes_vect_all, shapes_looped)
+
+    elif (
+        method == "new"
+        and loop_over_inv_objects
+        and len(shapes_looped) > 0
+        and np.all(shapely.get_type_id(shapes_looped.to_numpy()) == 0)
+    ):
+        # Only points, no intersection needed
+        w_mapping = _points_weights(shapes_vect, shapes_looped)
+
+    elif method == "old":
         # Loop over the output shapes
-        for looped_index, shape in enumerate(shapes_looped):
+        # The index labels are used, as the shapes can be masked
+        for looped_index, shape in shapes_looped.items():
             progress.step()
 
             intersect = shapes_vect.intersects(shape)
@@ -210,64 +736,753 @@ def calculate_weights_mapping(
                 w_mapping[key] = np.concatenate(l, axis=0).reshape(-1)
 
     elif method == "new":
-        # Merge the two geometries using intersections
-        gdf_in = gpd.GeoDataFrame(geometry=shapes_vect)
-        gdf_out = gpd.GeoDataFrame(geometry=shapes_looped)
-        gdf_weights = gdf_in.sjoin(gdf_out, rsuffix="out")
-        gdf_weights = gdf_weights.merge(
-            gdf_out, left_on="index_out", right_index=True, suffixes=("", "_out")
-        )
-        gdf_weights.index.name = "index_inv"
-        gdf_weights = gdf_weights.assign(
-            geometry_inter=lambda d: (
-                d["geometry"].intersection(gpd.GeoSeries(d["geometry_out"]))
+        if n_workers > 1:
+            partial_mappings = _partitioned_intersection_weights(
+                shapes_vect,
+                shapes_looped,
+                loop_over_inv_objects,
+                n_workers=n_workers,
+                executor=executor,
             )
+        else:
+            partial_mappings = [
+                _intersection_weights(shapes_vect, shapes_looped, loop_over_inv_objects)
+            ]
+        for key in w_mapping:
+            w_mapping[key] = np.concatenate(
+                [m[key] for m in partial_mappings] or [np.array([])]
+            )
+        # Sort by output and then inventory shapes, independently of the blocks
+        order = np.lexsort((w_mapping["inv_indexes"], w_mapping["output_indexes"]))
+        w_mapping = {key: value[order] for key, value in w_mapping.items()}
+
+    else:
+        raise ValueError(f"'method' must be one of ['new', 'old'] not {method}.")
+    # Ensure types
+    w_mapping["output_indexes"] = np.array(w_mapping["output_indexes"], dtype=int)
+    w_mapping["inv_indexes"] = np.array(w_mapping["inv_indexes"], dtype=int)
+    w_mapping["weights"] = np.array(w_mapping["weights"], dtype=float)
+
+    return w_mapping
+
+
+def _intersection_weights(
+    shapes_vect: gpd.GeoSeries,
+    shapes_looped: gpd.GeoSeries,
+    loop_over_inv_objects: bool,
+) -> dict[str, np.ndarray]:
+    """Calculate the weights of the intersections with a spatial join.
+
+    This is the 'new' method of :py:func:`calculate_weights_mapping`.
+    The mapping returned is not sorted.
+    """
+    w_mapping = {}
+    # Merge the two geometries using intersections
+    gdf_in = gpd.GeoDataFrame(geometry=shapes_vect)
+    gdf_out = gpd.GeoDataFrame(geometry=shapes_looped)
+    gdf_weights = gdf_in.sjoin(gdf_out, rsuffix="out")
+    gdf_weights = gdf_weights.merge(
+        gdf_out, left_on="index_out", right_index=True, suffixes=("", "_out")
+    )
+    gdf_weights.index.name = "index_inv"
+    gdf_weights = gdf_weights.assign(
+        geometry_inter=lambda d: (
+            d["geometry"].intersection(gpd.GeoSeries(d["geometry_out"]))
         )
+    )
 
-        if loop_over_inv_objects:
-            # Calculate weights for polygons
-            gdf_weights["weights"] = (
-                gdf_weights.geometry_inter.area / gdf_weights.geometry_out.area
+    if loop_over_inv_objects:
+        # Calculate weights for polygons
+        gdf_weights["weights"] = (
+            gdf_weights.geometry_inter.area / gdf_weights.geometry_out.area
+        )
+
+        # Process the points
+        gdf_points = gdf_weights.loc[gdf_weights.geometry_out.type == "Point"]
+        if gdf_points.shape[0]:
+            nareas_points = gdf_points.groupby("index_out").transform(np.count_nonzero)[
+                "geometry"
+            ]
+            gdf_weights.loc[gdf_weights.geometry_out.type == "Point", "weights"] = (
+                1 / nareas_points
             )
 
-            # Process the points
-            gdf_points = gdf_weights.loc[gdf_weights.geometry_out.type == "Point"]
-            if gdf_points.shape[0]:
-                nareas_points = gdf_points.groupby("index_out").transform(
-                    np.count_nonzero
-                )["geometry"]
-                gdf_weights.loc[gdf_weights.geometry_out.type == "Point", "weights"] = (
-                    1 / nareas_points
-                )
+        # Extract indices
+        w_mapping["inv_indexes"] = gdf_weights.index_out.to_numpy()
+        w_mapping["output_indexes"] = gdf_weights.index.to_numpy()
+
+    else:
+        # Calculate weights and extract indices
+        gdf_weights["weights"] = (
+            gdf_weights.geometry_inter.area / gdf_weights.geometry.area
+        )
+        w_mapping["inv_indexes"] = gdf_weights.index.to_numpy()
+        w_mapping["output_indexes"] = gdf_weights.index_out.to_numpy()
+
+    w_mapping["weights"] = gdf_weights.weights.to_numpy()
+    # Ensure types
+    return {
+        "inv_indexes": np.asarray(w_mapping["inv_indexes"], dtype=int),
+        "output_indexes": np.asarray(w_mapping["output_indexes"], dtype=int),
+        "weights": np.asarray(w_mapping["weights"], dtype=float),
+    }
+
+
+def _split_points_weights(
+    point_indexes: np.ndarray, cell_indexes: np.ndarray
+) -> np.ndarray:
+    """Weights of points falling in one or more cells.
+
+    A point on the boundary between n cells is split equally among them.
+    """
+    _, inverse, counts = np.unique(
+        point_indexes, return_inverse=True, return_counts=True
+    )
+    return 1.0 / counts[inverse]
+
+
+def _tree_intersection_weights(
+    inv_tree: shapely.STRtree,
+    shapes_inv: gpd.GeoSeries,
+    shapes_out: gpd.GeoSeries,
+) -> dict[str, np.ndarray]:
+    """Calculate the weights of the intersections with the index of the inventory.
+
+    Same as the 'new' method of :py:func:`calculate_weights_mapping`, but the
+    spatial index is built on the inventory shapes and can be reused.
+    """
+    geoms_inv = shapes_inv.to_numpy()
+    if len(inv_tree) != len(geoms_inv):
+        raise ValueError(f"{len(inv_tree)=} does not match {len(shapes_inv)=}.")
+    geoms_out = shapes_out.to_numpy()
+    out_pos, inv_pos = inv_tree.query(geoms_out, predicate="intersects")
+    areas = shapely.area(shapely.intersection(geoms_inv[inv_pos], geoms_out[out_pos]))
+    w_mapping = {
+        "inv_indexes": np.asarray(shapes_inv.index.to_numpy()[inv_pos], dtype=int),
+        "output_indexes": np.asarray(shapes_out.index.to_numpy()[out_pos], dtype=int),
+        "weights": areas / shapely.area(geoms_inv[inv_pos]),
+    }
+    order = np.lexsort((w_mapping["inv_indexes"], w_mapping["output_indexes"]))
+    return {key: value[order] for key, value in w_mapping.items()}
+
+
+def _points_weights(
+    shapes_vect: gpd.GeoSeries,
+    points: gpd.GeoSeries,
+) -> dict[str, np.ndarray]:
+    """Calculate the weights of points in the shapes with a spatial index.
+
+    Same as the 'new' method of :py:func:`calculate_weights_mapping` with
+    `loop_over_inv_objects` but without any intersection.
+    The indexes are the labels of the series.
+    """
+    tree = shapely.STRtree(shapes_vect.to_numpy())
+    point_pos, shape_pos = tree.query(points.to_numpy(), predicate="intersects")
+    w_mapping = {
+        "inv_indexes": np.asarray(points.index.to_numpy()[point_pos], dtype=int),
+        "output_indexes": np.asarray(
+            shapes_vect.index.to_numpy()[shape_pos], dtype=int
+        ),
+        "weights": _split_points_weights(point_pos, shape_pos),
+    }
+    order = np.lexsort((w_mapping["inv_indexes"], w_mapping["output_indexes"]))
+    return {key: value[order] for key, value in w_mapping.items()}
+
 
-            # Extract indices
-            gdf_weights = gdf_weights.sort_values(by=["index_inv", "index_out"])
-            w_mapping["inv_indexes"] = gdf_weights.index_out.to_numpy()
-            w_mapping["output_indexes"] = gdf_weights.index.to_numpy()
+def _points_candidate_cells(
+    x: np.ndarray, y: np.ndarray, grid: RegularGrid | HexGrid, tol: float = 1e-9
+) -> tuple[np.ndarray, np.ndarray, np.ndarray] | None:
+    """Find the cells of a grid in which points can be, with index arithmetic.
 
+    :return: The positions of the points, the indexes of the candidate cells
+        and whether the point is for sure in the cell.
+        Candidates not sure must be checked geometrically.
+        None if the grid is not regular.
+    """
+    if isinstance(grid, HexGrid):
+        x_lower = np.asarray(grid.lon_range, dtype=float) - grid.dx / 2
+        y_lower = np.asarray(grid.lat_range, dtype=float) - grid.dy / 2
+    elif grid.is_regular:
+        x_lower, y_lower = _regular_grid_lower_edges(grid)
+    else:
+        return None
+    if len(x_lower) != grid.nx or len(y_lower) != grid.ny:
+        return None
+
+    offsets = []
+    for coords, lower in [(x, x_lower), (y, y_lower)]:
+        # Cells can be ordered decreasingly
+        step = lower[1] - lower[0] if len(lower) > 1 else 1.0
+        if len(lower) > 1 and not np.allclose(np.diff(lower), step):
+            return None
+        f = (coords - lower[0]) / step
+        if step < 0:
+            # Cell i is then in (i - 1, i]
+            f = f + 1
+        i = np.floor(f).astype(int)
+        frac = f - i
+        if isinstance(grid, HexGrid):
+            # The hexagons are larger than the rectangle of their row and column
+            ambiguous = np.ones_like(f, dtype=bool)
         else:
-            # Calculate weights and extract indices
-            gdf_weights["weights"] = (
-                gdf_weights.geometry_inter.area / gdf_weights.geometry.area
+            ambiguous = (frac < tol) | (frac > 1 - tol)
+        offsets.append((i, ambiguous, len(lower)))
+
+    (ix, amb_x, nx), (iy, amb_y, ny) = offsets
+    point_pos, cells, sure = [], [], []
+    for off_x in [-1, 0, 1]:
+        for off_y in [-1, 0, 1]:
+            mask = (amb_x | (off_x == 0)) & (amb_y | (off_y == 0))
+            cx, cy = ix[mask] + off_x, iy[mask] + off_y
+            in_grid = (cx >= 0) & (cx < nx) & (cy >= 0) & (cy < ny)
+            pos = np.flatnonzero(mask)[in_grid]
+            point_pos.append(pos)
+            cells.append(cx[in_grid] * ny + cy[in_grid])
+            sure.append(~(amb_x[pos] | amb_y[pos]))
+
+    return np.concatenate(point_pos), np.concatenate(cells), np.concatenate(sure)
+
+
+def get_point_weights_mapping(
+    points: gpd.GeoSeries,
+    shapes_out: gpd.GeoSeries | None,
+    grid_out: Grid,
+) -> dict[str, np.ndarray] | None:
+    """Get the weights mapping of points on the cells of a grid.
+
+    For :py:class:`~emiproc.grids.RegularGrid` and
+    :py:class:`~emiproc.grids.HexGrid`, the cell of each point is found
+    from its coordinates with index arithmetic.
+    Only the points close to the boundary of a cell are checked geometrically.
+    The weights are the same as the ones of :py:func:`calculate_weights_mapping`
+    with `loop_over_inv_objects`: a point on the boundary of n cells is
+    split equally among them and the points outside of the grid are dropped.
+
+    The indexes in the mapping are the positions in the series.
+
+    `shapes_out` can be None if the output shapes are all the cells of
+    a :py:class:`~emiproc.grids.RegularGrid`, in their order and crs.
+    Only the polygons of the cells to check are then created.
+
+    :return: The weights mapping or None if the shapes are not only points,
+        or are not the cells of the grid.
+        In this case use :py:func:`get_weights_mapping` .
+    """
+    if not isinstance(grid_out, (RegularGrid, HexGrid)):
+        return None
+    if shapes_out is None and isinstance(grid_out, HexGrid):
+        shapes_out = gpd.GeoSeries(grid_out.cells_as_polylist, crs=grid_out.crs)
+    if len(points) == 0:
+        return None
+    if points.crs != (grid_out.crs if shapes_out is None else shapes_out.crs):
+        return None
+    geoms = points.to_numpy()
+    if not np.all(shapely.get_type_id(geoms) == 0):
+        return None
+
+    # Cell of the grid at each position of the shapes
+    if isinstance(grid_out, HexGrid):
+        cells_out = _hex_cells_indexes(shapes_out, grid_out)
+    else:
+        cells_out = _regular_cells_indexes(shapes_out, grid_out)
+    if cells_out is None:
+        return None
+
+    candidates = _points_candidate_cells(
+        shapely.get_x(geoms), shapely.get_y(geoms), grid_out
+    )
+    if candidates is None:
+        return None
+    point_pos, cells, sure = candidates
+
+    position_of_cell = np.full(len(grid_out), -1, dtype=int)
+    position_of_cell[cells_out] = np.arange(len(cells_out))
+    output_pos = position_of_cell[cells]
+    mask = output_pos >= 0
+    point_pos, output_pos, sure = point_pos[mask], output_pos[mask], sure[mask]
+
+    # Check the points close to the boundaries of the cells
+    check = ~sure
+    keep = sure.copy()
+    if shapes_out is None:
+        # Only the cells to check are created
+        cells_to_check = grid_out.cell_polygons(output_pos[check])
+    else:
+        cells_to_check = shapes_out.to_numpy()[output_pos[check]]
+    keep[check] = shapely.intersects(cells_to_check, geoms[point_pos[check]])
+    point_pos, output_pos = point_pos[keep], output_pos[keep]
+
+    order = np.lexsort((point_pos, output_pos))
+    point_pos, output_pos = point_pos[order], output_pos[order]
+    return {
+        "inv_indexes": np.asarray(point_pos, dtype=int),
+        "output_indexes": np.asarray(output_pos, dtype=int),
+        "weights": _split_points_weights(point_pos, output_pos),
+    }
+
+
+def _partitioned_intersection_weights(
+    shapes_vect: gpd.GeoSeries,
+    shapes_looped: gpd.GeoSeries,
+    loop_over_inv_objects: bool,
+    n_workers: int,
+    executor: str = "thread",
+    blocks_per_worker: int = 4,
+) -> list[dict[str, np.ndarray]]:
+    """Calculate the intersection weights in spatial blocks, in parallel.
+
+    The bounding box of the looped shapes is tiled into blocks.
+    Each looped shape is assigned to a single block, using the center of its
+    bounds, such that every pair of shapes is computed exactly once.
+    The vectorized shapes of a block are the ones within the bounds of the
+    looped shapes of the block.
+
+    Shapely releases the GIL during the geometric operations, so threads
+    already give a speedup. Processes avoid the GIL completely but
+    need to copy the shapes to each worker.
+
+    :return: The (unsorted) weights mapping of each block.
+    """
+    if executor == "thread":
+        pool_class = ThreadPoolExecutor
+    elif executor == "process":
+        pool_class = ProcessPoolExecutor
+    else:
+        raise ValueError(
+            f"'executor' must be one of ['thread', 'process'] not {executor}."
+        )
+
+    n_blocks_axis = max(1, math.ceil(math.sqrt(n_workers * blocks_per_worker)))
+    minx, miny, maxx, maxy = shapes_looped.total_bounds
+    bounds = shapes_looped.bounds.to_numpy()
+    block_x = np.floor(
+        ((bounds[:, 0] + bounds[:, 2]) / 2 - minx)
+        / ((maxx - minx) or 1.0)
+        * n_blocks_axis
+    )
+    block_y = np.floor(
+        ((bounds[:, 1] + bounds[:, 3]) / 2 - miny)
+        / ((maxy - miny) or 1.0)
+        * n_blocks_axis
+    )
+    blocks = np.clip(block_x, 0, n_blocks_axis - 1) * n_blocks_axis + np.clip(
+        block_y, 0, n_blocks_axis - 1
+    )
+
+    tasks = []
+    for block in np.unique(blocks):
+        looped_block = shapes_looped.loc[blocks == block]
+        bminx, bminy, bmaxx, bmaxy = looped_block.total_bounds
+        vect_block = shapes_vect.cx[bminx:bmaxx, bminy:bmaxy]
+        if len(vect_block) == 0:
+            continue
+        tasks.append((vect_block, looped_block))
+
+    logger.info(
+        f"calculating weights mapping in {len(tasks)} blocks with {n_workers} workers."
+    )
+    with pool_class(max_workers=n_workers) as pool:
+        futures = [
+            pool.submit(
+                _intersection_weights, vect_block, looped_block, loop_over_inv_objects
             )
-            gdf_weights = gdf_weights.sort_values(by=["index_out", "index_inv"])
-            w_mapping["inv_indexes"] = gdf_weights.index.to_numpy()
-            w_mapping["output_indexes"] = gdf_weights.index_out.to_numpy()
+            for vect_block, looped_block in tasks
+        ]
+        # Keep the order of the blocks, for reproducibility
+        partial_mappings = [future.result() for future in futures]
+
+    return partial_mappings
+
+
+def _intervals_overlaps(
+    lower_a: np.ndarray,
+    upper_a: np.ndarray,
+    lower_b: np.ndarray,
+    upper_b: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Find the overlapping pairs of two sets of 1D intervals.
+
+    The intervals of each set must not overlap with each other
+    (as the rows or the columns of a regular grid).
+
+    :return: The indexes of the intervals in a, the indexes of the intervals
+        in b and the length of the overlap.
+    """
+    order_b = np.argsort(lower_b)
+    sorted_lower_b = lower_b[order_b]
+    sorted_upper_b = upper_b[order_b]
+    # First and last+1 interval from b overlapping each interval from a
+    start = np.searchsorted(sorted_upper_b, lower_a, side="right")
+    stop = np.searchsorted(sorted_lower_b, upper_a, side="left")
+    counts = np.clip(stop - start, 0, None)
+
+    indexes_a = np.repeat(np.arange(len(lower_a)), counts)
+    # Position of each pair in the range of overlapping b intervals
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    indexes_b = order_b[np.repeat(start, counts) + offsets]
+
+    overlaps = np.minimum(upper_a[indexes_a], upper_b[indexes_b]) - np.maximum(
+        lower_a[indexes_a], lower_b[indexes_b]
+    )
+    mask = overlaps > 0
+
+    return indexes_a[mask], indexes_b[mask], overlaps[mask]
+
+
+def _regular_grid_lower_edges(grid: RegularGrid) -> tuple[np.ndarray, np.ndarray]:
+    """Return the lower x and y edges of the columns and rows of the grid.
+
+    The size of the intervals is abs(dx) and abs(dy), as some grids
+    have decreasing coordinates.
+    """
+    return (
+        np.asarray(grid.lon_range, dtype=float) - abs(grid.dx) / 2.0,
+        np.asarray(grid.lat_range, dtype=float) - abs(grid.dy) / 2.0,
+    )
+
+
+def calculate_regular_weights_mapping(
+    grid_inv: RegularGrid,
+    grid_out: RegularGrid,
+) -> dict[str, np.ndarray]:
+    """Calculate the weights mapping between two regular grids.
+
+    Same as :py:func:`calculate_weights_mapping` but no geometry is
+    involved.
+    As the cells of regular grids are aligned on the axes, the overlap
+    of two cells is the product of the overlap of their x intervals and of
+    their y intervals.
+    The 1D overlaps are computed for the columns and the rows and then
+    combined with an outer product.
+
+    The two grids must be in the same crs.
+    The indexes of the mapping follow the order of the cells of the grids
+    (see :py:attr:`RegularGrid.cells_as_polylist`).
+    """
+    logger.info(f"calculating regular weights mapping from {grid_inv} to {grid_out}.")
+    dx_inv, dy_inv = abs(grid_inv.dx), abs(grid_inv.dy)
+    dx_out, dy_out = abs(grid_out.dx), abs(grid_out.dy)
+    x_lower_inv, y_lower_inv = _regular_grid_lower_edges(grid_inv)
+    x_lower_out, y_lower_out = _regular_grid_lower_edges(grid_out)
+
+    x_inv, x_out, x_overlaps = _intervals_overlaps(
+        x_lower_inv, x_lower_inv + dx_inv, x_lower_out, x_lower_out + dx_out
+    )
+    y_inv, y_out, y_overlaps = _intervals_overlaps(
+        y_lower_inv, y_lower_inv + dy_inv, y_lower_out, y_lower_out + dy_out
+    )
+
+    # Outer product of the x and y pairs, cells are ordered with x first
+    inv_indexes = x_inv[:, None] * grid_inv.ny + y_inv[None, :]
+    output_indexes = x_out[:, None] * grid_out.ny + y_out[None, :]
+    weights = (x_overlaps[:, None] / dx_inv) * (y_overlaps[None, :] / dy_inv)
+
+    inv_indexes = inv_indexes.reshape(-1)
+    output_indexes = output_indexes.reshape(-1)
+    # Same order as the one of calculate_weights_mapping
+    order = np.lexsort((inv_indexes, output_indexes))
+
+    return {
+        "inv_indexes": np.array(inv_indexes[order], dtype=int),
+        "output_indexes": np.array(output_indexes[order], dtype=int),
+        "weights": np.array(weights.reshape(-1)[order], dtype=float),
+    }
+
+
+def _box_clipped_areas(
+    corners: np.ndarray, boxes: np.ndarray, chunk_size: int = 100_000
+) -> np.ndarray:
+    """Return the areas of convex polygons clipped by boxes.
 
-        w_mapping["weights"] = gdf_weights.weights.to_numpy()
+    Each polygon is clipped by the four sides of its box, one after the other
+    (Sutherland-Hodgman algorithm), for all the polygons at once.
 
+    :arg corners: The corners of the convex polygons, with shape (n, k, 2).
+    :arg boxes: The (xmin, ymin, xmax, ymax) of the boxes, with shape (n, 4).
+    :arg chunk_size: The number of polygons clipped together.
+    """
+    if len(corners) > chunk_size:
+        return np.concatenate(
+            [
+                _box_clipped_areas(
+                    corners[i : i + chunk_size], boxes[i : i + chunk_size]
+                )
+                for i in range(0, len(corners), chunk_size)
+            ]
+        )
+    points = np.asarray(corners, dtype=float)
+    for axis, side, sign in [(0, 0, 1.0), (0, 2, -1.0), (1, 1, 1.0), (1, 3, -1.0)]:
+        # Positive inside the box
+        distance = sign * (points[..., axis] - boxes[:, side, None])
+        next_points = np.roll(points, -1, axis=1)
+        next_distance = np.roll(distance, -1, axis=1)
+        inside = distance >= 0
+        crossing = inside != (next_distance >= 0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            t = np.where(crossing, distance / (distance - next_distance), 0.0)
+        intersections = points + t[..., None] * (next_points - points)
+
+        # Each edge gives its first point if inside and its intersection
+        points = np.stack([points, intersections], axis=2).reshape(len(points), -1, 2)
+        valid = np.stack([inside, crossing], axis=2).reshape(len(points), -1)
+        order = np.argsort(~valid, axis=1, kind="stable")
+        points = np.take_along_axis(points, order[..., None], axis=1)
+        valid = np.take_along_axis(valid, order, axis=1)
+        n_points = max(int(valid.sum(axis=1).max()), 1) if len(points) else 1
+        points, valid = points[:, :n_points], valid[:, :n_points]
+        # Repeating the first point keeps the polygons closed
+        points = np.where(valid[..., None], points, points[:, :1])
+
+    x, y = points[..., 0], points[..., 1]
+    return np.abs(
+        np.sum(x * np.roll(y, -1, axis=1) - np.roll(x, -1, axis=1) * y, axis=1) / 2.0
+    )
+
+
+def calculate_hex_regular_weights_mapping(
+    grid_inv: HexGrid | RegularGrid,
+    grid_out: HexGrid | RegularGrid,
+    tol: float = 1e-12,
+) -> dict[str, np.ndarray]:
+    """Calculate the weights mapping between a hexagonal and a regular grid.
+
+    Same as :py:func:`calculate_weights_mapping` but no geometry is
+    involved. One grid must be a :py:class:`~emiproc.grids.HexGrid`
+    and the other one a :py:class:`~emiproc.grids.RegularGrid`.
+    The cells of the regular grid overlapping the bounds of each hexagon
+    are found from the intervals of the columns and rows, and the overlaps
+    are the areas of the hexagons clipped by these cells.
+
+    The two grids must be in the same crs.
+    The indexes of the mapping follow the order of the cells of the grids.
+
+    :arg tol: The weights below this value are dropped.
+    """
+    logger.info(f"calculating hexagonal weights mapping from {grid_inv} to {grid_out}.")
+    hex_is_inv = isinstance(grid_inv, HexGrid)
+    hex_grid, regular_grid = (
+        (grid_inv, grid_out) if hex_is_inv else (grid_out, grid_inv)
+    )
+
+    corners = hex_grid.cell_corners_array()
+    hex_min, hex_max = corners.min(axis=1), corners.max(axis=1)
+    dx, dy = abs(regular_grid.dx), abs(regular_grid.dy)
+    x_lower, y_lower = _regular_grid_lower_edges(regular_grid)
+    hex_x, cols, _ = _intervals_overlaps(
+        hex_min[:, 0], hex_max[:, 0], x_lower, x_lower + dx
+    )
+    hex_y, rows, _ = _intervals_overlaps(
+        hex_min[:, 1], hex_max[:, 1], y_lower, y_lower + dy
+    )
+
+    # Combine the columns and the rows overlapped by each hexagon
+    # (the pairs are sorted by hexagon)
+    n_rows = np.bincount(hex_y, minlength=len(hex_grid))
+    first_row = np.cumsum(n_rows) - n_rows
+    repeats = n_rows[hex_x]
+    x_pairs = np.repeat(np.arange(len(hex_x)), repeats)
+    offsets = np.arange(repeats.sum()) - np.repeat(
+        np.cumsum(repeats) - repeats, repeats
+    )
+    y_pairs = first_row[hex_x[x_pairs]] + offsets
+
+    hexagons = hex_x[x_pairs]
+    col, row = cols[x_pairs], rows[y_pairs]
+    boxes = np.stack(
+        [x_lower[col], y_lower[row], x_lower[col] + dx, y_lower[row] + dy], axis=-1
+    )
+    cells = col * regular_grid.ny + row
+    if hex_is_inv:
+        inv_indexes, output_indexes = hexagons, cells
+        x, y = corners[..., 0], corners[..., 1]
+        hex_areas = np.abs(
+            np.sum(x * np.roll(y, -1, axis=1) - np.roll(x, -1, axis=1) * y, axis=1)
+            / 2.0
+        )
+        inv_areas = hex_areas[hexagons]
     else:
-        raise ValueError(f"'method' must be one of ['new', 'old'] not {method}.")
-    # Ensure types
-    w_mapping["output_indexes"] = np.array(w_mapping["output_indexes"], dtype=int)
-    w_mapping["inv_indexes"] = np.array(w_mapping["inv_indexes"], dtype=int)
-    w_mapping["weights"] = np.array(w_mapping["weights"], dtype=float)
+        inv_indexes, output_indexes = cells, hexagons
+        inv_areas = dx * dy
+    weights = _box_clipped_areas(corners[hexagons], boxes) / inv_areas
+
+    # Cells only touching the hexagons give slivers from the rounding errors
+    mask = weights > tol
+    inv_indexes, output_indexes = inv_indexes[mask], output_indexes[mask]
+    weights = weights[mask]
+
+    order = np.lexsort((inv_indexes, output_indexes))
+    return {
+        "inv_indexes": np.array(inv_indexes[order], dtype=int),
+        "output_indexes": np.array(output_indexes[order], dtype=int),
+        "weights": np.array(weights[order], dtype=float),
+    }
 
-    return w_mapping
+
+def _regular_cells_indexes(
+    shapes: gpd.GeoSeries | None, grid: RegularGrid, rtol: float = 1e-6
+) -> np.ndarray | None:
+    """Find the index of each shape in the cells of a regular grid.
+
+    Shapes as many as the cells are usually the cells in their order
+    (ex. an inventory on the grid, as for its cell areas). Only a sample of
+    them is then checked and the indexes come from the grid parameters.
+    Other shapes (ex. after a crop) are located with their bounds, which is
+    still much cheaper than any geometric operation.
+
+    :arg shapes: The shapes to locate. None means all the cells of the grid,
+        in which case no geometry is needed.
+
+    :return: The index of the grid cell corresponding to each shape,
+        or None if the shapes are not cells of the grid.
+    """
+    if not grid.is_regular:
+        return None
+    x_lower, y_lower = _regular_grid_lower_edges(grid)
+    if len(x_lower) != grid.nx or len(y_lower) != grid.ny:
+        return None
+    if shapes is None:
+        return np.arange(len(grid))
+    if len(shapes) == 0 or len(shapes) > len(grid):
+        return None
+
+    geoms = shapes.to_numpy()
+    if len(geoms) == len(grid):
+        sample = np.unique(np.linspace(0, len(grid) - 1, 16, dtype=int))
+        cells = _bounds_cells_indexes(geoms[sample], grid, x_lower, y_lower, rtol)
+        if cells is not None and np.array_equal(cells, sample):
+            return np.arange(len(grid))
+
+    cells = _bounds_cells_indexes(geoms, grid, x_lower, y_lower, rtol)
+    if cells is None or len(np.unique(cells)) != len(cells):
+        return None
+
+    return cells
+
+
+def _bounds_cells_indexes(
+    geoms: np.ndarray,
+    grid: RegularGrid,
+    x_lower: np.ndarray,
+    y_lower: np.ndarray,
+    rtol: float,
+) -> np.ndarray | None:
+    """Find the cell of a regular grid matching each geometry, from its bounds.
+
+    :return: The index of the cell of each geometry, or None if a geometry
+        is not a cell of the grid.
+    """
+    bounds = shapely.bounds(geoms)
+    if np.any(~np.isfinite(bounds)):
+        return None
+
+    indexes = []
+    for lower, d, (col_min, col_max) in [
+        (x_lower, abs(grid.dx), (0, 2)),
+        (y_lower, abs(grid.dy), (1, 3)),
+    ]:
+        # Cells can be ordered decreasingly
+        step = lower[1] - lower[0] if len(lower) > 1 else d
+        i = np.rint((bounds[:, col_min] - lower[0]) / step)
+        if np.any((i < 0) | (i >= len(lower))):
+            return None
+        i = i.astype(int)
+        tol = rtol * abs(d)
+        if np.any(np.abs(bounds[:, col_min] - lower[i]) > tol) or np.any(
+            np.abs(bounds[:, col_max] - (lower[i] + d)) > tol
+        ):
+            return None
+        indexes.append(i)
+
+    # The shapes must be the full rectangles
+    if not np.allclose(shapely.area(geoms), abs(grid.dx * grid.dy), rtol=rtol):
+        return None
+
+    return indexes[0] * grid.ny + indexes[1]
+
+
+def _hex_cells_indexes(
+    shapes: gpd.GeoSeries | None, grid: HexGrid
+) -> np.ndarray | None:
+    """Find the index of each shape in the cells of a hexagonal grid.
+
+    Only the shapes that are all the cells of the grid, in their order,
+    are recognized.
+
+    :arg shapes: The shapes to locate. None means all the cells of the grid.
+
+    :return: The index of the grid cell corresponding to each shape,
+        or None if the shapes are not the cells of the grid.
+    """
+    if shapes is None:
+        return np.arange(len(grid))
+    if len(shapes) != len(grid) or not np.all(
+        shapely.equals_exact(shapes.to_numpy(), grid.cells_as_polylist)
+    ):
+        return None
+    return np.arange(len(grid))
+
+
+def get_regular_weights_mapping(
+    shapes_inv: gpd.GeoSeries,
+    grid_inv: Grid,
+    shapes_out: gpd.GeoSeries | None,
+    grid_out: Grid,
+) -> dict[str, np.ndarray] | None:
+    """Get the weights mapping between shapes that are cells of regular grids.
+
+    This checks that the shapes correspond to the cells of the grids
+    and uses :py:func:`calculate_regular_weights_mapping` .
+    Between a :py:class:`~emiproc.grids.HexGrid` and a regular grid,
+    :py:func:`calculate_hex_regular_weights_mapping` is used instead.
+    The indexes in the mapping are the positions in the shapes series.
+
+    `shapes_out` can be None if the output shapes are all the cells of
+    `grid_out`, in their order and crs. No geometry of the output grid is then
+    needed.
+
+    :return: The weights mapping or None if the analytic calculation cannot
+        be used. In this case use :py:func:`get_weights_mapping` .
+    """
+    n_regular = isinstance(grid_inv, RegularGrid) + isinstance(grid_out, RegularGrid)
+    n_hex = isinstance(grid_inv, HexGrid) + isinstance(grid_out, HexGrid)
+    if not (n_regular == 2 or (n_regular == 1 and n_hex == 1)):
+        return None
+    if shapes_inv.crs != (grid_out.crs if shapes_out is None else shapes_out.crs):
+        return None
+
+    cells = []
+    for shapes, grid in [(shapes_inv, grid_inv), (shapes_out, grid_out)]:
+        if isinstance(grid, HexGrid):
+            cells.append(_hex_cells_indexes(shapes, grid))
+        else:
+            cells.append(_regular_cells_indexes(shapes, grid))
+        if cells[-1] is None:
+            return None
+    cells_inv, cells_out = cells
+
+    if n_hex:
+        w_mapping = calculate_hex_regular_weights_mapping(grid_inv, grid_out)
+    else:
+        w_mapping = calculate_regular_weights_mapping(grid_inv, grid_out)
+
+    # Convert from the cells of the grids to the positions in the shapes
+    for key, cells, grid in [
+        ("inv_indexes", cells_inv, grid_inv),
+        ("output_indexes", cells_out, grid_out),
+    ]:
+        position_of_cell = np.full(len(grid), -1, dtype=int)
+        position_of_cell[cells] = np.arange(len(cells))
+        positions = position_of_cell[w_mapping[key]]
+        mask = positions >= 0
+        w_mapping = {k: v[mask] for k, v in w_mapping.items()}
+        w_mapping[key] = positions[mask]
+
+    order = np.lexsort((w_mapping["inv_indexes"], w_mapping["output_indexes"]))
+    return {key: value[order] for key, value in w_mapping.items()}
 
 
 def weights_remap(
-    w_mapping: dict[str, np.ndarray],
+    w_mapping: dict[str, np.ndarray] | WeightsMatrix,
     remapped_values: np.ndarray,
     output_size: int | tuple,
 ) -> np.ndarray:
@@ -275,7 +1490,13 @@ def weights_remap(
 
     This allows for a very fast dot product calculation if the mapping.
     Is sparse.
+
+    If you remap many arrays with the same weights, give a
+    :py:class:`WeightsMatrix` as `w_mapping` to build the matrix only once.
     """
+    if isinstance(w_mapping, WeightsMatrix):
+        return w_mapping.remap(remapped_values).reshape(output_size)
+
     if isinstance(output_size, int):
         out_len = output_size
     else:
@@ -291,7 +1512,7 @@ def weights_remap(
 
 
 def weights_remap_matrix(
-    w_matrix: coo_array,
+    w_matrix: coo_array | csr_array | WeightsMatrix,
     remapped_values: np.ndarray,
 ) -> np.ndarray:
     """Remap using the weights mapping and a sparse matrix.
@@ -299,6 +1520,8 @@ def weights_remap_matrix(
     This is the same as :py:func:`weights_remap` but uses a matrix as input.
     This allow for not having to build the matrix multiple times
     """
+    if isinstance(w_matrix, WeightsMatrix):
+        return w_matrix.remap(remapped_values)
     return w_matrix.dot(remapped_values)
 
 
@@ -374,28 +1597,332 @@ def geoserie_intersection(
         return intersection_shapes, weights
 
 
-def remap_inventory(
+def _add_rows(
+    values: np.ndarray | csr_array | dask_array.Array,
+    positions: np.ndarray | list[int],
+    rows: np.ndarray | csr_array,
+) -> np.ndarray | csr_array | dask_array.Array:
+    """Add rows to the values at the given positions.
+
+    Dense values are modified in place. Sparse and chunked values stay
+    sparse and chunked.
+    """
+    if isinstance(values, np.ndarray):
+        values[positions] += rows.toarray() if isinstance(rows, csr_array) else rows
+        return values
+    selection = csr_array(
+        (np.ones(len(positions)), (positions, np.arange(len(positions)))),
+        shape=(values.shape[0], len(positions)),
+    )
+    if isinstance(values, dask_array.Array):
+        return add_chunks(values, selection @ csr_array(rows))
+    return values + selection @ csr_array(rows)
+
+
+def _grid_cells_of(inv: Inventory, grid: Grid | gpd.GeoSeries) -> gpd.GeoSeries:
+    """Return the cells of the grid in the crs of the inventory."""
+    if isinstance(grid, Grid) or issubclass(type(grid), Grid):
+        if inv.crs is not None and grid.crs is not None and inv.crs != grid.crs:
+            # Transforms the vertices of the grid instead of each polygon
+            return grid.cells_to_crs(inv.crs)
+        grid_cells = gpd.GeoSeries(grid.cells_as_polylist, crs=grid.crs)
+    elif isinstance(grid, gpd.GeoSeries):
+        grid_cells = grid.reset_index(drop=True)
+    else:
+        raise TypeError(f"grid must be of type Grid or gpd.Geoseries, not {type(grid)}")
+
+    # Treat possible issues with crs not matching
+    if inv.crs is not None:
+        if grid_cells.crs != inv.crs:
+            # convert the grid cells to the correct crs
+            grid_cells = grid_cells.to_crs(inv.crs)
+    else:
+        if grid_cells.crs is not None:
+            raise ValueError(
+                "The inventory given has no crs, but the grid has. "
+                "Assign a crs to the inventory before remapping."
+            )
+    return grid_cells
+
+
+def _regular_shapes_or_none(
+    grid: Grid | gpd.GeoSeries, grid_cells: gpd.GeoSeries
+) -> gpd.GeoSeries | None:
+    """Return None if the cells are the ones of a regular or hexagonal grid.
+
+    The functions handling these grids then use the parameters of the grid
+    instead of the geometries.
+    """
+    if isinstance(grid, (RegularGrid, HexGrid)) and grid_cells.crs == grid.crs:
+        return None
+    return grid_cells
+
+
+def _emissions_mask_of(
+    inv: Inventory, emissions_mask: np.ndarray | bool
+) -> np.ndarray | None:
+    """Get the mask from the argument given to :py:func:`remap_inventory`.
+
+    A mask given as an array (ex. computed from another inventory) must not
+    exclude cells with emissions, as these would be lost by the remapping.
+    """
+    if emissions_mask is True:
+        return get_emissions_mask(inv)
+    elif emissions_mask is False:
+        return None
+    mask = np.asarray(emissions_mask, dtype=bool)
+    if len(mask) != len(inv.geometry):
+        raise ValueError(f"{len(mask)=} does not match {len(inv.geometry)=}")
+    excluded = ~mask & get_emissions_mask(inv)
+    if np.any(excluded):
+        raise ValueError(
+            f"The emissions mask excludes {np.count_nonzero(excluded)} cells with"
+            f" emissions in {inv}, their emissions would be lost."
+            " Use a mask including all the cells with emissions,"
+            " see 'get_emissions_mask'."
+        )
+    return mask
+
+
+def _main_weights_matrix(
     inv: Inventory,
     grid: Grid | gpd.GeoSeries,
+    grid_cells: gpd.GeoSeries,
+    weigths_file: Path | None,
+    method: str,
+    cache: WeightsCache | bool,
+    n_workers: int,
+    mask: np.ndarray | None,
+    inv_tree: shapely.STRtree | None = None,
+) -> WeightsMatrix:
+    """Get the weights of the main gdf of the inventory on the grid."""
+    w_mapping_grid = None
+    if isinstance(grid, (RegularGrid, HexGrid)) and isinstance(
+        inv.grid, (RegularGrid, HexGrid)
+    ):
+        # Analytic weights, no need to intersect the geometries
+        w_mapping_grid = get_regular_weights_mapping(
+            inv.geometry, inv.grid, _regular_shapes_or_none(grid, grid_cells), grid
+        )
+    if w_mapping_grid is not None:
+        if mask is not None:
+            keep = mask[w_mapping_grid["inv_indexes"]]
+            w_mapping_grid = {k: v[keep] for k, v in w_mapping_grid.items()}
+        return WeightsMatrix.from_mapping(
+            w_mapping_grid, len(inv.geometry), len(grid_cells)
+        )
+    return get_weights_matrix(
+        weigths_file,
+        inv.geometry,
+        # The key of the weights is then the fingerprint of the grid
+        grid if isinstance(grid, Grid) and grid_cells.crs == grid.crs else grid_cells,
+        loop_over_inv_objects=False,
+        method=method,
+        cache=cache,
+        n_workers=n_workers,
+        mask=mask,
+        inv_tree=inv_tree,
+    )
+
+
+def _remap_lazy_inventory(
+    inv: LazyInventory,
+    grid: Grid | gpd.GeoSeries,
+    weigths_file: Path | None,
+    method: str,
+    keep_gdfs: bool,
+    cache: WeightsCache | bool,
+    n_workers: int,
+    weights: WeightsMatrix | None,
+) -> LazyInventory:
+    """Add the remapping to the plan of a lazy inventory.
+
+    Only the weights are calculated. The additional gdfs are remapped
+    directly, as they are usually small, and added to the plan as new
+    emissions on the grid.
+    """
+    if inv.depends_on_cells:
+        return inv.record(
+            remap_inventory,
+            cell_dependent=True,
+            grid=grid,
+            weigths_file=weigths_file,
+            method=method,
+            keep_gdfs=keep_gdfs,
+            cache=cache,
+            n_workers=n_workers,
+            weights=weights,
+        )
+
+    grid_cells = _grid_cells_of(inv, grid)
+
+    w_matrix = weights
+    if inv.geometry is not None and w_matrix is None:
+        w_matrix = _main_weights_matrix(
+            inv,
+            grid,
+            grid_cells,
+            weigths_file,
+            method=method,
+            cache=cache,
+            n_workers=n_workers,
+            mask=None,
+        )
+    if w_matrix is not None and w_matrix.shape != (
+        len(grid_cells),
+        len(inv.geometry),
+    ):
+        raise ValueError(
+            f"Error in weights mapping: {w_matrix.shape=} does not match"
+            f" {len(grid_cells)=} and {len(inv.geometry)=}"
+        )
+
+    gdfs_emissions = None
+    if inv.gdfs and not keep_gdfs:
+        gdfs_emissions = remap_inventory(
+            Inventory.from_gdf(gdfs=inv.gdfs),
+            grid,
+            weigths_file,
+            method=method,
+            cache=cache,
+            n_workers=n_workers,
+        ).emissions
+
+    return inv.record_remap(
+        grid,
+        grid_cells,
+        None if w_matrix is None else w_matrix.matrix,
+        gdfs_emissions,
+        keep_gdfs=keep_gdfs,
+    )
+
+
+def _remap_inventory_on_grids(
+    inv: Inventory,
+    grids: list[Grid | gpd.GeoSeries],
+    weigths_file: Path | None,
+    method: str,
+    keep_gdfs: bool,
+    cache: WeightsCache | bool,
+    n_workers: int,
+    emissions_mask: np.ndarray | bool,
+) -> list[Inventory]:
+    """Remap the inventory on many grids, see :py:func:`remap_inventory`.
+
+    The spatial index of the inventory shapes is built only once and
+    the weights of the grids are calculated in parallel.
+    """
+    weights_of_grids = [None] * len(grids)
+    if inv.geometry is not None:
+        mask = _emissions_mask_of(inv, emissions_mask)
+        shapes_inv = inv.geometry
+        inv_tree = None
+        if method == "new":
+            # Same shapes as the ones used in the weights calculation
+            shapes_tree = shapes_inv if mask is None else shapes_inv[mask]
+            inv_tree = shapely.STRtree(shapes_tree.to_numpy())
+
+        def weights_of_grid(i: int) -> WeightsMatrix:
+            w_file = None
+            if weigths_file is not None:
+                w_file = weigths_file.with_stem(weigths_file.stem + f"_grid{i}")
+            return _main_weights_matrix(
+                inv,
+                grids[i],
+                _grid_cells_of(inv, grids[i]),
+                w_file,
+                method=method,
+                cache=cache,
+                n_workers=1,
+                mask=mask,
+                inv_tree=inv_tree,
+            )
+
+        if n_workers > 1:
+            with ThreadPoolExecutor(max_workers=n_workers) as pool:
+                weights_of_grids = list(pool.map(weights_of_grid, range(len(grids))))
+        else:
+            weights_of_grids = [weights_of_grid(i) for i in range(len(grids))]
+
+    return [
+        remap_inventory(
+            inv,
+            grid,
+            weigths_file=(
+                None
+                if weigths_file is None
+                else weigths_file.with_stem(weigths_file.stem + f"_grid{i}")
+            ),
+            method=method,
+            keep_gdfs=keep_gdfs,
+            cache=cache,
+            n_workers=n_workers,
+            weights=w_matrix,
+        )
+        for i, (grid, w_matrix) in enumerate(zip(grids, weights_of_grids))
+    ]
+
+
+def remap_inventory(
+    inv: Inventory,
+    grid: Grid | gpd.GeoSeries | list[Grid | gpd.GeoSeries],
     weigths_file: PathLike | None = None,
     method: str = "new",
     keep_gdfs: bool = False,
-) -> Inventory:
+    cache: WeightsCache | bool = True,
+    n_workers: int = 1,
+    emissions_mask: np.ndarray | bool = False,
+    weights: WeightsMatrix | None = None,
+    inplace: bool = False,
+) -> Inventory | list[Inventory]:
     """Remap any inventory on the desired grid.
 
     This will also remap the additional gdfs of the inventory on that grid.
 
+    Emissions chunked over the cells (see
+    :py:class:`~emiproc.inventories.EmissionsArray`) are remapped chunk by
+    chunk with the sparse weights, and stay chunked on the grid.
 
     :arg inv: The inventory from which to remap.
     :arg grid: The grid to remap to.
+        If a list of grids is given, the inventory is remapped on each of them
+        and a list of inventories is returned. The spatial index of the
+        inventory shapes is then built only once, and the weights of the grids
+        are calculated in parallel if `n_workers` is larger than 1.
     :arg weigths_file: The file storing the weights.
+        The weights are stored as :py:class:`WeightsMatrix` in directories
+        named after this file, see :py:func:`get_weights_matrix`.
     :arg method: The method to use for remapping. See :py:func:`calculate_weights_mapping`.
     :arg keep_gdfs: Whether to keep the additional gdfs (shapped emissions) of the inventory.
+    :arg cache: The cache for the weights. See :py:func:`get_weights_mapping`.
+    :arg n_workers: The number of workers used for calculating the weights.
+        See :py:func:`calculate_weights_mapping`.
+    :arg emissions_mask: Whether to calculate the weights only for the
+        shapes of the main gdf which have emissions.
+        True uses :py:func:`get_emissions_mask`.
+        A boolean array can also be given, for example the mask of another
+        year of the same inventory, such that the weights can be reused.
+        The emissions and profiles of the other shapes are dropped.
+    :arg weights: Weights to use for the main gdf instead of calculating them,
+        for example weights composed with :py:func:`compose_weights`.
+        Its shape must be (number of cells of the grid, number of shapes
+        of the inventory).
+    :arg inplace: Whether to modify the inventory in place.
+        Not possible if a list of grids is given.
+
+    A :py:class:`~emiproc.inventories.lazy.LazyInventory` can also be given,
+    in which case the remapping is added to its plan.
+
+    If both the grid of the inventory and the output grid are
+    :py:class:`~emiproc.grids.RegularGrid` in the same crs, the weights of the
+    main gdf are calculated analytically with
+    :py:func:`calculate_regular_weights_mapping` and no weights file is used.
 
     .. warning::
 
         To make sure the grid is defined on the same crs as the inventory,
-        this funciton will call geopandas.to_crs to the grid geometries.
+        this funciton will reproject the cells of the grid with
+        :py:meth:`~emiproc.grids.Grid.cells_to_crs` .
 
 
 
@@ -403,61 +1930,115 @@ def remap_inventory(
     if weigths_file is not None:
         weigths_file = Path(weigths_file)
 
-    if isinstance(grid, Grid) or issubclass(type(grid), Grid):
-        grid_cells = gpd.GeoSeries(grid.cells_as_polylist, crs=grid.crs)
-    elif isinstance(grid, gpd.GeoSeries):
-        grid_cells = grid.reset_index(drop=True)
-    else:
-        raise TypeError(f"grid must be of type Grid or gpd.Geoseries, not {type(grid)}")
-
-    # Treat possible issues with crs not matching
-    if inv.crs is not None:
-        if grid_cells.crs != inv.crs:
-            # convert the grid cells to the correct crs
-            grid_cells = grid_cells.to_crs(inv.crs)
-    else:
-        if grid_cells.crs is not None:
-            raise ValueError(
-                "The inventory given has no crs, but the grid has. "
-                "Assign a crs to the inventory before remapping."
+    if isinstance(inv, LazyInventory):
+        if isinstance(grid, (list, tuple)):
+            raise ValueError("Cannot remap a lazy inventory on many grids.")
+        if emissions_mask is not False:
+            # The mask depends on the emissions of the cells
+            return inv.record(
+                remap_inventory,
+                cell_dependent=True,
+                grid=grid,
+                weigths_file=weigths_file,
+                method=method,
+                keep_gdfs=keep_gdfs,
+                cache=cache,
+                n_workers=n_workers,
+                emissions_mask=emissions_mask,
+                weights=weights,
             )
+        return _remap_lazy_inventory(
+            inv,
+            grid,
+            weigths_file,
+            method=method,
+            keep_gdfs=keep_gdfs,
+            cache=cache,
+            n_workers=n_workers,
+            weights=weights,
+        )
 
-    if inv.gdf is not None:
-        # Remap the main data
-        w_mapping_grid = get_weights_mapping(
+    if isinstance(grid, (list, tuple)):
+        if weights is not None:
+            raise ValueError("Cannot use the same weights for many grids.")
+        if inplace:
+            raise ValueError("Cannot remap in place on many grids.")
+        return _remap_inventory_on_grids(
+            inv,
+            list(grid),
             weigths_file,
-            inv.gdf.geometry,
-            grid_cells,
-            loop_over_inv_objects=False,
             method=method,
+            keep_gdfs=keep_gdfs,
+            cache=cache,
+            n_workers=n_workers,
+            emissions_mask=emissions_mask,
         )
-        # Create the weights matrix
-        if max(w_mapping_grid["output_indexes"]) > len(grid_cells):
-            raise ValueError(
-                f"Error in weights mapping: {max(w_mapping_grid['output_indexes'])=} >"
-                f" {len(grid_cells)=}"
+
+    grid_cells = _grid_cells_of(inv, grid)
+
+    if inv.geometry is not None:
+        # Remap the main data
+        mask = _emissions_mask_of(inv, emissions_mask)
+        if weights is not None:
+            w_matrix = weights
+            if mask is not None:
+                # Remove the columns of the masked shapes
+                w_matrix = WeightsMatrix(
+                    weights.matrix @ diags_array(mask.astype(float)),
+                    weights.source_shape,
+                    weights.target_shape,
+                    weights.metadata,
+                )
+        else:
+            w_matrix = _main_weights_matrix(
+                inv,
+                grid,
+                grid_cells,
+                weigths_file,
+                method=method,
+                cache=cache,
+                n_workers=n_workers,
+                mask=mask,
             )
-        if max(w_mapping_grid["inv_indexes"]) > len(inv.gdf):
+        if w_matrix.shape != (len(grid_cells), len(inv.geometry)):
             raise ValueError(
-                f"Error in weights mapping: {max(w_mapping_grid['inv_indexes'])=} >"
-                f" {len(inv.gdf)=}"
+                f"Error in weights mapping: {w_matrix.shape=} does not match"
+                f" {len(grid_cells)=} and {len(inv.geometry)=}"
             )
-        w_matrix = coo_array(
-            (
-                w_mapping_grid["weights"],
-                (w_mapping_grid["output_indexes"], w_mapping_grid["inv_indexes"]),
-            ),
-            shape=(len(grid_cells), len(inv.gdf)),
-            dtype=float,
-        )
-        # Perform the remapping on each column
-        mapping_dict = {
-            key: weights_remap_matrix(w_matrix, inv.gdf[key])
-            for key in inv._gdf_columns
-        }
 
+    # The columns of the output, in the order they are added
+    columns = list(inv._gdf_columns)
+    gdfs_to_remap = {} if keep_gdfs else inv.gdfs
+    for category, gdf in gdfs_to_remap.items():
+        for sub in gdf.columns:
+            if isinstance(gdf[sub].dtype, gpd.array.GeometryDtype):
+                continue  # Geometric column
+            if (category, sub) not in columns:
+                columns.append((category, sub))
+    column_positions = {col: i for i, col in enumerate(columns)}
+    emissions = inv.emissions
+    if emissions is not None and emissions.is_chunked:
+        # Remap chunk by chunk, chunked emissions stay chunked
+        remapped_values = dask_array.pad(
+            remap_chunks(emissions.values, w_matrix.matrix),
+            ((0, len(columns) - len(emissions.columns)), (0, 0)),
+        ).rechunk({0: -1})
+    elif emissions is not None and emissions.is_sparse:
+        # Sparse emissions stay sparse
+        remapped_values = csr_array((len(columns), len(grid_cells)))
     else:
-        mapping_dict = {}
+        # All the remapped values are written in a single block
+        remapped_values = np.zeros((len(columns), len(grid_cells)))
+
+    if emissions is not None and not emissions.is_chunked:
+        # Remap all the columns at once
+        if emissions.is_sparse:
+            remapped_main = emissions.values @ w_matrix.transpose
+        else:
+            remapped_main = weights_remap_matrix(w_matrix, emissions.values.T).T
+        remapped_values = _add_rows(
+            remapped_values, np.arange(len(emissions.columns)), remapped_main
+        )
 
     # Add the other mappings
     if not keep_gdfs:
@@ -467,46 +2048,54 @@ def remap_inventory(
                 w_file = None
             else:
                 w_file = weigths_file.with_stem(weigths_file.stem + f"_gdfs_{category}")
-            w_mapping = get_weights_mapping(
-                w_file,
-                gdf.geometry.reset_index(drop=True),
-                grid_cells,
-                loop_over_inv_objects=True,
-                method=method,
+            shapes_gdf = gdf.geometry.reset_index(drop=True)
+            # Point sources are located directly on the grid
+            w_mapping_points = get_point_weights_mapping(
+                shapes_gdf, _regular_shapes_or_none(grid, grid_cells), grid
             )
-            # Remap each substance
-            for sub in gdf.columns:
-                if isinstance(gdf[sub].dtype, gpd.array.GeometryDtype):
-                    continue  # Geometric column
-                remapped = weights_remap(
-                    w_mapping,
-                    # Reset the index, same as the grid was applied in the weights mapping function
-                    gdf[sub].reset_index(drop=True),
-                    len(grid_cells),
+            if w_mapping_points is not None:
+                w_matrix_gdf = WeightsMatrix.from_mapping(
+                    w_mapping_points, len(shapes_gdf), len(grid_cells)
                 )
-                if (category, sub) not in mapping_dict:
-                    # Create new entry
-                    mapping_dict[(category, sub)] = remapped
-                else:
-                    # Add it to the category
-                    mapping_dict[(category, sub)] += remapped
+            else:
+                w_matrix_gdf = get_weights_matrix(
+                    w_file,
+                    shapes_gdf,
+                    grid_cells,
+                    loop_over_inv_objects=True,
+                    method=method,
+                    cache=cache,
+                    n_workers=n_workers,
+                )
+            # Remap all the substances at once
+            subs = [
+                sub
+                for sub in gdf.columns
+                if not isinstance(gdf[sub].dtype, gpd.array.GeometryDtype)
+            ]
+            positions = [column_positions[(category, sub)] for sub in subs]
+            remapped_values = _add_rows(
+                remapped_values,
+                positions,
+                weights_remap_matrix(w_matrix_gdf, gdf[subs].to_numpy(dtype=float)).T,
+            )
 
     # Create the output inv
-    out_inv = inv.copy(
-        no_gdfs=True,
-        # Copy the profiles to the new inventory
-        profiles=True,
+    out_inv = (
+        inv
+        if inplace
+        else inv.copy(
+            no_gdfs=True,
+            # Copy the profiles to the new inventory
+            profiles=True,
+        )
     )
     out_inv.grid = grid
-    out_inv.gdf = gpd.GeoDataFrame(
-        mapping_dict,
-        geometry=grid_cells,
-        crs=inv.crs,
-    )
-    if keep_gdfs:
-        out_inv.gdfs = {key: gdf.copy(deep=True) for key, gdf in inv.gdfs.items()}
-    else:
+    out_inv.emissions = EmissionsArray(remapped_values, columns, grid_cells)
+    if not keep_gdfs:
         out_inv.gdfs = {}
+    elif not inplace:
+        out_inv.gdfs = {key: _copy_frame(gdf) for key, gdf in inv.gdfs.items()}
 
     # Remap the profiles as well
     for index_name, profile_name in [
@@ -524,9 +2113,9 @@ def remap_inventory(
             profiles=profiles,
             profiles_indexes=indexes,
             emissions_weights=get_weights_of_gdf_profiles(
-                inv.gdf, profiles_indexes=indexes
+                emissions.to_frame(), profiles_indexes=indexes
             ),
-            weights_mapping=w_mapping_grid,
+            weights_mapping=w_matrix.to_mapping(),
         )
 
         out_inv.set_profiles(new_profiles, new_indexes)
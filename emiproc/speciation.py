@@ -13,10 +13,16 @@ import pandas as pd
 import xarray as xr
 import numpy as np
 
+from emiproc.inventories.lazy import LazyInventory
 from emiproc.utilities import get_country_mask
 
 if TYPE_CHECKING:
-    from emiproc.inventories import Category, CatSub, Inventory
+    from emiproc.inventories import Category, CatSub, EmissionsArray, Inventory
+
+
+def _drop_columns(emissions: EmissionsArray, columns: list[CatSub]) -> EmissionsArray:
+    """Return the emissions without the given columns."""
+    return emissions.select([col for col in emissions.columns if col not in columns])
 
 
 def read_speciation_table(
@@ -132,6 +138,7 @@ def speciate(
     speciation_ratios: xr.DataArray,
     drop: bool = True,
     country_mask_kwargs: dict[str, Any] = {},
+    inplace: bool = False,
 ) -> Inventory:
     """Speciate a substance in an inventory.
 
@@ -172,10 +179,22 @@ def speciate(
     :arg country_mask_kwargs: If the speciation ratios depend on the country,
         this function is used to pass optional arguments to
         :py:func:`emiproc.utilities.get_country_mask`.
+    :arg inplace: Whether to modify the inventory in place.
 
 
     """
-    new_inv = inv.copy()
+    if isinstance(inv, LazyInventory):
+        return inv.record(
+            speciate,
+            # Ratios depending on the country of each cell
+            cell_dependent="country" in speciation_ratios.coords,
+            substance=substance,
+            speciation_ratios=speciation_ratios,
+            drop=drop,
+            country_mask_kwargs=country_mask_kwargs,
+        )
+
+    new_inv = inv if inplace else inv.copy()
 
     # If speciation is not given it is okay
     for dim in ["speciation", "substance"]:
@@ -211,6 +230,8 @@ def speciate(
         countries_fractions = countries_fractions / countries_fractions.sum("country")
         countries_fractions = countries_fractions.fillna(0.0)
 
+    emissions = inv.emissions
+    new_emissions = None if emissions is None else emissions.copy(deep=False)
     for cat, sub in inv._gdf_columns:
         if sub != substance:
             continue
@@ -236,7 +257,7 @@ def speciate(
             )
             # First check that where the sum is 0, the total emissions are 0
             mask_zero_ratios = da_ratios_cells.sum("substance") == 0
-            mask_zero_emissions = inv.gdf[(cat, substance)] == 0
+            mask_zero_emissions = np.asarray(emissions[(cat, substance)]) == 0
             mask_problem = mask_zero_ratios & ~mask_zero_emissions
             missing_value = (
                 None
@@ -273,10 +294,12 @@ def speciate(
             # Should not happen, but just in case
             if (cat, new_sub) in inv._gdf_columns:
                 raise KeyError(f"{cat}/{new_sub} already in the gdf of {inv}")
-            new_inv.gdf[(cat, new_sub)] = inv.gdf[(cat, substance)] * ratios
+            new_emissions[(cat, new_sub)] = emissions[(cat, substance)] * ratios
         if drop:
             # Drop the speciated substance
-            new_inv.gdf.drop(columns=[(cat, substance)], inplace=True)
+            new_emissions = _drop_columns(new_emissions, [(cat, substance)])
+    if new_emissions is not None:
+        new_inv.emissions = new_emissions
 
     # Now for the gdfs
     for cat in inv.gdfs.keys():
@@ -352,6 +375,7 @@ def speciate_inventory(
     inv: Inventory,
     speciation_dict: dict[CatSub, dict[CatSub, float]],
     drop: bool = True,
+    inplace: bool = False,
 ) -> Inventory:
     """Speciate an inventory.
 
@@ -368,11 +392,19 @@ def speciate_inventory(
         Note that the ratio don't need to sum to 1, depending on the
         chemical parameters.
     :arg drop: Whether to drop the speciated category/substance.
+    :arg inplace: Whether to modify the inventory in place.
 
     :returns: The speciated inventory.
     """
-    new_inv = inv.copy()
+    if isinstance(inv, LazyInventory):
+        return inv.record(
+            speciate_inventory, speciation_dict=speciation_dict, drop=drop
+        )
 
+    new_inv = inv if inplace else inv.copy()
+
+    emissions = inv.emissions
+    new_emissions = None if emissions is None else emissions.copy(deep=False)
     for cat_sub, new_species in speciation_dict.items():
         cat, sub = cat_sub
         # Check the there is a substance to speciate
@@ -387,9 +419,9 @@ def speciate_inventory(
                 # if the new cat/sub is already in the gdf raise an error
                 if new_cat_sub in inv._gdf_columns:
                     raise KeyError(f"{new_cat_sub} already in the gdf of {inv}")
-                new_inv.gdf[new_cat_sub] = inv.gdf[cat_sub] * speciation_ratio
+                new_emissions[new_cat_sub] = emissions[cat_sub] * speciation_ratio
             if drop:
-                new_inv.gdf.drop(columns=cat_sub, inplace=True)
+                new_emissions = _drop_columns(new_emissions, [cat_sub])
         # Speciate the gdfs
         if cat in inv.gdfs and sub in inv.gdfs[cat].columns:
             for new_cat_sub, speciation_ratio in new_species.items():
@@ -403,6 +435,9 @@ def speciate_inventory(
             if drop:
                 new_inv.gdfs[cat].drop(columns=sub, inplace=True)
 
+    if new_emissions is not None:
+        new_inv.emissions = new_emissions
+
     # Profiles should also be speciated, simply apply the profile to all compounds
     for indexes_name in ["t_profiles_indexes", "v_profiles_indexes"]:
         if not hasattr(inv, indexes_name):
@@ -536,6 +571,7 @@ def merge_substances(
                     f" {old_substance} is merged."
                 )
 
+    emissions = new_inv.emissions
     for new_substance, old_substances in substances.items():
         for cat in inv.categories:
             cols_to_merge = []
@@ -545,13 +581,14 @@ def merge_substances(
             if not cols_to_merge:
                 continue
             # Merge the gdf
-            total = new_inv.gdf.loc[:, cols_to_merge].sum(axis=1)
-            new_inv.gdf[(cat, new_substance)] = total
+            total = sum(emissions[col] for col in cols_to_merge)
+            emissions[(cat, new_substance)] = total
             if drop:
-                new_inv.gdf.drop(
-                    columns=[c for c in cols_to_merge if c[1] != new_substance],
-                    inplace=True,
+                emissions = _drop_columns(
+                    emissions, [c for c in cols_to_merge if c[1] != new_substance]
                 )
+    if emissions is not None:
+        new_inv.emissions = emissions
 
     # Apply the same operation to the gdfs
     for cat, gdf in inv.gdfs.items():
@@ -19,11 +19,19 @@ from zipfile import ZipFile
 
 import geopandas as gpd
 import numpy as np
+import pyproj
+import shapely
 import xarray as xr
 from shapely.geometry import MultiPolygon, Polygon
 
 from emiproc import FILES_DIR, PROCESS
-from emiproc.grids import WGS84, WGS84_PROJECTED, Grid
+from emiproc.grids import WGS84, WGS84_PROJECTED, Grid, RegularGrid
+from emiproc.weights_cache import (
+    WeightsCache,
+    fingerprint_geometries,
+    make_cache_key,
+    resolve_cache,
+)
 
 # constants to convert from yr -> sec
 DAY_PER_YR = 365.25
@@ -219,7 +227,7 @@ def get_timezone_mask(output_grid: Grid, **kwargs) -> np.ndarray:
     # Put timezones on a projected crs
     gdf = get_timezones(**kwargs)
 
-    grid_gdf = output_grid.gdf.to_crs(gdf.crs)
+    grid_gdf = gpd.GeoDataFrame(geometry=output_grid.cells_to_crs(gdf.crs))
 
     # Subselect only the timezones we are interested in
     grid_bounds = grid_gdf.total_bounds
@@ -306,6 +314,7 @@ def get_country_mask(
     resolution: str = "110m",
     weight_filepath: PathLike | None = None,
     return_fractions: bool = False,
+    cache: WeightsCache | bool = True,
 ) -> np.ndarray | xr.DataArray:
     """Determine the country-code for each gridcell and return the grid.
 
@@ -327,6 +336,10 @@ def get_country_mask(
         instead of just the main country, set this to True.
         If True, this will return a `xarray.DataArray` with the fraction of each country.
         If False (default), this will return a numpy array with the main country code.
+    :arg cache: The cache in which the mask is looked for and stored.
+        The key depends on the geometry of the grid, the resolution and
+        `return_fractions`.
+        See :py:func:`emiproc.regrid.get_weights_mapping`.
 
 
     :returns: Gridded data with the country identifier of each country (eg. BUR).
@@ -361,6 +374,34 @@ def get_country_mask(
                 warn(f"Could not load weight file {weight_filepath}, {e}")
                 weight_filepath = None
 
+    cache = resolve_cache(cache)
+    if cache is not None:
+        key = make_cache_key(
+            kind="country_mask",
+            grid=(
+                f"grid:{output_grid.fingerprint}"
+                if isinstance(output_grid, Grid)
+                else fingerprint_geometries(output_grid)
+            ),
+            resolution=resolution,
+            return_fractions=return_fractions,
+        )
+        cached = cache.load(key)
+        if cached is not None:
+            if return_fractions:
+                da = xr.DataArray(
+                    cached["fractions"],
+                    coords={"country": cached["country"], "cell": cached["cell"]},
+                    dims=["country", "cell"],
+                )
+                if weight_filepath is not None:
+                    da.to_netcdf(weight_filepath)
+                return da
+            country_mask = cached["country_mask"]
+            if weight_filepath is not None:
+                np.save(weight_filepath, country_mask)
+            return country_mask
+
     if resolution in ["10m", "50m"]:
         logger.log(
             PROCESS,
@@ -374,25 +415,51 @@ def get_country_mask(
     countries_gdf = get_natural_earth(
         resolution=resolution, category="cultural", name=ne_name
     )
-    if isinstance(output_grid, Grid):
-        grid_gdf = output_grid.gdf.copy(deep=True)
-    elif isinstance(output_grid, gpd.GeoSeries):
-        grid_gdf = gpd.GeoDataFrame(geometry=output_grid)
+    if (
+        isinstance(output_grid, RegularGrid)
+        and output_grid.is_regular
+        and pyproj.CRS(output_grid.crs) == pyproj.CRS(WGS84)
+    ):
+        # The polygons of the cells are only created around each country
+        n_cells = len(output_grid)
+        cells_index = np.arange(n_cells)
+        grid_boundary = output_grid.total_bounds
+
+        def intersecting_cells(geometry: Polygon | MultiPolygon) -> np.ndarray:
+            cells = output_grid.cells_in_bounds(geometry.bounds)
+            return cells[shapely.intersects(output_grid.cell_polygons(cells), geometry)]
+
+        cells_polygons = output_grid.cell_polygons
+
     else:
-        raise TypeError(
-            f"output_grid should be a Grid or a GeoSeries, not {type(output_grid)}"
-        )
+        if isinstance(output_grid, Grid):
+            grid_gdf = gpd.GeoDataFrame(geometry=output_grid.cells_to_crs(WGS84))
+        elif isinstance(output_grid, gpd.GeoSeries):
+            grid_gdf = gpd.GeoDataFrame(geometry=output_grid)
+        else:
+            raise TypeError(
+                f"output_grid should be a Grid or a GeoSeries, not {type(output_grid)}"
+            )
+
+        if grid_gdf.crs != WGS84:
+            # make sure the grid is in WGS84 as is the country data
+            grid_gdf = grid_gdf.to_crs(WGS84)
+
+        n_cells = len(grid_gdf)
+        cells_index = grid_gdf.index
+        grid_boundary = grid_gdf.geometry.total_bounds
 
-    if grid_gdf.crs != WGS84:
-        # make sure the grid is in WGS84 as is the country data
-        grid_gdf = grid_gdf.to_crs(WGS84)
+        def intersecting_cells(geometry: Polygon | MultiPolygon) -> np.ndarray:
+            return np.flatnonzero(grid_polygon_intersects(grid_gdf.geometry, geometry))
 
-    grid_boundary = grid_gdf.geometry.total_bounds
+        def cells_polygons(cells: np.ndarray) -> np.ndarray:
+            return grid_gdf.geometry.to_numpy()[cells]
 
+    # Cells intersected by each country
+    country_cells: dict[str, np.ndarray] = {}
     country_shapes: dict[str, Polygon] = {}
-    country_corresponding_codes: list[int] = []
     # 3 char str from ISO, missing value is also -99 so we keep for consistency
-    country_mask = np.full(len(grid_gdf), fill_value="-99", dtype="U3")
+    country_mask = np.full(n_cells, fill_value="-99", dtype="U3")
 
     # Reduce to the bounds of the grid
     countries_gdf = countries_gdf.cx[
@@ -406,8 +473,8 @@ def get_country_mask(
     ):
         progress.step()
 
-        mask_intersect = grid_polygon_intersects(grid_gdf.geometry, geometry)
-        if np.any(mask_intersect):
+        cells = intersecting_cells(geometry)
+        if len(cells) > 0:
             if iso3 == "-99":
                 # Countries with missing iso3 code
                 logger.info(
@@ -415,103 +482,101 @@ def get_country_mask(
                     f" earth data '{ne_name}'"
                 )
                 continue
-            grid_gdf.loc[grid_gdf.index, iso3] = mask_intersect
+            country_cells[iso3] = cells
             country_shapes[iso3] = geometry
-            country_corresponding_codes.append(iso3)
     country_corresponding_codes = np.array(
-        country_corresponding_codes,
+        list(country_cells.keys()),
         # 3 char str
         dtype="U3",
     )
-
-    if return_fractions:
-        # Create the output empty array
-        da = xr.DataArray(
-            np.zeros((len(country_corresponding_codes), len(grid_gdf))),
-            coords={
-                "country": country_corresponding_codes,
-                "cell": grid_gdf.index,
-            },
-            dims=["country", "cell"],
-        )
+    # Pairs of (cell, country) intersecting
+    pairs_cells = np.concatenate([np.zeros(0, dtype=int), *country_cells.values()])
+    pairs_countries = np.concatenate(
+        [np.zeros(0, dtype=int)]
+        + [np.full(len(cells), i) for i, cells in enumerate(country_cells.values())]
+    )
 
     # Find how many countries each cell intersected
     progress.step()
-    number_of_intersections = grid_gdf[country_shapes.keys()].sum(axis=1)
+    number_of_intersections = np.bincount(pairs_cells, minlength=n_cells)[pairs_cells]
 
     # Cells having only one country
     progress.step()
     if not return_fractions:
-        # Some small optimization for countries that are in only one cell
-        one_cell_df = grid_gdf.loc[number_of_intersections == 1, country_shapes.keys()]
-        # Will have in col-0 the index of countries from on_cell_df and col-1 the codes
-        cell_country_maps = np.argwhere(one_cell_df.to_numpy())
-        country_mask[one_cell_df.index[cell_country_maps[:, 0]]] = (
-            country_corresponding_codes[cell_country_maps[:, 1]]
-        )
-        # Find indexes of cell in more than one country
+        one_country = number_of_intersections == 1
+        country_mask[pairs_cells[one_country]] = country_corresponding_codes[
+            pairs_countries[one_country]
+        ]
+        # Find the cells in more than one country
         progress.step()
-        mask_many_cells = number_of_intersections > 1
+        mask_many = number_of_intersections > 1
     else:
-        # Take only cells with at least one country
-        mask_many_cells = number_of_intersections >= 1
-    many_cells_df = grid_gdf.loc[mask_many_cells, country_shapes.keys()]
-    if len(many_cells_df) > 0:
-        # First column is the index of the cell, second column is the index of the country
-        cell_country_duplicates = np.argwhere(many_cells_df.to_numpy())
-
+        # Take all the cells with at least one country
+        mask_many = np.ones_like(pairs_cells, dtype=bool)
+        fractions = np.zeros((len(country_corresponding_codes), n_cells))
+    many_cells = pairs_cells[mask_many]
+    many_countries = pairs_countries[mask_many]
+    if len(many_cells) > 0:
         # Create two arrays for preparing intersection area between grid cells and countries
-        grid_shapes = gpd.GeoSeries(
-            grid_gdf.loc[mask_many_cells].geometry.iloc[cell_country_duplicates[:, 0]],
-            crs=grid_gdf.crs,
-        )
+        grid_shapes = gpd.GeoSeries(cells_polygons(many_cells), crs=WGS84)
         countries = gpd.GeoSeries(
             np.array([s for s in country_shapes.values()], dtype=object)[
-                cell_country_duplicates[:, 1]
+                many_countries
             ],
-            crs=grid_gdf.crs,
+            crs=WGS84,
         )
         # Calculate the intersection area
         intersection_shapes = grid_shapes.intersection(countries, align=False)
         # Use projected crs to get correct area
-        intersection_areas = intersection_shapes.to_crs(WGS84_PROJECTED).area
+        intersection_areas = intersection_shapes.to_crs(WGS84_PROJECTED).area.to_numpy()
 
-        # Prepare a matrix for comparing the area of intersection of cells with each country
-        u, i = np.unique(intersection_areas.index, return_inverse=True)
-
-        # rows match each cell that contain duplicate, columns match countries
-        areas_matrix = np.zeros(
-            (np.max(i) + 1, np.max(cell_country_duplicates[:, 1]) + 1)
-        )
-        areas_matrix[cell_country_duplicates[:, 0], cell_country_duplicates[:, 1]] = (
-            intersection_areas
-        )
         if return_fractions:
             # Get the fractions of each country in each cell
-            cell_areas = grid_gdf.to_crs(WGS84_PROJECTED).area
-            fractions = areas_matrix / cell_areas[u].values[:, None]
-            da.loc[
-                {
-                    "country": country_corresponding_codes,
-                    "cell": many_cells_df.index,
-                }
-            ] = fractions.T
+            cell_areas = grid_shapes.to_crs(WGS84_PROJECTED).area.to_numpy()
+            fractions[many_countries, many_cells] = intersection_areas / cell_areas
         else:
+            # rows match each cell that contain duplicate, columns match countries
+            u, i = np.unique(many_cells, return_inverse=True)
+            areas_matrix = np.zeros((len(u), len(country_corresponding_codes)))
+            areas_matrix[i, many_countries] = intersection_areas
             # Find the countries in which the area is the largest
-            country_mask[many_cells_df.index] = country_corresponding_codes[
+            country_mask[u] = country_corresponding_codes[
                 np.argmax(areas_matrix, axis=1)
             ]
 
+    if return_fractions:
+        da = xr.DataArray(
+            fractions,
+            coords={
+                "country": country_corresponding_codes,
+                "cell": cells_index,
+            },
+            dims=["country", "cell"],
+        )
+
     end = time.time()
     logger.log(PROCESS, f"Computation is over, it took {int(end - start)} seconds")
+    cache_metadata = {"kind": "country_mask", "resolution": resolution}
     if return_fractions:
         if weight_filepath is not None:
             da.to_netcdf(weight_filepath)
+        if cache is not None:
+            cache.save(
+                key,
+                {
+                    "fractions": da.values,
+                    "country": da["country"].values,
+                    "cell": da["cell"].values,
+                },
+                metadata=cache_metadata,
+            )
         return da
     if isinstance(output_grid, Grid):
         country_mask = country_mask.reshape((output_grid.nx, output_grid.ny))
     if weight_filepath is not None:
         np.save(weight_filepath, country_mask)
+    if cache is not None:
+        cache.save(key, {"country_mask": country_mask}, metadata=cache_metadata)
     return country_mask
 
 
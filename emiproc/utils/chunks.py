@@ -0,0 +1,121 @@
+"""Operations on emissions chunked over the cells.
+
+The emissions of an inventory can be a dask array of shape
+(n_columns, n_cells), with a single chunk over the columns and chunks
+over the cells.
+See :py:meth:`emiproc.inventories.EmissionsArray.chunk` .
+
+The sparse matrices of the processing (combination of the columns,
+weights of the remapping) are applied chunk by chunk, such that only a few
+chunks are in memory at once when the result is computed.
+The functions applied to the chunks are defined at the module level, so the
+graphs can run on a threaded or a process scheduler.
+"""
+
+from __future__ import annotations
+
+import dask.array as dask_array
+import numpy as np
+from scipy.sparse import csr_array, issparse
+
+_META = np.empty((0, 0), dtype=float)
+
+
+def _combine_block(block: np.ndarray, matrix: csr_array) -> np.ndarray:
+    return matrix @ block
+
+
+def _remap_block(block: np.ndarray, weights: csr_array) -> np.ndarray:
+    return (weights @ block.T).T
+
+
+def _add_block(block: np.ndarray, rows: csr_array, block_info=None) -> np.ndarray:
+    (row_start, row_stop), (start, stop) = block_info[0]["array-location"]
+    return block + rows[row_start:row_stop, start:stop].toarray()
+
+
+def chunk_cells(values: np.ndarray | csr_array, cells: int) -> dask_array.Array:
+    """Return the values as a dask array chunked over the cells.
+
+    :arg values: The emissions, with shape (n_columns, n_cells).
+    :arg cells: The number of cells in each chunk.
+    """
+    if issparse(values):
+        values = values.toarray()
+    return dask_array.from_array(np.asarray(values, dtype=float), chunks=(-1, cells))
+
+
+def combine_chunks(
+    matrix: csr_array | np.ndarray, values: dask_array.Array
+) -> dask_array.Array:
+    """Return linear combinations of the columns of chunked values.
+
+    :arg matrix: The coefficients, of shape (n_new_columns, n_columns).
+    :arg values: The values chunked over the cells.
+    """
+    matrix = csr_array(matrix)
+    return values.map_blocks(
+        _combine_block,
+        matrix,
+        chunks=((matrix.shape[0],), values.chunks[1]),
+        dtype=float,
+        meta=_META,
+    )
+
+
+def remap_chunks(
+    values: dask_array.Array, weights: csr_array | np.ndarray
+) -> dask_array.Array:
+    """Remap chunked values with a weights matrix.
+
+    The cells of the output are chunked with the same size as the input.
+    Each output chunk sums the products of the input chunks with the block
+    of the weights between the two chunks. Input chunks not overlapping
+    the output chunk are not read.
+
+    :arg values: The values chunked over the cells, shape (n_columns, n_cells).
+    :arg weights: The weights, of shape (n_output_cells, n_cells).
+
+    :return: The remapped values, of shape (n_columns, n_output_cells).
+    """
+    weights = csr_array(weights)
+    n_columns = values.shape[0]
+    n_out = weights.shape[0]
+    chunk_size = max(values.chunksize[1], 1)
+    input_bounds = np.cumsum((0,) + values.chunks[1])
+    output_bounds = np.append(np.arange(0, n_out, chunk_size), n_out)
+
+    output_chunks = []
+    for start, stop in zip(output_bounds[:-1], output_bounds[1:]):
+        rows = weights[start:stop]
+        # Input chunks containing cells with weights
+        used_chunks = np.unique(
+            np.searchsorted(input_bounds, rows.indices, side="right") - 1
+        )
+        output_chunk = dask_array.zeros((n_columns, stop - start), chunks=(-1, -1))
+        for i in used_chunks:
+            block_weights = rows[:, input_bounds[i] : input_bounds[i + 1]]
+            output_chunk = output_chunk + values.blocks[0, i].map_blocks(
+                _remap_block,
+                block_weights,
+                chunks=((n_columns,), (stop - start,)),
+                dtype=float,
+                meta=_META,
+            )
+        output_chunks.append(output_chunk)
+
+    if not output_chunks:
+        return dask_array.zeros((n_columns, 0), chunks=(-1, -1))
+    return dask_array.concatenate(output_chunks, axis=1)
+
+
+def add_chunks(values: dask_array.Array, rows: csr_array) -> dask_array.Array:
+    """Add sparse values to chunked values.
+
+    This is used to add small emissions (ex. point sources remapped on the
+    grid) to chunked emissions.
+
+    :arg values: The values chunked over the cells.
+    :arg rows: The values added, with the same shape.
+    """
+    return values.map_blocks(_add_block, csr_array(rows), dtype=float, meta=_META)
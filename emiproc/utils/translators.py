@@ -1,10 +1,9 @@
 from __future__ import annotations
-import geopandas as gpd
+import numpy as np
 import xarray as xr
 
 from typing import TYPE_CHECKING
 
-
 if TYPE_CHECKING:
     from emiproc.inventories import Inventory
 
@@ -16,12 +15,40 @@ def inv_to_xarray(inv: Inventory) -> xr.DataArray:
 
     :return array: A xarray containing the emissions at each coordinates:
         (substance, category, cell).
+        If the emissions are chunked over the cells, the array is a lazy
+        dask array with the same chunks.
     """
-    n_cells = len(inv.gdf)
+    if inv.gdfs:
+        raise ValueError("The inventory cannot contain gdfs. Please remap it first.")
+
+    emissions = inv.emissions
+    n_cells = len(emissions.geometry)
     substances = inv.substances
     categories = inv.categories
+
+    # Stack the rows of the emissions, dispatched to dask for chunked emissions
+    no_emissions = np.zeros(n_cells)
+    data = (
+        np.stack(
+            [
+                np.stack(
+                    [
+                        (
+                            emissions[(cat, sub)]
+                            if (cat, sub) in emissions
+                            else no_emissions
+                        )
+                        for cat in categories
+                    ]
+                )
+                for sub in substances
+            ]
+        )
+        if substances and categories
+        else np.zeros((len(substances), len(categories), n_cells))
+    )
     out_array = xr.DataArray(
-        data=0.0,
+        data=data,
         coords=dict(
             substance=substances,
             category=categories,
@@ -30,18 +57,6 @@ def inv_to_xarray(inv: Inventory) -> xr.DataArray:
         dims=["substance", "category", "cell"],
     )
 
-    if inv.gdfs:
-        raise ValueError("The inventory cannot contain gdfs. Please remap it first.")
-
-    for col in inv.gdf.columns:
-        if isinstance(inv.gdf[col].dtype, gpd.array.GeometryDtype):
-            continue
-        cat, sub = col
-
-        # Add this column to the array
-        serie = inv.gdf.loc[:, col]
-        out_array.loc[dict(category=cat, substance=sub)] = serie
-
     out_array.attrs["units"] = "kg/year/cell"
     out_array.attrs["description"] = f"Emissions of {inv.name}"
     out_array.attrs["history"] = inv.history + ["Converted to xarray."]
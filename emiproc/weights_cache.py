@@ -0,0 +1,323 @@
+"""Cache for the weights of the geometric operations.
+
+Computing the intersections between the shapes of an inventory and a grid
+is usually the most expensive step of the processing.
+The weights are stored in a cache directory, with a key that depends on
+everything used to compute them (the geometries, their crs and the parameters
+of the computation).
+A changed geometry or parameter gives a new key, so stale weights are never
+used.
+
+The cache is disabled by default. To enable it, set a cache directory
+with :py:func:`set_weights_cache` or with the environment variable
+``EMIPROC_WEIGHTS_CACHE``.
+
+Each entry is made of a ``.npz`` archive containing the arrays and a ``.json``
+file containing the metadata (parameters, creation time, size).
+When the cache is larger than its maximum size or number of entries,
+the least recently used entries are removed.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from os import PathLike
+from pathlib import Path
+from typing import Any, Iterable
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.geometry.base import BaseGeometry
+
+logger = logging.getLogger("emiproc.weights_cache")
+
+# Environment variable for setting the default cache directory
+CACHE_DIR_ENV_VAR = "EMIPROC_WEIGHTS_CACHE"
+
+# Increase this if the format of the cached data changes
+CACHE_VERSION = 1
+
+
+def fingerprint_geometries(shapes: Iterable[BaseGeometry] | gpd.GeoSeries) -> str:
+    """Return a hash of the geometries.
+
+    The hash depends on the coordinates and the structure of each geometry,
+    on the index of the shapes (the weights use it) and on the crs.
+
+    :arg shapes: A GeoSeries, a GeoDataFrame or a list of geometries.
+    """
+    crs = None
+    index = None
+    if isinstance(shapes, gpd.GeoDataFrame):
+        shapes = shapes.geometry
+    if isinstance(shapes, gpd.GeoSeries):
+        crs = shapes.crs
+        index = shapes.index
+        geoms = shapes.to_numpy()
+    else:
+        geoms = np.asarray(list(shapes), dtype=object)
+
+    h = hashlib.sha256()
+    h.update(str(len(geoms)).encode())
+    h.update(("None" if crs is None else crs.to_wkt()).encode())
+    if index is not None and not isinstance(index, pd.RangeIndex):
+        h.update(pd.util.hash_pandas_object(index, index=False).to_numpy().tobytes())
+    elif index is not None:
+        h.update(f"{index.start},{index.stop},{index.step}".encode())
+    # The structure of the geometries and then their coordinates
+    for structure in [
+        shapely.get_type_id(geoms),
+        shapely.get_num_geometries(geoms),
+        shapely.get_num_interior_rings(geoms),
+        shapely.get_num_coordinates(geoms),
+    ]:
+        h.update(np.ascontiguousarray(structure, dtype=np.int64).tobytes())
+    h.update(np.ascontiguousarray(shapely.get_coordinates(geoms)).tobytes())
+
+    return h.hexdigest()
+
+
+def fingerprint_mask(mask: np.ndarray) -> str:
+    """Return a hash of a boolean mask."""
+    mask = np.asarray(mask, dtype=bool)
+    h = hashlib.sha256()
+    h.update(str(len(mask)).encode())
+    h.update(np.packbits(mask).tobytes())
+    return h.hexdigest()
+
+
+def make_cache_key(**parameters: Any) -> str:
+    """Create a key from the parameters of a computation.
+
+    The parameters must be json serializable.
+    Geometries should be given as their fingerprint
+    (see :py:func:`fingerprint_geometries`).
+    """
+    parameters = {"cache_version": CACHE_VERSION, **parameters}
+    serialized = json.dumps(parameters, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+class WeightsCache:
+    """A directory containing cached weights.
+
+    :arg cache_dir: The directory where the weights are stored.
+    :arg max_size: The maximum size in bytes of the cache.
+        None means no limit.
+    :arg max_entries: The maximum number of entries of the cache.
+        None means no limit.
+    """
+
+    cache_dir: Path
+    max_size: int | None
+    max_entries: int | None
+
+    def __init__(
+        self,
+        cache_dir: PathLike,
+        max_size: int | None = 10 * 1024**3,
+        max_entries: int | None = None,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.max_entries = max_entries
+
+    def __repr__(self) -> str:
+        return f"WeightsCache({self.cache_dir})"
+
+    def _arrays_file(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.npz"
+
+    def _metadata_file(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def __contains__(self, key: str) -> bool:
+        return self._arrays_file(key).is_file() and self._metadata_file(key).is_file()
+
+    def keys(self) -> list[str]:
+        """Return the keys of all the entries in the cache."""
+        return [
+            file.stem for file in self.cache_dir.glob("*.json") if file.stem in self
+        ]
+
+    def load(self, key: str) -> dict[str, np.ndarray] | None:
+        """Load the arrays of an entry of the cache.
+
+        :return: The arrays or None if the key is not in the cache.
+        """
+        if key not in self:
+            return None
+        arrays_file = self._arrays_file(key)
+        try:
+            with np.load(arrays_file) as npz:
+                arrays = {name: npz[name] for name in npz.files}
+        except Exception as e:
+            logger.warning(f"Could not load {arrays_file}, removing it. {e}")
+            self.remove(key)
+            return None
+        # Mark the entry as recently used
+        os.utime(arrays_file)
+        logger.debug(f"Loaded {key} from {self}")
+        return arrays
+
+    def metadata(self, key: str) -> dict[str, Any]:
+        """Return the metadata of an entry of the cache."""
+        with open(self._metadata_file(key)) as f:
+            return json.load(f)
+
+    def save(
+        self,
+        key: str,
+        arrays: dict[str, np.ndarray],
+        metadata: dict[str, Any] | None = None,
+    ):
+        """Save the arrays in the cache.
+
+        The files are first written in a temporary file, such that
+        other processes never read an incomplete entry.
+
+        :arg key: The key of the entry. See :py:func:`make_cache_key`.
+        :arg arrays: The arrays to store.
+        :arg metadata: Additional information to store with the arrays.
+            Must be json serializable.
+        """
+        arrays_file = self._arrays_file(key)
+        fd, tmp_name = tempfile.mkstemp(dir=self.cache_dir, suffix=".npz")
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_name, arrays_file)
+
+        metadata = {
+            "key": key,
+            "created": time.time(),
+            "size": arrays_file.stat().st_size,
+            "arrays": {
+                name: [str(array.dtype), list(array.shape)]
+                for name, array in arrays.items()
+            },
+            **(metadata or {}),
+        }
+        fd, tmp_name = tempfile.mkstemp(dir=self.cache_dir, suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump(metadata, f, indent=2, default=str)
+        os.replace(tmp_name, self._metadata_file(key))
+        logger.debug(f"Saved {key} in {self}")
+
+        self.evict()
+
+    def remove(self, key: str):
+        """Remove an entry from the cache."""
+        for file in [self._arrays_file(key), self._metadata_file(key)]:
+            file.unlink(missing_ok=True)
+
+    def clear(self):
+        """Remove all the entries of the cache."""
+        for key in self.keys():
+            self.remove(key)
+
+    @property
+    def size(self) -> int:
+        """Total size in bytes of the entries of the cache."""
+        return sum(self._arrays_file(key).stat().st_size for key in self.keys())
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits its limits."""
+        entries = [(key, self._arrays_file(key).stat()) for key in self.keys()]
+        # Most recently used first
+        entries.sort(key=lambda entry: entry[1].st_mtime, reverse=True)
+        total_size = 0
+        for n, (key, stat) in enumerate(entries):
+            total_size += stat.st_size
+            too_many = self.max_entries is not None and n >= self.max_entries
+            too_large = self.max_size is not None and total_size > self.max_size
+            if too_many or too_large:
+                logger.debug(f"Evicting {key} from {self}")
+                self.remove(key)
+
+
+_default_cache: WeightsCache | None = None
+_default_cache_set: bool = False
+
+
+def set_weights_cache(
+    cache_dir: PathLike | None,
+    max_size: int | None = 10 * 1024**3,
+    max_entries: int | None = None,
+) -> WeightsCache | None:
+    """Set the default cache used by emiproc.
+
+    :arg cache_dir: The directory of the cache. None disables the cache.
+    :arg max_size: See :py:class:`WeightsCache`.
+    :arg max_entries: See :py:class:`WeightsCache`.
+
+    :return: The new default cache.
+    """
+    global _default_cache, _default_cache_set
+    _default_cache = (
+        None if cache_dir is None else WeightsCache(cache_dir, max_size, max_entries)
+    )
+    _default_cache_set = True
+    return _default_cache
+
+
+def get_weights_cache() -> WeightsCache | None:
+    """Return the default cache.
+
+    If it was not set with :py:func:`set_weights_cache`, it is created from
+    the environment variable ``EMIPROC_WEIGHTS_CACHE``.
+
+    :return: The default cache or None if caching is disabled.
+    """
+    if not _default_cache_set:
+        cache_dir = os.environ.get(CACHE_DIR_ENV_VAR)
+        set_weights_cache(cache_dir if cache_dir else None)
+    return _default_cache
+
+
+def resolve_cache(cache: WeightsCache | bool | None) -> WeightsCache | None:
+    """Get the cache to use from the argument given to a function.
+
+    :arg cache: True for the default cache, False or None for no cache,
+        or a specific cache.
+    """
+    if isinstance(cache, WeightsCache):
+        return cache
+    if cache:
+        return get_weights_cache()
+    return None
+
+
+def geometries_to_arrays(
+    shapes: gpd.GeoSeries, prefix: str = "geometry"
+) -> dict[str, np.ndarray]:
+    """Convert geometries to numeric arrays that can be stored in a npz file.
+
+    The geometries are stored as wkb, concatenated in a single buffer.
+    """
+    wkbs = shapely.to_wkb(shapes.to_numpy())
+    lengths = np.array([len(wkb) for wkb in wkbs], dtype=np.int64)
+    return {
+        f"{prefix}_wkb": np.frombuffer(b"".join(wkbs), dtype=np.uint8),
+        f"{prefix}_lengths": lengths,
+        f"{prefix}_index": shapes.index.to_numpy(),
+    }
+
+
+def arrays_to_geometries(
+    arrays: dict[str, np.ndarray], prefix: str = "geometry", crs: Any = None
+) -> gpd.GeoSeries:
+    """Inverse of :py:func:`geometries_to_arrays`."""
+    buffer = arrays[f"{prefix}_wkb"].tobytes()
+    offsets = np.concatenate([[0], np.cumsum(arrays[f"{prefix}_lengths"])])
+    wkbs = [buffer[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+    return gpd.GeoSeries(
+        shapely.from_wkb(wkbs), index=arrays[f"{prefix}_index"], crs=crs
+    )
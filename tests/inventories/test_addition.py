@@ -46,6 +46,18 @@ def test_cannot_add_different_grid():
     pytest.raises(ValueError, add_inventories, inv1, inv2)
 
 
+def test_cannot_add_same_grid_different_geometries():
+    """Test that the geometries are compared, not the grids."""
+
+    inv1 = test_inventories.inv.copy()
+    inv2 = test_inventories.inv.copy()
+    inv2.gdf = inv2.gdf.set_geometry(inv2.gdf.geometry.translate(xoff=0.5))
+    # The grid is not updated with the geometries
+    inv2.grid = inv1.grid
+
+    pytest.raises(ValueError, add_inventories, inv1, inv2)
+
+
 def test_profiles():
     """Test the addition of two inventories with profiles."""
 
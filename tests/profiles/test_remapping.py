@@ -2,7 +2,10 @@ from emiproc.tests_utils import test_inventories, test_grids, temporal_profiles
 import pandas as pd
 from emiproc.regrid import calculate_weights_mapping
 from emiproc.profiles.operators import get_weights_of_gdf_profiles, remap_profiles
-from emiproc.profiles.temporal_profiles import CompositeTemporalProfiles
+from emiproc.profiles.temporal_profiles import (
+    CompositeTemporalProfiles,
+    DayOfYearProfile,
+)
 import xarray as xr
 import numpy as np
 
@@ -98,3 +101,46 @@ def test_remap_profiles():
         expected_profile,
         err_msg="The profiles should be the same",
     )
+
+
+def test_remap_profiles_weighted_mean():
+    rng = np.random.default_rng(0)
+    ratios = rng.random((4, 365))
+    profiles = CompositeTemporalProfiles.from_ratios(
+        ratios, [DayOfYearProfile], rescale=True
+    )
+    profiles_indexes = xr.DataArray(
+        [[0, 1, 1, 1, -1, 3]],
+        dims=["category", "cell"],
+        coords={"category": ["a"], "cell": np.arange(6)},
+    )
+    emissions_weights = xr.DataArray(
+        [[1.0, 2.0, 0.5, 1.0, 3.0, 0.0]],
+        dims=["category", "cell"],
+        coords=profiles_indexes.coords,
+    )
+    weights_mapping = {
+        "inv_indexes": np.array([0, 1, 2, 4, 3, 5, 5]),
+        "output_indexes": np.array([0, 0, 1, 1, 2, 2, 3]),
+        "weights": np.array([0.5, 1.0, 1.0, 1.0, 0.5, 0.8, 0.2]),
+    }
+
+    new_profiles, new_indexes = remap_profiles(
+        profiles, profiles_indexes, emissions_weights, weights_mapping
+    )
+
+    assert new_indexes.dims == profiles_indexes.dims
+    np.testing.assert_array_equal(new_indexes["cell"], [0, 1, 2, 3])
+    # No emissions in the last cell
+    assert new_indexes.sel(category="a", cell=3) == -1
+    # Cells 1 and 2 have only the same input profile (cell 5 has no emissions)
+    assert new_indexes.sel(category="a", cell=1) == new_indexes.sel(
+        category="a", cell=2
+    )
+    assert len(new_profiles) == 2
+
+    expected = 0.5 * profiles.ratios[0] + 2.0 * profiles.ratios[1]
+    np.testing.assert_allclose(
+        new_profiles.ratios[new_indexes.sel(category="a", cell=0).values],
+        expected / expected.sum(),
+    )
@@ -0,0 +1,142 @@
+"""Test the inventories with emissions chunked over the cells."""
+
+import dask
+import dask.array as dask_array
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from emiproc.exports.rasters import export_raster_netcdf
+from emiproc.exports.utils import get_temporally_scaled_array
+from emiproc.grids import RegularGrid
+from emiproc.inventories import EmissionsArray
+from emiproc.inventories.lazy import LazyInventory
+from emiproc.inventories.utils import drop, group_categories, scale_inventory
+from emiproc.regrid import remap_inventory
+from emiproc.speciation import speciate_inventory
+from emiproc.tests_utils import TEST_OUTPUTS_DIR, temporal_profiles
+from emiproc.tests_utils.test_grids import regular_grid
+from emiproc.tests_utils.test_inventories import inv, inv_with_pnt_sources
+
+grid = RegularGrid(xmin=0, ymin=0, nx=3, ny=3, dx=1, dy=1, crs=None)
+
+
+def chunked_inventory(inv, cells=2):
+    inv = inv.copy()
+    inv.emissions = EmissionsArray.from_gdf(inv.gdf).chunk(cells)
+    return inv
+
+
+@pytest.fixture(params=["threads", pytest.param("processes", marks=pytest.mark.slow)])
+def scheduler(request):
+    # Few workers, as starting them takes most of the time of the tests
+    with dask.config.set(scheduler=request.param, num_workers=2):
+        yield request.param
+
+
+def test_chunk():
+    emissions = EmissionsArray.from_gdf(inv.gdf)
+    chunked = emissions.chunk(2)
+    assert chunked.is_chunked
+    assert chunked.values.chunks == ((4,), (2, 2, 1))
+    assert isinstance(chunked[("adf", "CO2")], dask_array.Array)
+    np.testing.assert_array_equal(chunked.totals(), emissions.totals())
+    np.testing.assert_array_equal(chunked.to_dense().values, emissions.values)
+
+    chunked[("new", "CO2")] = 1.0
+    assert chunked.values.chunks == ((5,), (2, 2, 1))
+    np.testing.assert_array_equal(chunked[("new", "CO2")].compute(), np.ones(5))
+
+
+@pytest.mark.parametrize(
+    "operator",
+    [
+        lambda inv: group_categories(
+            inv, {"a": ["adf", "liku"], "b": ["test", "blek", "other"]}
+        ),
+        lambda inv: scale_inventory(
+            inv, {"CH4": {"adf": np.arange(5.0)}, "CO2": {"adf": 2.0}}
+        ),
+        lambda inv: drop(inv, substances=["CH4"], categories=["test"]),
+        lambda inv: remap_inventory(inv, grid),
+        lambda inv: remap_inventory(inv, grid, keep_gdfs=True),
+    ],
+)
+def test_operators_stay_chunked(operator, scheduler):
+    out_inv = operator(chunked_inventory(inv_with_pnt_sources))
+    expected_inv = operator(inv_with_pnt_sources)
+
+    assert out_inv.emissions.is_chunked
+    assert out_inv.emissions.values.chunksize[1] == 2
+    columns = expected_inv._gdf_columns
+    pd.testing.assert_frame_equal(out_inv.gdf[columns], expected_inv.gdf[columns])
+
+
+def test_window_stays_chunked(caplog):
+    raster_inv = inv_with_pnt_sources.copy()
+    raster_inv.set_crs(regular_grid.crs)
+    raster_inv = remap_inventory(raster_inv, regular_grid)
+    chunked_inv = chunked_inventory(raster_inv, cells=7)
+    bbox = (0.0, -1.0, 2.5, 2.0)
+
+    windowed = chunked_inv.window(bbox)
+    expected = raster_inv.window(bbox)
+    assert windowed.emissions.is_chunked
+    assert chunked_inv.emissions.is_chunked
+    columns = expected._gdf_columns
+    pd.testing.assert_frame_equal(windowed.gdf[columns], expected.gdf[columns])
+    # Getting the gdf computes it without replacing the chunked emissions
+    assert windowed.emissions.is_chunked
+    assert "chunked emissions" in caplog.text
+
+
+def test_lazy_inventory(scheduler):
+    def processing_chain(inv):
+        inv = group_categories(inv, {"a": ["adf", "liku"], "b": ["test"]})
+        inv = speciate_inventory(inv, {("a", "CO2"): {("a", "CO2_ANT"): 0.7}})
+        return remap_inventory(inv, grid)
+
+    out_inv = processing_chain(LazyInventory(chunked_inventory(inv))).execute()
+    expected_inv = processing_chain(inv)
+
+    assert out_inv.emissions.is_chunked
+    pd.testing.assert_frame_equal(out_inv.gdf, expected_inv.gdf)
+
+
+def test_temporally_scaled_array_is_lazy():
+    expected_inv = inv.copy()
+    expected_inv.set_profiles(
+        temporal_profiles.three_composite_profiles,
+        indexes=temporal_profiles.indexes_inv_catsubcell,
+    )
+    chunked_inv = chunked_inventory(expected_inv)
+    time_range = pd.date_range("2017-12-30", "2018-01-02", freq="h")
+
+    scaled = get_temporally_scaled_array(chunked_inv, time_range, sum_over_cells=False)
+    expected = get_temporally_scaled_array(
+        expected_inv, time_range, sum_over_cells=False
+    )
+
+    assert isinstance(scaled.data, dask_array.Array)
+    assert scaled.chunksizes["cell"] == (2, 2, 1)
+    xr.testing.assert_allclose(scaled.compute(), expected)
+
+
+@pytest.mark.parametrize("group", [False, True])
+def test_export_raster(group, scheduler):
+    raster_inv = inv_with_pnt_sources.copy()
+    raster_inv.set_crs(regular_grid.crs)
+    raster_inv = remap_inventory(raster_inv, regular_grid)
+    chunked_inv = chunked_inventory(raster_inv, cells=50)
+    kwargs = dict(grid=regular_grid, netcdf_attributes={}, group_categories=group)
+
+    path = export_raster_netcdf(
+        chunked_inv, TEST_OUTPUTS_DIR / "test_raster_chunked.nc", **kwargs
+    )
+    expected_path = export_raster_netcdf(
+        raster_inv, TEST_OUTPUTS_DIR / "test_raster_not_chunked.nc", **kwargs
+    )
+
+    with xr.open_dataset(path) as ds, xr.open_dataset(expected_path) as expected:
+        xr.testing.assert_allclose(ds, expected)
@@ -0,0 +1,150 @@
+"""Test that copies of inventories share their data until it is modified."""
+
+import numpy as np
+import pytest
+
+from emiproc.inventories import EmissionsArray
+from emiproc.inventories.utils import drop, group_categories, scale_inventory
+from emiproc.profiles.vertical_profiles import VerticalProfile
+from emiproc.speciation import speciate_inventory
+from emiproc.tests_utils import temporal_profiles
+from emiproc.tests_utils.test_inventories import inv as inv_test
+from emiproc.tests_utils.test_inventories import inv_with_pnt_sources
+
+
+def test_copy_shares_gdfs():
+    inv = inv_with_pnt_sources.copy(deep=True)
+    inv_copy = inv.copy()
+    assert np.shares_memory(
+        inv_copy.gdf[("adf", "CO2")].to_numpy(), inv.gdf[("adf", "CO2")].to_numpy()
+    )
+
+    inv_copy.gdf[("adf", "CO2")] *= 2
+    inv_copy.gdfs["liku"]["CO2"] *= 2
+    np.testing.assert_array_equal(
+        inv.gdf[("adf", "CO2")], inv_with_pnt_sources.gdf[("adf", "CO2")]
+    )
+    np.testing.assert_array_equal(
+        inv.gdfs["liku"]["CO2"], inv_with_pnt_sources.gdfs["liku"]["CO2"]
+    )
+
+
+def test_deep_copy():
+    inv_copy = inv_with_pnt_sources.copy(deep=True)
+    assert not np.shares_memory(
+        inv_copy.gdf[("adf", "CO2")].to_numpy(),
+        inv_with_pnt_sources.gdf[("adf", "CO2")].to_numpy(),
+    )
+
+
+def test_copy_shares_emissions_array():
+    inv = inv_with_pnt_sources.copy()
+    inv.emissions = EmissionsArray.from_gdf(inv.gdf)
+    inv_copy = inv.copy()
+    assert inv_copy.emissions.values is inv.emissions.values
+
+    inv_copy.emissions[("adf", "CO2")] = 0.0
+    inv_copy.emissions[("new", "CO2")] = 1.0
+    assert inv_copy.emissions.values is not inv.emissions.values
+    np.testing.assert_array_equal(
+        inv.emissions[("adf", "CO2")], inv_with_pnt_sources.gdf[("adf", "CO2")]
+    )
+    assert ("new", "CO2") not in inv.emissions
+    assert inv_copy.total_emissions.loc["CO2", "adf"] == 0.0
+    assert inv_copy.total_emissions.loc["CO2", "new"] == len(inv.geometry)
+
+
+def test_set_profile_on_copy():
+    inv = inv_with_pnt_sources.copy()
+    inv.set_profile(
+        VerticalProfile(np.array([0.5, 0.5]), np.array([10, 20])), category="adf"
+    )
+    indexes = inv.v_profiles_indexes.copy()
+
+    inv_copy = inv.copy()
+    inv_copy.set_profile(
+        VerticalProfile(np.array([1.0, 0.0]), np.array([10, 20])), category="liku"
+    )
+    assert len(inv.v_profiles) == 1
+    assert len(inv_copy.v_profiles) == 2
+    assert inv.v_profiles_indexes.equals(indexes)
+
+
+def _inv_with_cell_profiles(indexes):
+    inv = inv_test.copy()
+    inv.set_profiles(temporal_profiles.three_composite_profiles, indexes=indexes)
+    return inv
+
+
+def test_read_profiles_does_not_copy():
+    indexes = temporal_profiles.indexes_inv_catsubcell.copy()
+    inv = _inv_with_cell_profiles(indexes)
+    inv_copy = inv.copy()
+    assert inv_copy.t_profiles_groups is inv.t_profiles_groups
+    assert np.shares_memory(
+        inv_copy.t_profiles_indexes.values, inv.t_profiles_indexes.values
+    )
+    # The source is not modified by the copy
+    assert indexes.values.flags.writeable
+
+
+@pytest.mark.parametrize("write_on_parent", [True, False])
+def test_write_profiles_indexes_after_copy(write_on_parent):
+    inv = _inv_with_cell_profiles(temporal_profiles.indexes_inv_catsubcell.copy())
+    inv_copy = inv.copy()
+    written, other = (inv, inv_copy) if write_on_parent else (inv_copy, inv)
+
+    # Shared indexes cannot be modified in place
+    with pytest.raises(ValueError):
+        written.t_profiles_indexes.loc[dict(cell=0)] = 0
+    written.set_profile(temporal_profiles.oem_const_profile, category="adf")
+    assert (written.t_profiles_indexes.sel(category="adf") == 3).all()
+    assert len(written.t_profiles_groups) == 4
+    assert other.t_profiles_indexes.equals(temporal_profiles.indexes_inv_catsubcell)
+    assert len(other.t_profiles_groups) == 3
+    # The other is the last one using the indexes and can modify them
+    other.t_profiles_indexes.loc[dict(cell=0)] = 0
+    assert (other.t_profiles_indexes.sel(cell=0) == 0).all()
+
+
+def test_write_emissions_array_after_copy():
+    inv = inv_with_pnt_sources.copy()
+    inv.emissions = EmissionsArray.from_gdf(inv.gdf)
+    inv_copy = inv.copy()
+
+    inv.emissions[("adf", "CO2")] = 0.0
+    assert inv.emissions.values.flags.writeable
+    assert inv_copy.emissions.values.flags.writeable
+    np.testing.assert_array_equal(
+        inv_copy.emissions[("adf", "CO2")], inv_with_pnt_sources.gdf[("adf", "CO2")]
+    )
+    # The copy is the last one using the values and does not copy them
+    values = inv_copy.emissions.values
+    inv_copy.emissions[("adf", "CO2")] = 1.0
+    assert inv_copy.emissions.values is values
+
+
+@pytest.mark.parametrize(
+    "operator",
+    [
+        lambda inv, **kwargs: scale_inventory(inv, {"CO2": {"adf": 2.0}}, **kwargs),
+        lambda inv, **kwargs: drop(inv, substances=["CH4"], **kwargs),
+        lambda inv, **kwargs: group_categories(
+            inv,
+            {"a": ["adf", "liku"], "b": ["test", "blek", "other"]},
+            **kwargs,
+        ),
+        lambda inv, **kwargs: speciate_inventory(
+            inv, {("adf", "CO2"): {("adf", "CO2_ANT"): 0.7}}, **kwargs
+        ),
+    ],
+)
+def test_inplace(operator):
+    inv = inv_with_pnt_sources.copy()
+    expected_inv = operator(inv_with_pnt_sources)
+
+    out_inv = operator(inv, inplace=True)
+
+    assert out_inv is inv
+    assert inv.history[-1] == expected_inv.history[-1]
+    assert inv.total_emissions.equals(expected_inv.total_emissions)
@@ -0,0 +1,115 @@
+"""Test the inventories storing their emissions in an array."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from emiproc.grids import RegularGrid
+from emiproc.inventories import EmissionsArray
+from emiproc.inventories.utils import (
+    add_inventories,
+    drop,
+    group_categories,
+    scale_inventory,
+)
+from emiproc.regrid import remap_inventory
+from emiproc.tests_utils.test_inventories import inv_with_pnt_sources
+
+
+def array_inventory(inv, sparse=False):
+    inv = inv.copy()
+    inv.emissions = EmissionsArray.from_gdf(inv.gdf)
+    if sparse:
+        inv.emissions = inv.emissions.to_sparse()
+    return inv
+
+
+def test_gdf_roundtrip():
+    gdf = inv_with_pnt_sources.gdf
+    emissions = EmissionsArray.from_gdf(gdf)
+    assert emissions.values.shape == (4, len(gdf))
+    assert emissions.columns == inv_with_pnt_sources._gdf_columns
+    pd.testing.assert_frame_equal(emissions.to_gdf(), gdf, check_dtype=False)
+
+
+def test_wrong_shape():
+    emissions = EmissionsArray.from_gdf(inv_with_pnt_sources.gdf)
+    with pytest.raises(ValueError):
+        EmissionsArray(emissions.values[:, 1:], emissions.columns, emissions.geometry)
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_gdf_created_when_accessed(sparse):
+    inv = array_inventory(inv_with_pnt_sources, sparse=sparse)
+    assert set(inv.categories) == set(inv_with_pnt_sources.categories)
+    assert set(inv.substances) == set(inv_with_pnt_sources.substances)
+    assert inv._gdf is None
+
+    pd.testing.assert_frame_equal(
+        inv.gdf, inv_with_pnt_sources.gdf, check_dtype=False, check_like=True
+    )
+    # The array stays the storage
+    assert inv._gdf is None
+    assert inv.emissions.is_sparse == sparse
+
+
+def test_add_inventories_keeps_storage():
+    inv = array_inventory(inv_with_pnt_sources, sparse=True)
+    added = add_inventories(inv, inv_with_pnt_sources)
+    assert inv.emissions.is_sparse
+    np.testing.assert_allclose(
+        added.emissions[("adf", "CO2")], 2 * inv_with_pnt_sources.gdf[("adf", "CO2")]
+    )
+
+
+def test_emissions_of_gdf_are_read_only():
+    inv = inv_with_pnt_sources.copy()
+    with pytest.raises(ValueError):
+        inv.emissions.values[0, 0] = 99
+
+
+def test_sparse():
+    emissions = EmissionsArray.from_gdf(inv_with_pnt_sources.gdf)
+    emissions.values[:, 1:3] = 0
+    sparse = emissions.to_sparse()
+    assert sparse.is_sparse
+    assert sparse.values.nnz == np.count_nonzero(emissions.values)
+    for col in emissions.columns:
+        np.testing.assert_array_equal(sparse[col], emissions[col])
+    np.testing.assert_array_equal(sparse.totals(), emissions.totals())
+    np.testing.assert_array_equal(sparse.nonzero_cells(), emissions.nonzero_cells())
+    np.testing.assert_array_equal(sparse.to_dense().values, emissions.values)
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+@pytest.mark.parametrize(
+    "operator",
+    [
+        lambda inv: group_categories(
+            inv, {"a": ["adf", "liku"], "b": ["test", "blek", "other"]}
+        ),
+        lambda inv: scale_inventory(inv, {"CO2": {"adf": 2.0, "liku": 0.5}}),
+        lambda inv: scale_inventory(
+            inv, {"CH4": {"adf": np.arange(5.0)}, "CO2": {"adf": 2.0}}
+        ),
+        lambda inv: drop(inv, substances=["CH4"], categories=["test"]),
+        lambda inv: remap_inventory(
+            inv, RegularGrid(xmin=0, ymin=0, nx=3, ny=3, dx=1, dy=1, crs=None)
+        ),
+    ],
+)
+def test_operators_on_array(operator, sparse):
+    inv = array_inventory(inv_with_pnt_sources, sparse=sparse)
+    out_inv = operator(inv)
+    expected_inv = operator(inv_with_pnt_sources)
+
+    # The array is used and not converted to a gdf
+    assert inv._gdf is None
+    assert out_inv._gdf is None
+    assert out_inv.emissions.is_sparse == sparse
+    pd.testing.assert_frame_equal(
+        out_inv.total_emissions.sort_index().sort_index(axis=1),
+        expected_inv.total_emissions.sort_index().sort_index(axis=1),
+    )
+    columns = expected_inv._gdf_columns
+    pd.testing.assert_frame_equal(out_inv.gdf[columns], expected_inv.gdf[columns])
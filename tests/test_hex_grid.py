@@ -1,7 +1,13 @@
 # %%
 import pytest
 import geopandas as gpd
-from emiproc.grids import HexGrid
+import numpy as np
+from emiproc.grids import HexGrid, RegularGrid
+from emiproc.regrid import (
+    calculate_hex_regular_weights_mapping,
+    calculate_weights_mapping,
+    get_regular_weights_mapping,
+)
 from emiproc.tests_utils.test_grids import hex_grid
 
 
@@ -89,3 +95,59 @@ def test_shape():
 
     assert nx == hex_grid.nx
     assert ny == hex_grid.ny
+
+
+def test_cell_corners_array():
+    corners = hex_grid.cell_corners_array()
+    assert corners.shape == (len(hex_grid), 6, 2)
+    cells = [1, 7, len(hex_grid) - 1]
+    np.testing.assert_array_equal(hex_grid.cell_corners_array(cells), corners[cells])
+
+
+def test_locate():
+    xmin, ymin, xmax, ymax = hex_grid.gdf.total_bounds
+    rng = np.random.default_rng(0)
+    x = rng.uniform(xmin - 1, xmax + 1, 200)
+    y = rng.uniform(ymin - 1, ymax + 1, 200)
+    located = hex_grid.locate(x, y)
+    points = gpd.points_from_xy(x, y)
+    for point, cell in zip(points, located):
+        if cell == -1:
+            assert not hex_grid.gdf.geometry.intersects(point).any()
+        else:
+            assert hex_grid.gdf.geometry.iloc[cell].intersects(point)
+
+
+def test_fingerprint():
+    grid = HexGrid(xmin=-1, xmax=5, ymin=-2, ymax=3, nx=10, ny=15, name="Other name")
+    assert grid == hex_grid
+    assert hash(grid) == hash(hex_grid)
+    rotated = HexGrid(
+        xmin=-1, xmax=5, ymin=-2, ymax=3, nx=10, ny=15, oriented_north=False
+    )
+    assert rotated != hex_grid
+
+
+@pytest.mark.parametrize("oriented_north", [True, False])
+@pytest.mark.parametrize("hex_is_inv", [True, False])
+def test_hex_regular_weights(oriented_north, hex_is_inv):
+    hexagons = HexGrid(
+        xmin=-1, xmax=5, ymin=-2, ymax=3, nx=10, ny=15, oriented_north=oriented_north
+    )
+    regular = RegularGrid(xmin=-1.5, xmax=4.7, ymin=-3, ymax=2.2, nx=7, ny=5)
+    grid_inv, grid_out = (hexagons, regular) if hex_is_inv else (regular, hexagons)
+
+    w_mapping = calculate_hex_regular_weights_mapping(grid_inv, grid_out)
+    w_mapping_expected = calculate_weights_mapping(grid_inv.gdf, grid_out.gdf)
+    # Remove the slivers from the rounding errors of the intersections
+    keep = w_mapping_expected["weights"] > 1e-12
+    w_mapping_expected = {k: v[keep] for k, v in w_mapping_expected.items()}
+    for key in w_mapping:
+        np.testing.assert_allclose(w_mapping[key], w_mapping_expected[key])
+
+    # The same weights are found from the geometries of the cells
+    w_mapping = get_regular_weights_mapping(
+        grid_inv.gdf.geometry, grid_inv, grid_out.gdf.geometry, grid_out
+    )
+    for key in w_mapping:
+        np.testing.assert_allclose(w_mapping[key], w_mapping_expected[key])
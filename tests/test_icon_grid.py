@@ -0,0 +1,134 @@
+"""Test the cells of the icon grids."""
+
+import numpy as np
+import pytest
+import shapely
+from netCDF4 import Dataset
+
+from emiproc import TESTS_DIR, weights_cache
+from emiproc.grids import ICONGrid, _antimeridian_triangles
+from emiproc.tests_utils.icon import get_test_grid
+
+
+def write_triangles_grid(path):
+    """Write a small grid file, made of squares of 30 degrees cut in two."""
+    lon, lat = np.meshgrid(np.arange(-180, 181, 30), np.arange(-60, 61, 30))
+    nx, ny = lon.shape[1], lon.shape[0]
+    vertex = np.arange(lon.size).reshape(lon.shape)
+    squares = [
+        vertex[:-1, :-1].ravel(),
+        vertex[:-1, 1:].ravel(),
+        vertex[1:, 1:].ravel(),
+        vertex[1:, :-1].ravel(),
+    ]
+    triangles = np.concatenate(
+        [np.stack(squares[:3]), np.stack([squares[0], squares[2], squares[3]])],
+        axis=1,
+    )
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with Dataset(path, "w") as ds:
+        ds.createDimension("cell", triangles.shape[1])
+        ds.createDimension("vertex", lon.size)
+        ds.createDimension("nv", 3)
+        ds.createDimension("ne", 6)
+        for var, dim, values in [
+            ("clon", "cell", np.deg2rad(lon.ravel()[triangles].mean(axis=0))),
+            ("clat", "cell", np.deg2rad(lat.ravel()[triangles].mean(axis=0))),
+            ("cell_area", "cell", np.arange(triangles.shape[1], dtype=float)),
+            ("vlon", "vertex", np.deg2rad(lon.ravel())),
+            ("vlat", "vertex", np.deg2rad(lat.ravel())),
+        ]:
+            ds.createVariable(var, "f8", (dim,))[:] = values
+        ds.createVariable("vertex_of_cell", "i4", ("nv", "cell"))[:] = triangles + 1
+        ds.createVariable("cells_of_vertex", "i4", ("ne", "vertex"))[:] = -1
+
+
+def test_antimeridian_triangles():
+    corners = np.array(
+        [
+            # Normal triangle
+            [[0.0, 0.0], [1.0, 0.0], [0.0, 1.0]],
+            # Crossing the antimeridian
+            [[179.0, 0.0], [-179.0, 0.0], [179.0, 1.0]],
+            # Two corners on the antimeridian
+            [[180.0, 0.0], [-179.0, 0.5], [180.0, 1.0]],
+        ]
+    )
+    cells = _antimeridian_triangles(corners)
+
+    assert cells[0].equals(shapely.Polygon(corners[0]))
+    assert cells[1].geom_type == "MultiPolygon"
+    assert len(cells[1].geoms) == 2
+    np.testing.assert_allclose(cells[1].area, 1.0)
+    np.testing.assert_array_equal(cells[1].bounds, [-180.0, 0.0, 180.0, 1.0])
+    # Moved to the side of the third corner
+    assert cells[2].equals(
+        shapely.Polygon([[-180.0, 0.0], [-179.0, 0.5], [-180.0, 1.0]])
+    )
+
+
+def test_cells_cache():
+    pytest.importorskip("pyarrow")
+    grid_path = get_test_grid().dataset_path
+    cache_dir = TESTS_DIR / "icon_cells_cache"
+    grid = ICONGrid(grid_path, cache_dir=cache_dir)
+    grid.cells_cache_file.unlink(missing_ok=True)
+
+    cells = grid.gdf.geometry
+    assert grid.cells_cache_file.is_file()
+    cached_grid = ICONGrid(grid_path, cache_dir=cache_dir)
+    assert cached_grid.gdf.geometry.geom_equals_exact(cells, 0).all()
+    assert cached_grid.gdf.crs == grid.crs
+
+
+def test_cells_cache_default(monkeypatch):
+    grid_dir = TESTS_DIR / "icon_default_cache"
+    grid_path = grid_dir / "triangles_grid.nc"
+    write_triangles_grid(grid_path)
+    for file in grid_dir.glob(".emiproc_*"):
+        file.unlink()
+
+    # Without weights cache, the cells are not saved
+    monkeypatch.setattr(weights_cache, "_default_cache", None)
+    monkeypatch.setattr(weights_cache, "_default_cache_set", True)
+    grid = ICONGrid(grid_path)
+    assert grid.cells_cache_file is None
+    grid.gdf
+    assert list(grid_dir.iterdir()) == [grid_path]
+
+    # The cells are saved in the weights cache, not next to the grid file
+    pytest.importorskip("pyarrow")
+    cache = weights_cache.WeightsCache(grid_dir / "weights")
+    monkeypatch.setattr(weights_cache, "_default_cache", cache)
+    grid = ICONGrid(grid_path)
+    grid.gdf
+    assert grid.cells_cache_file.parent == cache.cache_dir
+    assert grid.cells_cache_file.is_file()
+    assert not list(grid_dir.glob(".emiproc_*"))
+
+
+def test_subset():
+    grid_path = TESTS_DIR / "icon_subset" / "triangles_grid.nc"
+    write_triangles_grid(grid_path)
+    grid = ICONGrid(grid_path, cache=False)
+    cells = grid.gdf.geometry.to_numpy()
+
+    bbox = (-100.0, 10.0, -50.0, 40.0)
+    subset = grid.subset(bbox)
+    expected = np.flatnonzero(shapely.intersects(cells, shapely.box(*bbox)))
+    np.testing.assert_array_equal(subset.global_cells, expected)
+    assert shapely.equals(subset.gdf.geometry.to_numpy(), cells[expected]).all()
+    np.testing.assert_array_equal(subset.cell_areas, grid.cell_areas[expected])
+    # The vertices are renumbered for the subset
+    np.testing.assert_array_equal(
+        subset.vlon[subset.vertex_of_cell - 1].T, grid.corners[expected, :, 0]
+    )
+
+    # Subset of a subset
+    polygon = shapely.Polygon([(-100, 10), (-80, 10), (-80, 20)])
+    subsubset = subset.subset(polygon)
+    expected = np.flatnonzero(shapely.intersects(cells, polygon))
+    np.testing.assert_array_equal(subsubset.global_cells, expected)
+
+    with pytest.raises(ValueError):
+        grid.subset((0, 80, 10, 90))
@@ -0,0 +1,115 @@
+"""Test the lazy processing of inventories."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from emiproc import TESTS_DIR
+from emiproc.grids import RegularGrid
+from emiproc.inventories import EmissionsArray
+from emiproc.inventories.lazy import LazyInventory
+from emiproc.inventories.utils import drop, group_categories, scale_inventory
+from emiproc.profiles.vertical_profiles import VerticalProfile
+from emiproc.regrid import remap_inventory
+from emiproc.speciation import read_speciation_table, speciate, speciate_inventory
+from emiproc.tests_utils.test_inventories import inv_with_pnt_sources
+
+grid = RegularGrid(xmin=0, ymin=0, nx=3, ny=3, dx=1, dy=1, crs=None)
+coarse_grid = RegularGrid(xmin=0, ymin=0, nx=2, ny=2, dx=1.5, dy=1.5, crs=None)
+
+
+def inventory_with_profiles(sparse=False):
+    inv = inv_with_pnt_sources.copy()
+    if sparse:
+        inv.emissions = EmissionsArray.from_gdf(inv.gdf).to_sparse()
+    inv.set_profile(
+        VerticalProfile(np.array([0.5, 0.5]), np.array([10, 20])), category="adf"
+    )
+    inv.set_profile(
+        VerticalProfile(np.array([1.0, 0.0]), np.array([10, 20])), category="liku"
+    )
+    return inv
+
+
+def processing_chain(inv):
+    inv = drop(inv, substances=["NH3"])
+    inv = speciate(
+        inv,
+        substance="CO2",
+        speciation_ratios=read_speciation_table(
+            TESTS_DIR / "speciation" / "wrong_ratio_table.csv", check_sum=False
+        ),
+    )
+    inv = group_categories(inv, {"a": ["adf", "liku"], "b": ["blek", "other"]})
+    inv = speciate_inventory(inv, {("a", "CH4"): {("a", "CH4_ANT"): 0.7}})
+    inv = scale_inventory(inv, {"CO2_BIO": {"a": 2.0}})
+    inv = remap_inventory(inv, grid)
+    return remap_inventory(inv, coarse_grid)
+
+
+def assert_same_inventories(inv, expected_inv):
+    assert inv._gdf_columns == expected_inv._gdf_columns
+    pd.testing.assert_frame_equal(inv.gdf, expected_inv.gdf)
+    assert inv.gdfs.keys() == expected_inv.gdfs.keys()
+    np.testing.assert_array_equal(inv.v_profiles.ratios, expected_inv.v_profiles.ratios)
+    assert inv.v_profiles_indexes.equals(expected_inv.v_profiles_indexes)
+    assert inv.history == expected_inv.history
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_same_as_eager(sparse):
+    inv = inventory_with_profiles(sparse)
+    lazy_inv = processing_chain(LazyInventory(inv))
+    expected_inv = processing_chain(inv)
+
+    assert isinstance(lazy_inv, LazyInventory)
+    assert lazy_inv.steps[-1] == "remap_inventory"
+    assert lazy_inv.columns == expected_inv._gdf_columns
+
+    out_inv = lazy_inv.execute()
+    assert out_inv.emissions.is_sparse == sparse
+    assert_same_inventories(out_inv, expected_inv)
+
+
+def test_execute_some_columns():
+    lazy_inv = processing_chain(LazyInventory(inventory_with_profiles()))
+    expected_inv = processing_chain(inventory_with_profiles())
+    columns = [("a", "CH4_ANT"), ("b", "AITS")]
+
+    out_inv = lazy_inv.execute(columns=columns)
+
+    assert out_inv._gdf_columns == columns
+    pd.testing.assert_frame_equal(out_inv.gdf[columns], expected_inv.gdf[columns])
+
+
+def test_keep_gdfs():
+    lazy_inv = remap_inventory(
+        LazyInventory(inv_with_pnt_sources), grid, keep_gdfs=True
+    )
+    lazy_inv = scale_inventory(lazy_inv, 2.0)
+    expected_inv = scale_inventory(
+        remap_inventory(inv_with_pnt_sources, grid, keep_gdfs=True), 2.0
+    )
+
+    out_inv = lazy_inv.execute()
+
+    pd.testing.assert_frame_equal(out_inv.gdf, expected_inv.gdf)
+    for cat, gdf in expected_inv.gdfs.items():
+        pd.testing.assert_frame_equal(out_inv.gdfs[cat], gdf)
+
+
+def test_cell_dependent_step():
+    """Scaling factors per cell cannot be recorded, the plan is executed."""
+    factors = {"CO2": {"adf": np.arange(9.0)}}
+    lazy_inv = remap_inventory(LazyInventory(inv_with_pnt_sources), grid)
+    lazy_inv = scale_inventory(lazy_inv, factors)
+    lazy_inv = group_categories(
+        lazy_inv, {"a": ["adf", "liku", "test"], "b": ["blek", "other"]}
+    )
+    expected_inv = group_categories(
+        scale_inventory(remap_inventory(inv_with_pnt_sources, grid), factors),
+        {"a": ["adf", "liku", "test"], "b": ["blek", "other"]},
+    )
+
+    assert lazy_inv.steps == ["remap_inventory", "scale_inventory", "group_categories"]
+    pd.testing.assert_frame_equal(lazy_inv.execute().gdf, expected_inv.gdf)
@@ -1,7 +1,9 @@
 # %%
 import pytest
 import geopandas as gpd
-from emiproc.grids import RegularGrid
+import numpy as np
+import shapely
+from emiproc.grids import GeoPandasGrid, Grid, RegularGrid
 from emiproc.tests_utils.test_grids import regular_grid
 
 
@@ -48,8 +50,147 @@ def test_area():
     regular_grid.cell_areas
 
 
+def test_area_geographic():
+    grid = RegularGrid(xmin=-180, ymin=-90, nx=36, ny=18, dx=10, dy=10)
+    areas = grid.cell_areas
+    assert areas.shape == (len(grid),)
+    # Area of the WGS84 ellipsoid
+    np.testing.assert_allclose(areas.sum(), 5.10065621724e14, rtol=1e-10)
+    # Same as the areas of the polygons in an equal area projection
+    expected = gpd.GeoSeries(grid.cells_as_polylist, crs=grid.crs).to_crs(6933).area
+    np.testing.assert_allclose(areas, expected, rtol=1e-9)
+
+
+def test_area_projected():
+    grid = RegularGrid(xmin=2600000, ymin=1200000, nx=3, ny=2, dx=100, dy=50, crs=2056)
+    np.testing.assert_array_equal(grid.cell_areas, np.full(6, 5000.0))
+
+
 def test_shape():
     nx, ny = regular_grid.shape
 
     assert nx == regular_grid.nx
     assert ny == regular_grid.ny
+
+
+def test_cell_arrays_match_polygons():
+    grid = RegularGrid.from_centers(
+        x_centers=np.arange(4) + 0.5, y_centers=np.arange(3, 0, -1) - 0.5
+    )
+    polys = np.array(grid.cells_as_polylist)
+    np.testing.assert_allclose(grid.cell_bounds(), shapely.bounds(polys))
+    np.testing.assert_allclose(
+        grid.cell_centers(), shapely.get_coordinates(shapely.centroid(polys))
+    )
+    assert grid.total_bounds == tuple(shapely.total_bounds(polys))
+
+    cells = np.array([5, 0, 11])
+    assert all(shapely.equals_exact(grid.cell_polygons(cells), polys[cells], 0))
+    assert grid.cell_corners_array(cells).shape == (3, 4, 2)
+
+
+def test_cells_in_bounds():
+    bounds = (1.2, 0.5, 2.0, 1.0)
+    cells = regular_grid.cells_in_bounds(bounds)
+    expected = np.flatnonzero(
+        shapely.intersects(
+            np.array(regular_grid.cells_as_polylist), shapely.box(*bounds)
+        )
+    )
+    np.testing.assert_array_equal(cells, expected)
+
+
+def test_cell_corners_wrapper():
+    corners = regular_grid.cell_corners_array()
+    x, y = regular_grid.cell_corners(2, 3)
+    np.testing.assert_array_equal(x, corners[2 * regular_grid.ny + 3, :, 0])
+    np.testing.assert_array_equal(y, corners[2 * regular_grid.ny + 3, :, 1])
+
+
+def test_polylist_from_cell_corners():
+    class CellCornersGrid(Grid):
+        nx, ny = 2, 3
+
+        def cell_corners(self, i, j):
+            return np.array([i, i + 1, i + 1, i]), np.array([j, j, j + 1, j + 1])
+
+    grid = CellCornersGrid("test")
+    assert grid.cell_corners_array().shape == (6, 4, 2)
+    assert grid.cells_as_polylist[4].equals(shapely.box(1, 1, 2, 2))
+
+
+def test_cells_to_crs():
+    grid = RegularGrid(
+        xmin=2600000, ymin=1200000, nx=4, ny=3, dx=1000, dy=1000, crs=2056
+    )
+    cells = grid.cells_to_crs(4326)
+    expected = gpd.GeoSeries(grid.cells_as_polylist, crs=grid.crs).to_crs(4326)
+    assert cells.crs == expected.crs
+    assert all(shapely.equals_exact(cells.to_numpy(), expected.to_numpy(), 1e-9))
+
+    densified = grid.cells_to_crs(4326, densify=3)
+    assert all(shapely.get_num_coordinates(densified.to_numpy()) == 4 * 4 + 1)
+    np.testing.assert_allclose(densified.area, expected.area, rtol=1e-6)
+    # Neighbouring cells share exactly the same edge
+    shared = shapely.intersection(densified.iloc[0], densified.iloc[1])
+    assert shapely.line_merge(shared).geom_type == "LineString"
+
+
+def test_locate():
+    x = [-0.75, 0.5, 100.0, np.nan]
+    y = [-1.5, 2.5, 0.0, 0.0]
+    located = regular_grid.locate(x, y)
+    cells = np.array(regular_grid.cells_as_polylist)
+    assert cells[located[0]].contains(shapely.Point(x[0], y[0]))
+    assert cells[located[1]].contains(shapely.Point(x[1], y[1]))
+    np.testing.assert_array_equal(located[2:], [-1, -1])
+
+    # The cells of the grid decrease along y
+    grid = RegularGrid.from_centers(
+        x_centers=np.arange(5) + 0.5, y_centers=np.arange(4)[::-1] + 0.5
+    )
+    np.testing.assert_array_equal(
+        grid.locate([0.2, 0.2, 4.9], [3.8, 0.1, 0.5]), [0, 3, 4 * grid.ny + 3]
+    )
+    # Same as the generic implementation with the geometries
+    points = np.random.default_rng(0).uniform(-1, 6, size=(2, 50))
+    np.testing.assert_array_equal(grid.locate(*points), Grid.locate(grid, *points))
+
+
+def test_fingerprint():
+    grid = RegularGrid(xmin=-1, ymin=-2, nx=10, ny=15, dx=0.5, dy=0.25, name="a")
+    same = RegularGrid(xmin=-1, ymin=-2, xmax=4, ymax=1.75, nx=10, ny=15, name="b")
+    assert grid == same
+    assert len({grid, same}) == 1
+    assert grid.fingerprint == same.fingerprint
+    assert grid != RegularGrid(xmin=-1, ymin=-2, nx=10, ny=15, dx=0.5, dy=0.3)
+    assert grid != RegularGrid(
+        xmin=-1, ymin=-2, nx=10, ny=15, dx=0.5, dy=0.25, crs="EPSG:3857"
+    )
+    # The crs can be given in different ways
+    assert grid == RegularGrid(
+        xmin=-1, ymin=-2, nx=10, ny=15, dx=0.5, dy=0.25, crs="EPSG:4326"
+    )
+    # Other grids are compared with their cells
+    gpd_grid = GeoPandasGrid(grid.gdf, shape=grid.shape)
+    assert gpd_grid == GeoPandasGrid(grid.gdf.copy(), shape=grid.shape)
+    assert gpd_grid != GeoPandasGrid(grid.gdf.translate(xoff=1e-9), shape=grid.shape)
+
+
+def test_is_regular():
+    assert regular_grid.is_regular
+
+    # Like the WRF grid, which has the cells of a regular grid in another crs
+    class CurvilinearGrid(RegularGrid):
+        def __init__(self):
+            Grid.__init__(self, "curvilinear")
+            self.nx, self.ny = 2, 3
+            self.cells_as_polylist = [
+                shapely.box(i, j, i + 1, j + 1) for i in range(2) for j in range(3)
+            ]
+
+    grid = CurvilinearGrid()
+    assert not grid.is_regular
+    # The methods of the regular grids use the polygons instead
+    np.testing.assert_array_equal(grid.locate([1.5], [2.5]), [5])
+    np.testing.assert_allclose(grid.total_bounds, (0, 0, 2, 3))
@@ -1,6 +1,14 @@
 import pytest 
+import geopandas as gpd
+import numpy as np
+from emiproc.grids import RegularGrid
 from emiproc.inventories import  EmissionInfo, Inventory
-from emiproc.regrid import remap_inventory
+from emiproc.regrid import (
+    get_regular_weights_mapping,
+    get_weights_mapping,
+    remap_inventory,
+    weights_remap,
+)
 from emiproc.tests_utils.test_inventories import inv_with_pnt_sources, inv_with_gdfs_bad_indexes, inv
 from emiproc.tests_utils.test_grids import regular_grid, gpd_grid
 from emiproc.tests_utils.temporal_profiles import three_composite_profiles, indexes_inv_catsubcell
@@ -83,4 +91,106 @@ def test_remap_inv_with_profiles():
     remapped_inv = remap_inventory(this_inv, gpd_grid)
 
     assert len(remapped_inv.t_profiles_groups) > 1, "There should be more than one profiles"
-    assert remapped_inv.t_profiles_indexes.dims == indexes_inv_catsubcell.dims
\ No newline at end of file
+    assert remapped_inv.t_profiles_indexes.dims == indexes_inv_catsubcell.dims
+
+
+def test_remap_regular_grids_analytic():
+    """The analytic weights must give the same as the geometric remapping."""
+    grid_in = RegularGrid(xmin=0, ymin=0, nx=30, ny=20, dx=0.1, dy=0.15)
+    grid_out = RegularGrid(xmin=0.23, ymin=-0.3, nx=12, ny=15, dx=0.27, dy=0.21)
+    rng = np.random.default_rng(42)
+    # Shuffle the cells to check the indexes are correctly found
+    cells = rng.permutation(len(grid_in))
+    gdf = gpd.GeoDataFrame(
+        {("a", "CO2"): rng.random(len(grid_in)), ("b", "CH4"): rng.random(len(grid_in))},
+        geometry=grid_in.gdf.geometry.iloc[cells].reset_index(drop=True),
+        crs=grid_in.crs,
+    )
+    regular_inv = Inventory.from_gdf(gdf)
+    regular_inv.grid = grid_in
+
+    cells_out = gpd.GeoSeries(grid_out.cells_as_polylist, crs=grid_out.crs)
+    assert (
+        get_regular_weights_mapping(gdf.geometry, grid_in, cells_out, grid_out)
+        is not None
+    )
+
+    remapped = remap_inventory(regular_inv, grid_out)
+    # Giving a geoserie forces the geometric remapping
+    remapped_geometric = remap_inventory(regular_inv, cells_out)
+
+    for col in regular_inv._gdf_columns:
+        np.testing.assert_allclose(
+            remapped.gdf[col].to_numpy(),
+            remapped_geometric.gdf[col].to_numpy(),
+            atol=1e-12,
+        )
+
+
+def test_remap_columns_same_as_per_column():
+    remapped = remap_inventory(inv_with_pnt_sources, gpd_grid, cache=False)
+    grid_cells = gpd_grid.gdf.geometry.reset_index(drop=True)
+
+    w_mapping = get_weights_mapping(
+        None, inv_with_pnt_sources.gdf.geometry, grid_cells, cache=False
+    )
+    expected = {
+        col: weights_remap(w_mapping, inv_with_pnt_sources.gdf[col], len(grid_cells))
+        for col in inv_with_pnt_sources._gdf_columns
+    }
+    for cat, gdf in inv_with_pnt_sources.gdfs.items():
+        w_mapping_gdf = get_weights_mapping(
+            None,
+            gdf.geometry.reset_index(drop=True),
+            grid_cells,
+            loop_over_inv_objects=True,
+            cache=False,
+        )
+        for sub in gdf.columns.drop("geometry"):
+            remapped_sub = weights_remap(
+                w_mapping_gdf, gdf[sub].reset_index(drop=True), len(grid_cells)
+            )
+            expected[(cat, sub)] = expected.get((cat, sub), 0) + remapped_sub
+
+    assert list(remapped._gdf_columns) == list(expected)
+    for col, values in expected.items():
+        np.testing.assert_allclose(remapped.gdf[col].to_numpy(), values)
+
+
+def test_remap_with_emissions_mask():
+    gdf = inv.gdf.copy()
+    # Cells without emissions
+    gdf.loc[[1, 3], inv._gdf_columns] = 0.0
+    inv_with_zeros = Inventory.from_gdf(gdf)
+
+    remapped = remap_inventory(inv_with_zeros, gpd_grid, cache=False)
+    remapped_masked = remap_inventory(
+        inv_with_zeros, gpd_grid, cache=False, emissions_mask=True
+    )
+    for col in inv_with_zeros._gdf_columns:
+        np.testing.assert_allclose(remapped.gdf[col], remapped_masked.gdf[col])
+
+
+def test_remap_with_mask_excluding_emissions():
+    gdf = inv.gdf.copy()
+    gdf.loc[[1, 3], inv._gdf_columns] = 0.0
+    # Mask of another inventory, the cells 1 and 3 of inv have emissions
+    mask = Inventory.from_gdf(gdf).emissions.nonzero_cells()
+    with pytest.raises(ValueError):
+        remap_inventory(inv, gpd_grid, cache=False, emissions_mask=mask)
+
+
+def test_remap_on_many_grids():
+    grid = RegularGrid(xmin=-1, xmax=5, ymin=-1, ymax=5, nx=3, ny=4, crs=None)
+    grids = [gpd_grid, gpd.GeoSeries(grid.cells_as_polylist, crs=gpd_grid.crs)]
+
+    remapped_list = remap_inventory(
+        inv_with_pnt_sources, grids, cache=False, n_workers=2
+    )
+    assert len(remapped_list) == 2
+    for grid, remapped in zip(grids, remapped_list):
+        expected = remap_inventory(inv_with_pnt_sources, grid, cache=False)
+        assert remapped.grid is grid
+        assert list(remapped._gdf_columns) == list(expected._gdf_columns)
+        for col in expected._gdf_columns:
+            np.testing.assert_allclose(remapped.gdf[col], expected.gdf[col])
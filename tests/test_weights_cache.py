@@ -0,0 +1,149 @@
+"""Test the cache of the weights."""
+
+import geopandas as gpd
+import numpy as np
+from shapely.geometry import Polygon
+
+from emiproc.grids import RegularGrid
+from emiproc.inventories.utils import crop_with_shape
+from emiproc.regrid import get_weights_mapping
+from emiproc.tests_utils import WEIGHTS_DIR
+from emiproc.tests_utils.test_grids import basic_serie, basic_serie_2
+from emiproc.tests_utils.test_inventories import inv
+from emiproc.weights_cache import (
+    WeightsCache,
+    arrays_to_geometries,
+    fingerprint_geometries,
+    geometries_to_arrays,
+)
+
+triangle = Polygon(((0.5, 0.5), (1.5, 0.5), (1.5, 1.5)))
+
+
+def test_fingerprint_changes():
+    fingerprint = fingerprint_geometries(basic_serie)
+    assert fingerprint == fingerprint_geometries(basic_serie.copy())
+    assert fingerprint != fingerprint_geometries(basic_serie.translate(xoff=1e-9))
+    assert fingerprint != fingerprint_geometries(basic_serie.set_crs(4326))
+    assert fingerprint != fingerprint_geometries(basic_serie.iloc[::-1])
+
+
+def test_weights_from_cache():
+    cache = WeightsCache(WEIGHTS_DIR / "cache_test_weights_from_cache")
+    cache.clear()
+
+    w_mapping = get_weights_mapping(None, basic_serie, basic_serie_2, cache=cache)
+    assert len(cache.keys()) == 1
+    w_mapping_cached = get_weights_mapping(
+        None, basic_serie, basic_serie_2, cache=cache
+    )
+    for key in w_mapping:
+        np.testing.assert_array_equal(w_mapping[key], w_mapping_cached[key])
+
+    # Changing a parameter creates a new entry
+    get_weights_mapping(None, basic_serie, basic_serie_2, method="old", cache=cache)
+    assert len(cache.keys()) == 2
+
+
+def test_stale_weights_file_is_recomputed():
+    weights_file = WEIGHTS_DIR / "test_stale_weights_file.npz"
+    weights_file.unlink(missing_ok=True)
+
+    get_weights_mapping(weights_file, basic_serie, basic_serie_2, cache=False)
+    # Same file but other output shapes
+    other_shapes = basic_serie_2.translate(xoff=0.5)
+    w_mapping = get_weights_mapping(
+        weights_file, basic_serie, other_shapes, cache=False
+    )
+    w_mapping_expected = get_weights_mapping(
+        None, basic_serie, other_shapes, cache=False
+    )
+    assert "cache_key" not in w_mapping
+    for key in w_mapping_expected:
+        np.testing.assert_array_equal(w_mapping[key], w_mapping_expected[key])
+
+
+def test_weights_file_without_key_is_recomputed():
+    weights_file = WEIGHTS_DIR / "test_weights_file_without_key.npz"
+    w_mapping_expected = get_weights_mapping(
+        None, basic_serie, basic_serie_2, cache=False
+    )
+    # File saved by an older version, with weights for other shapes
+    wrong_mapping = get_weights_mapping(
+        None, basic_serie, basic_serie_2.translate(xoff=0.5), cache=False
+    )
+    np.savez(weights_file, **wrong_mapping)
+
+    w_mapping = get_weights_mapping(
+        weights_file, basic_serie, basic_serie_2, cache=False
+    )
+    for key in w_mapping_expected:
+        np.testing.assert_array_equal(w_mapping[key], w_mapping_expected[key])
+    # The file was overwritten with the key
+    assert "cache_key" in np.load(weights_file)
+
+
+def test_lru_eviction():
+    cache = WeightsCache(WEIGHTS_DIR / "cache_test_lru_eviction", max_entries=2)
+    cache.clear()
+    cache.save("a", {"x": np.arange(3)})
+    cache.save("b", {"x": np.arange(3)})
+    # Access a, such that b is the least recently used
+    cache.load("a")
+    cache.save("c", {"x": np.arange(3)})
+
+    assert set(cache.keys()) == {"a", "c"}
+    assert cache.metadata("c")["arrays"]["x"][1] == [3]
+
+
+def test_geometries_arrays_roundtrip():
+    shapes = basic_serie.iloc[[3, 1]]
+    recovered = arrays_to_geometries(geometries_to_arrays(shapes))
+    assert recovered.index.to_list() == [3, 1]
+    assert recovered.geom_equals(shapes).all()
+
+
+def test_crop_with_cache():
+    cache = WeightsCache(WEIGHTS_DIR / "cache_test_crop")
+    cache.clear()
+    cropped = crop_with_shape(inv, triangle, modify_grid=True, cache=cache)
+    cropped_from_cache = crop_with_shape(inv, triangle, modify_grid=True, cache=cache)
+
+    assert len(cache.keys()) == 1
+    assert cropped.gdf.geometry.geom_equals(cropped_from_cache.gdf.geometry).all()
+    for col in inv._gdf_columns:
+        np.testing.assert_allclose(cropped.gdf[col], cropped_from_cache.gdf[col])
+
+
+def test_weights_with_mask():
+    cache = WeightsCache(WEIGHTS_DIR / "cache_test_weights_with_mask")
+    cache.clear()
+    mask = np.array([True, False, True, True, False])
+
+    w_mapping = get_weights_mapping(None, basic_serie, basic_serie_2, cache=cache)
+    w_mapping_masked = get_weights_mapping(
+        None, basic_serie, basic_serie_2, cache=cache, mask=mask
+    )
+    # The mask is part of the key
+    assert len(cache.keys()) == 2
+
+    keep = mask[w_mapping["inv_indexes"]]
+    for key in w_mapping:
+        np.testing.assert_array_equal(w_mapping_masked[key], w_mapping[key][keep])
+
+
+def test_weights_of_grid():
+    cache = WeightsCache(WEIGHTS_DIR / "cache_test_weights_of_grid")
+    cache.clear()
+    grid = RegularGrid(xmin=0, ymin=0, nx=3, ny=3, dx=1, dy=1, crs=None)
+
+    w_mapping = get_weights_mapping(None, basic_serie, grid, cache=cache)
+    w_mapping_shapes = get_weights_mapping(
+        None, basic_serie, grid.gdf.geometry, cache=False
+    )
+    for key in w_mapping:
+        np.testing.assert_array_equal(w_mapping[key], w_mapping_shapes[key])
+    # The same grid created again is found in the cache
+    same_grid = RegularGrid(xmin=0, ymin=0, xmax=3, ymax=3, nx=3, ny=3, crs=None)
+    get_weights_mapping(None, basic_serie, same_grid, cache=cache)
+    assert len(cache.keys()) == 1
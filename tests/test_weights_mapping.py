@@ -1,176 +1,292 @@
-"""Test the weights mapping function."""
-from __future__ import annotations
-
-import pytest
-import geopandas as gpd
-from typing import Any, Iterable
-from shapely.geometry import Point, Polygon
-from emiproc.regrid import calculate_weights_mapping
-
-
-# Create the geometetries of an inventory
-squares = gpd.GeoSeries(
-    [
-        Polygon(((0, 0), (0, 1), (1, 1), (1, 0))),
-        Polygon(((0, 1), (0, 2), (1, 2), (1, 1))),
-        Polygon(((1, 0), (1, 1), (2, 1), (2, 0))),
-        Polygon(((1, 1), (1, 2), (2, 2), (2, 1))),
-        Polygon(((2, 1), (2, 2), (3, 2), (3, 1))),
-    ]
-)
-triangles = gpd.GeoSeries(
-    [
-        Polygon(((0.5, 0.5), (0.5, 1.5), (1.5, 1.5))),
-        Polygon(((0.5, 0.5), (1.5, 0.5), (1.5, 1.5))),
-        Polygon(((2.5, 0.5), (1.5, 1.5), (1.5, 0.5))),
-        Polygon(((2.5, 0.5), (2.5, 1.5), (1.5, 1.5))),
-    ]
-)
-
-points = gpd.GeoSeries(
-    [
-        Point(0.75, 0.75),  # on the boundary of the triangles
-        Point(0.25, 0.25),
-        Point(1.2, 1),
-        Point(1, 1),  # Between all the squares
-        Point(-1, -1),  # Outside
-    ]
-)
-
-expected_weights = [
-    # This are the weights that should be expected
-    (0, 0, 1 / 8),
-    (1, 0, 1 / 4),
-    (2, 0, 0),
-    (3, 0, 1 / 8),
-    (4, 0, 0),
-    (0, 1, 1 / 8),
-    (1, 1, 0),
-    (2, 1, 1 / 4),
-    (3, 1, 1 / 8),
-    (4, 1, 0),
-    (0, 2, 0),
-    (1, 2, 0),
-    (2, 2, 1 / 4),
-    (3, 2, 1 / 8),
-    (4, 2, 0),
-    (0, 3, 0),
-    (1, 3, 0),
-    (2, 3, 0),
-    (3, 3, 1 / 8),
-    (4, 3, 1 / 4),
-]
-
-weights_triangle_to_square = [
-    (0, 0, 0.25),
-    (0, 1, 0.5),
-    (0, 2, 0.0),
-    (0, 3, 0.25),
-    (0, 4, 0.0),
-    (1, 0, 0.25),
-    (1, 1, 0.0),
-    (1, 2, 0.5),
-    (1, 3, 0.25),
-    (1, 4, 0.0),
-    (2, 2, 0.5),
-    (2, 3, 0.25),
-    (2, 4, 0.0),
-    (3, 2, 0.0),
-    (3, 3, 0.25),
-    (3, 4, 0.5),
-]
-
-weights_points_to_square = [
-    (0, 0, 1),
-    (1, 0, 1),
-    (2, 2, 0.5),
-    (2, 3, 0.5),
-    (3, 0, 0.25),
-    (3, 1, 0.25),
-    (3, 2, 0.25),
-    (3, 3, 0.25),
-    # Point 4 is not included in the grid
-]
-
-weights_points_to_triangles = [
-    (0, 0, 0.5),
-    (0, 1, 0.5),
-    (2, 1, 1),
-    (3, 0, 0.5),
-    (3, 1, 0.5),
-]
-
-
-def check_equal_to_weights(
-    weights_tested: dict[str, Iterable[float | int]],
-    weights_ref: list[tuple[int, int, float]],
-):
-    # We will remove the weights at each encounter
-    missing_weights = weights_ref.copy()
-    for f, t, w in zip(
-        weights_tested["inv_indexes"],
-        weights_tested["output_indexes"],
-        weights_tested["weights"],
-    ):
-        w_tuple = (f, t, w)
-        if w_tuple not in missing_weights:
-            raise ValueError(f"Unexpected weight detected: {w_tuple}")
-        missing_weights.remove(w_tuple)
-
-    for missing_w_tuple in missing_weights:
-        # Check weights that were added but should not
-        if missing_w_tuple[2] != 0:
-            raise ValueError(f"Extra weights detected: {missing_w_tuple}")
-
-
-# test functions
-def test_simple_case():
-    check_equal_to_weights(
-        calculate_weights_mapping(squares, triangles), expected_weights
-    )
-
-
-def test_loop_inv():
-    check_equal_to_weights(
-        calculate_weights_mapping(squares, triangles, loop_over_inv_objects=True),
-        expected_weights,
-    )
-
-
-def test_simple_case_tri_to_square():
-    check_equal_to_weights(
-        calculate_weights_mapping(
-            triangles,
-            squares,
-        ),
-        weights_triangle_to_square,
-    )
-
-
-def test_loop_tri_to_square():
-    check_equal_to_weights(
-        calculate_weights_mapping(triangles, squares, loop_over_inv_objects=True),
-        weights_triangle_to_square,
-    )
-
-
-def test_points():
-    check_equal_to_weights(
-        calculate_weights_mapping(points, squares, loop_over_inv_objects=True),
-        weights_points_to_square,
-    )
-
-
-def test_points_on_triangles():
-    check_equal_to_weights(
-        calculate_weights_mapping(points, triangles, loop_over_inv_objects=True),
-        weights_points_to_triangles,
-    )
-
-
-def test_points_not_vect_raise_error():
-    with pytest.raises(TypeError):
-        check_equal_to_weights(
-            calculate_weights_mapping(points, squares, loop_over_inv_objects=False),
-            weights_points_to_square,
-        )
+"""Test the weights mapping function."""
+from __future__ import annotations
+
+import pytest
+import geopandas as gpd
+from typing import Any, Iterable
+from shapely.geometry import Point, Polygon
+import numpy as np
+import shapely
+from emiproc.grids import HexGrid, RegularGrid
+from emiproc.regrid import (
+    _intersection_weights,
+    _regular_cells_indexes,
+    calculate_weights_mapping,
+    get_point_weights_mapping,
+    get_weights_mapping,
+)
+
+
+# Create the geometetries of an inventory
+squares = gpd.GeoSeries(
+    [
+        Polygon(((0, 0), (0, 1), (1, 1), (1, 0))),
+        Polygon(((0, 1), (0, 2), (1, 2), (1, 1))),
+        Polygon(((1, 0), (1, 1), (2, 1), (2, 0))),
+        Polygon(((1, 1), (1, 2), (2, 2), (2, 1))),
+        Polygon(((2, 1), (2, 2), (3, 2), (3, 1))),
+    ]
+)
+triangles = gpd.GeoSeries(
+    [
+        Polygon(((0.5, 0.5), (0.5, 1.5), (1.5, 1.5))),
+        Polygon(((0.5, 0.5), (1.5, 0.5), (1.5, 1.5))),
+        Polygon(((2.5, 0.5), (1.5, 1.5), (1.5, 0.5))),
+        Polygon(((2.5, 0.5), (2.5, 1.5), (1.5, 1.5))),
+    ]
+)
+
+points = gpd.GeoSeries(
+    [
+        Point(0.75, 0.75),  # on the boundary of the triangles
+        Point(0.25, 0.25),
+        Point(1.2, 1),
+        Point(1, 1),  # Between all the squares
+        Point(-1, -1),  # Outside
+    ]
+)
+
+expected_weights = [
+    # This are the weights that should be expected
+    (0, 0, 1 / 8),
+    (1, 0, 1 / 4),
+    (2, 0, 0),
+    (3, 0, 1 / 8),
+    (4, 0, 0),
+    (0, 1, 1 / 8),
+    (1, 1, 0),
+    (2, 1, 1 / 4),
+    (3, 1, 1 / 8),
+    (4, 1, 0),
+    (0, 2, 0),
+    (1, 2, 0),
+    (2, 2, 1 / 4),
+    (3, 2, 1 / 8),
+    (4, 2, 0),
+    (0, 3, 0),
+    (1, 3, 0),
+    (2, 3, 0),
+    (3, 3, 1 / 8),
+    (4, 3, 1 / 4),
+]
+
+weights_triangle_to_square = [
+    (0, 0, 0.25),
+    (0, 1, 0.5),
+    (0, 2, 0.0),
+    (0, 3, 0.25),
+    (0, 4, 0.0),
+    (1, 0, 0.25),
+    (1, 1, 0.0),
+    (1, 2, 0.5),
+    (1, 3, 0.25),
+    (1, 4, 0.0),
+    (2, 2, 0.5),
+    (2, 3, 0.25),
+    (2, 4, 0.0),
+    (3, 2, 0.0),
+    (3, 3, 0.25),
+    (3, 4, 0.5),
+]
+
+weights_points_to_square = [
+    (0, 0, 1),
+    (1, 0, 1),
+    (2, 2, 0.5),
+    (2, 3, 0.5),
+    (3, 0, 0.25),
+    (3, 1, 0.25),
+    (3, 2, 0.25),
+    (3, 3, 0.25),
+    # Point 4 is not included in the grid
+]
+
+weights_points_to_triangles = [
+    (0, 0, 0.5),
+    (0, 1, 0.5),
+    (2, 1, 1),
+    (3, 0, 0.5),
+    (3, 1, 0.5),
+]
+
+
+def check_equal_to_weights(
+    weights_tested: dict[str, Iterable[float | int]],
+    weights_ref: list[tuple[int, int, float]],
+):
+    # We will remove the weights at each encounter
+    missing_weights = weights_ref.copy()
+    for f, t, w in zip(
+        weights_tested["inv_indexes"],
+        weights_tested["output_indexes"],
+        weights_tested["weights"],
+    ):
+        w_tuple = (f, t, w)
+        if w_tuple not in missing_weights:
+            raise ValueError(f"Unexpected weight detected: {w_tuple}")
+        missing_weights.remove(w_tuple)
+
+    for missing_w_tuple in missing_weights:
+        # Check weights that were added but should not
+        if missing_w_tuple[2] != 0:
+            raise ValueError(f"Extra weights detected: {missing_w_tuple}")
+
+
+# test functions
+def test_simple_case():
+    check_equal_to_weights(
+        calculate_weights_mapping(squares, triangles), expected_weights
+    )
+
+
+def test_loop_inv():
+    check_equal_to_weights(
+        calculate_weights_mapping(squares, triangles, loop_over_inv_objects=True),
+        expected_weights,
+    )
+
+
+def test_simple_case_tri_to_square():
+    check_equal_to_weights(
+        calculate_weights_mapping(
+            triangles,
+            squares,
+        ),
+        weights_triangle_to_square,
+    )
+
+
+def test_loop_tri_to_square():
+    check_equal_to_weights(
+        calculate_weights_mapping(triangles, squares, loop_over_inv_objects=True),
+        weights_triangle_to_square,
+    )
+
+
+def test_points():
+    check_equal_to_weights(
+        calculate_weights_mapping(points, squares, loop_over_inv_objects=True),
+        weights_points_to_square,
+    )
+
+
+def test_points_on_triangles():
+    check_equal_to_weights(
+        calculate_weights_mapping(points, triangles, loop_over_inv_objects=True),
+        weights_points_to_triangles,
+    )
+
+
+def test_points_not_vect_raise_error():
+    with pytest.raises(TypeError):
+        check_equal_to_weights(
+            calculate_weights_mapping(points, squares, loop_over_inv_objects=False),
+            weights_points_to_square,
+        )
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_partitioned_workers(executor):
+    check_equal_to_weights(
+        calculate_weights_mapping(
+            squares, triangles, n_workers=2, executor=executor
+        ),
+        expected_weights,
+    )
+    check_equal_to_weights(
+        calculate_weights_mapping(
+            points, squares, loop_over_inv_objects=True, n_workers=3
+        ),
+        weights_points_to_square,
+    )
+
+
+@pytest.mark.parametrize(
+    "grid",
+    [
+        RegularGrid(xmin=-1.3, xmax=2.1, ymin=40.1, ymax=41.7, nx=17, ny=8, crs=None),
+        HexGrid(xmin=0, ymin=0, nx=8, ny=6, spacing=1.0, crs=None),
+        HexGrid(
+            xmin=0, ymin=0, nx=8, ny=6, spacing=1.0, oriented_north=False, crs=None
+        ),
+    ],
+)
+def test_points_on_grid(grid):
+    cells = gpd.GeoSeries(grid.cells_as_polylist)
+    rng = np.random.default_rng(0)
+    minx, miny, maxx, maxy = cells.total_bounds
+    # Random points, some outside of the grid, and points on the edges and corners
+    corners = shapely.get_coordinates(cells.to_numpy())
+    x = np.concatenate([rng.uniform(minx - 1, maxx + 1, 500), corners[:, 0]])
+    y = np.concatenate([rng.uniform(miny - 1, maxy + 1, 500), corners[:, 1]])
+    points_grid = gpd.GeoSeries(shapely.points(x, y))
+
+    expected = _intersection_weights(cells, points_grid, loop_over_inv_objects=True)
+    order = np.lexsort((expected["inv_indexes"], expected["output_indexes"]))
+    expected = {key: value[order] for key, value in expected.items()}
+
+    for w_mapping in [
+        get_point_weights_mapping(points_grid, cells, grid),
+        calculate_weights_mapping(points_grid, cells, loop_over_inv_objects=True),
+    ]:
+        np.testing.assert_array_equal(w_mapping["inv_indexes"], expected["inv_indexes"])
+        np.testing.assert_array_equal(
+            w_mapping["output_indexes"], expected["output_indexes"]
+        )
+        np.testing.assert_allclose(w_mapping["weights"], expected["weights"])
+
+
+@pytest.mark.parametrize("loop_over_inv_objects", [False, True])
+def test_masked_weights_same_for_methods(loop_over_inv_objects):
+    mask = np.array([False, True, True, False])
+    mappings = [
+        get_weights_mapping(
+            None,
+            triangles,
+            squares,
+            loop_over_inv_objects=loop_over_inv_objects,
+            method=method,
+            mask=mask,
+            cache=False,
+        )
+        for method in ["old", "new"]
+    ]
+    old, new = [
+        sorted(
+            zip(
+                mapping["inv_indexes"],
+                mapping["output_indexes"],
+                np.round(mapping["weights"], 12),
+            )
+        )
+        for mapping in mappings
+    ]
+    assert old == new
+    # The indexes are the ones of the inventory shapes, not of the masked ones
+    assert set(mappings[0]["inv_indexes"]) == {1, 2}
+
+
+def test_regular_cells_indexes_from_grid(monkeypatch):
+    grid = RegularGrid(xmin=0, ymin=0, nx=30, ny=20, dx=0.1, dy=0.15)
+    shapes = grid.gdf.geometry
+    n_bounds = []
+    bounds = shapely.bounds
+
+    def counted_bounds(geoms):
+        n_bounds.append(len(geoms))
+        return bounds(geoms)
+
+    monkeypatch.setattr(shapely, "bounds", counted_bounds)
+    np.testing.assert_array_equal(
+        _regular_cells_indexes(shapes, grid), np.arange(len(grid))
+    )
+    # Only a sample of the cells is checked
+    assert n_bounds == [16]
+
+    # Other orders are found with the bounds of all the shapes
+    order = np.random.default_rng(0).permutation(len(grid))
+    np.testing.assert_array_equal(_regular_cells_indexes(shapes[order], grid), order)
+    np.testing.assert_array_equal(
+        _regular_cells_indexes(shapes[order[:50]], grid), order[:50]
+    )
+    assert _regular_cells_indexes(shapes.translate(xoff=0.05), grid) is None
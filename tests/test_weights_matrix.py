@@ -0,0 +1,152 @@
+"""Test the weights stored as sparse matrix."""
+
+import shutil
+
+import geopandas as gpd
+import numpy as np
+import pytest
+
+from emiproc import regrid
+from emiproc.grids import RegularGrid
+from emiproc.inventories import Inventory
+from emiproc.regrid import (
+    WeightsMatrix,
+    compose_weights,
+    get_weights_mapping,
+    get_weights_matrix,
+    remap_inventory,
+    weights_remap,
+)
+from emiproc.tests_utils import WEIGHTS_DIR
+from emiproc.tests_utils.test_grids import basic_serie, basic_serie_2, gpd_grid
+from emiproc.tests_utils.test_inventories import inv
+
+
+@pytest.fixture
+def w_mapping():
+    return get_weights_mapping(None, basic_serie, basic_serie_2, cache=False)
+
+
+def test_remap_same_as_mapping(w_mapping):
+    w_matrix = WeightsMatrix.from_mapping(
+        w_mapping, len(basic_serie), len(basic_serie_2)
+    )
+    values = np.arange(len(basic_serie), dtype=float)
+    expected = weights_remap(w_mapping, values, len(basic_serie_2))
+    np.testing.assert_allclose(
+        weights_remap(w_matrix, values, len(basic_serie_2)), expected
+    )
+
+    # Many columns at once
+    stacked = np.stack([values, 2 * values], axis=-1)
+    np.testing.assert_allclose(w_matrix.remap(stacked)[:, 1], 2 * expected)
+
+    # The adjoint
+    np.testing.assert_allclose(
+        w_matrix.adjoint(np.ones(len(basic_serie_2))),
+        w_matrix.matrix.toarray().sum(axis=0),
+    )
+
+    for key, array in w_matrix.to_mapping().items():
+        np.testing.assert_array_equal(array, w_mapping[key])
+
+
+def test_save_load_memmap(w_mapping):
+    w_matrix = WeightsMatrix.from_mapping(
+        w_mapping, len(basic_serie), len(basic_serie_2), metadata={"name": "test"}
+    )
+    path = WEIGHTS_DIR / "test_save_load_memmap.weights"
+    w_matrix.save(path)
+    loaded = WeightsMatrix.load(path)
+
+    assert isinstance(np.load(path / "data.npy", mmap_mode="r"), np.memmap)
+    # Memory mapped in read only mode
+    assert not loaded.matrix.data.flags.writeable
+    assert loaded.metadata == {"name": "test"}
+    assert loaded.target_shape == (len(basic_serie_2),)
+    values = np.random.default_rng(0).random(len(basic_serie))
+    np.testing.assert_allclose(loaded.remap(values), w_matrix.remap(values))
+
+
+def test_wrong_shapes(w_mapping):
+    with pytest.raises(ValueError):
+        WeightsMatrix(
+            WeightsMatrix.from_mapping(w_mapping, 5, 2).matrix, target_shape=(3, 7)
+        )
+
+
+def test_stale_weights_matrix_is_recomputed():
+    weights_path = WEIGHTS_DIR / "test_stale_weights_matrix"
+    get_weights_matrix(weights_path, basic_serie, basic_serie_2, cache=False)
+    assert (WEIGHTS_DIR / "test_stale_weights_matrix.weights").is_dir()
+
+    other_shapes = basic_serie_2.translate(xoff=0.5)
+    w_matrix = get_weights_matrix(weights_path, basic_serie, other_shapes, cache=False)
+    expected = get_weights_mapping(None, basic_serie, other_shapes, cache=False)
+    np.testing.assert_allclose(w_matrix.to_mapping()["weights"], expected["weights"])
+
+
+def test_weights_matrix_from_npz_file(monkeypatch):
+    weights_path = WEIGHTS_DIR / "test_weights_matrix_from_npz"
+    shutil.rmtree(weights_path.with_suffix(".weights"), ignore_errors=True)
+    w_mapping = get_weights_mapping(
+        weights_path, basic_serie, basic_serie_2, cache=False
+    )
+
+    # The weights are read from the .npz file, not calculated
+    def fail(*args, **kwargs):
+        raise AssertionError("The weights should not be calculated.")
+
+    monkeypatch.setattr(regrid, "calculate_weights_mapping", fail)
+    w_matrix = get_weights_matrix(weights_path, basic_serie, basic_serie_2, cache=False)
+    assert weights_path.with_suffix(".weights").is_dir()
+    for key in w_mapping:
+        np.testing.assert_allclose(w_matrix.to_mapping()[key], w_mapping[key])
+
+
+def test_remap_inventory_with_weights_file():
+    weights_file = WEIGHTS_DIR / "test_remap_inventory_weights_matrix"
+    remapped = remap_inventory(inv, gpd_grid, weights_file, cache=False)
+    # The second time the weights are loaded from the file
+    remapped_again = remap_inventory(inv, gpd_grid, weights_file, cache=False)
+    for col in inv._gdf_columns:
+        np.testing.assert_allclose(remapped.gdf[col], remapped_again.gdf[col])
+
+
+def test_compose_nested_grids():
+    grid_a = RegularGrid(xmin=0, xmax=4, ymin=0, ymax=4, nx=8, ny=8, crs=None)
+    grid_b = RegularGrid(xmin=0, xmax=4, ymin=0, ymax=4, nx=4, ny=4, crs=None)
+    grid_c = RegularGrid(xmin=-1, xmax=5, ymin=-1, ymax=5, nx=3, ny=3, crs=None)
+    cells = {g: gpd.GeoSeries(g.cells_as_polylist) for g in [grid_a, grid_b, grid_c]}
+
+    def weights(grid_from, grid_to):
+        w_mapping = get_weights_mapping(
+            None, cells[grid_from], cells[grid_to], cache=False
+        )
+        return WeightsMatrix.from_mapping(w_mapping, len(grid_from), len(grid_to))
+
+    composed = compose_weights(weights(grid_a, grid_b), weights(grid_b, grid_c))
+    direct = weights(grid_a, grid_c)
+    # Nested grids, so the composition is exact
+    np.testing.assert_allclose(composed.matrix.toarray(), direct.matrix.toarray())
+    assert composed.metadata["mass_error"]["max"] < 1e-12
+
+    rng = np.random.default_rng(0)
+    inv_a = Inventory.from_gdf(
+        gpd.GeoDataFrame(
+            {("a", "CO2"): rng.random(len(grid_a))}, geometry=cells[grid_a]
+        )
+    )
+    remapped = remap_inventory(inv_a, grid_c, cache=False)
+    remapped_composed = remap_inventory(inv_a, grid_c, weights=composed)
+    np.testing.assert_allclose(
+        remapped.gdf[("a", "CO2")], remapped_composed.gdf[("a", "CO2")]
+    )
+
+
+def test_compose_prune():
+    first = WeightsMatrix(np.array([[0.5, 1e-14], [0.5, 1.0]]))
+    second = WeightsMatrix(np.array([[1.0, 0.0], [0.0, 1.0]]))
+    composed = compose_weights(first, second, prune_threshold=1e-12)
+    assert composed.nnz == 3
+    assert composed.metadata["mass_error"]["pruned"] == pytest.approx(1e-14)
@@ -0,0 +1,116 @@
+"""Test the windows of inventories on regular grids."""
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from emiproc.grids import GeoPandasGrid, RegularGrid
+from emiproc.inventories import EmissionsArray, Inventory
+from emiproc.profiles.temporal_profiles import (
+    CompositeTemporalProfiles,
+    DayOfYearProfile,
+)
+
+grid = RegularGrid(xmin=0, ymin=0, nx=4, ny=3, dx=1, dy=1, crs=None)
+
+
+def make_inv() -> Inventory:
+    inv = Inventory.from_gdf(
+        gpd.GeoDataFrame(
+            {
+                ("adf", "CH4"): np.arange(len(grid), dtype=float),
+                ("adf", "CO2"): np.ones(len(grid)),
+            },
+            geometry=grid.gdf.geometry,
+        ),
+        gdfs={
+            "pnt": gpd.GeoDataFrame(
+                {"CO2": [1.0, 2.0, 3.0]},
+                geometry=gpd.points_from_xy([0.5, 2.5, 3.5], [0.5, 2.5, 1.5]),
+            )
+        },
+    )
+    inv.grid = grid
+    return inv
+
+
+def test_grid_window():
+    window, cells = grid.window((1.2, 0.5, 2.8, 1.0))
+    assert window.shape == (2, 1)
+    np.testing.assert_array_equal(cells, [3, 6])
+    assert all(
+        window.gdf.geometry.geom_equals_exact(
+            grid.gdf.geometry.iloc[cells].reset_index(drop=True), 0
+        )
+    )
+    # Cells touching the box are not in the window
+    _, cells = grid.window((1.0, 1.0, 2.0, 3.0))
+    np.testing.assert_array_equal(cells, [4, 5])
+    # The whole grid is the same grid
+    assert grid.window(grid.total_bounds)[0] == grid
+
+    with pytest.raises(ValueError):
+        grid.window((10, 10, 11, 11))
+
+
+def test_inventory_window():
+    inv = make_inv()
+    rng = np.random.default_rng(0)
+    profiles = CompositeTemporalProfiles.from_ratios(
+        rng.random((3, 365)), [DayOfYearProfile], rescale=True
+    )
+    indexes = xr.DataArray(
+        rng.integers(0, 3, size=(1, len(grid))),
+        dims=["category", "cell"],
+        coords={"category": ["adf"], "cell": np.arange(len(grid))},
+    )
+    inv.set_profiles(profiles, indexes)
+
+    windowed = inv.window((1.5, 0.2, 3.5, 1.8))
+    cells = [3, 4, 6, 7, 9, 10]
+    assert windowed.grid.shape == (3, 2)
+    np.testing.assert_array_equal(
+        windowed.gdf[("adf", "CH4")], inv.gdf[("adf", "CH4")].iloc[cells]
+    )
+    np.testing.assert_array_equal(
+        windowed.t_profiles_indexes.sel(category="adf"),
+        indexes.sel(category="adf", cell=cells),
+    )
+    np.testing.assert_array_equal(windowed.t_profiles_indexes["cell"], np.arange(6))
+    # Only the point source in the window is kept
+    np.testing.assert_array_equal(windowed.gdfs["pnt"]["CO2"], [3.0])
+
+
+def test_window_full_columns_is_a_view():
+    inv = make_inv()
+    windowed = inv.window((1.5, -1.0, 2.5, 4.0))
+    assert len(windowed.gdf) == 2 * grid.ny
+    assert np.shares_memory(
+        windowed.gdf[("adf", "CH4")].to_numpy(), inv.gdf[("adf", "CH4")].to_numpy()
+    )
+
+
+@pytest.mark.parametrize("bbox", [(1.5, -1.0, 2.5, 4.0), (1.5, 0.2, 3.5, 1.8)])
+def test_window_of_emissions_array(bbox):
+    inv = make_inv()
+    expected = inv.window(bbox)
+    inv.emissions = EmissionsArray.from_gdf(inv.gdf)
+
+    windowed = inv.window(bbox)
+    assert windowed._gdf is None
+    assert inv._gdf is None
+    pd.testing.assert_frame_equal(windowed.gdf, expected.gdf)
+    # Writing the window does not change the inventory
+    windowed.emissions[("adf", "CH4")] = 0.0
+    np.testing.assert_array_equal(
+        inv.emissions[("adf", "CH4")], np.arange(len(grid), dtype=float)
+    )
+
+
+def test_window_needs_regular_grid():
+    inv = make_inv()
+    inv.grid = GeoPandasGrid(inv.gdf)
+    with pytest.raises(TypeError):
+        inv.window((0, 0, 1, 1))